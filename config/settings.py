@@ -1,4 +1,5 @@
 import os
+from datetime import timedelta
 import django_heroku
 import dj_database_url
 from pathlib import Path
@@ -32,6 +33,7 @@ INSTALLED_APPS = [
     'django.contrib.sessions',
     'django.contrib.messages',
     'django.contrib.staticfiles',
+    'rest_framework',
     'accounts',
     'saloon',
 ]
@@ -43,6 +45,8 @@ MIDDLEWARE = [
     'django.middleware.common.CommonMiddleware',
     'django.middleware.csrf.CsrfViewMiddleware',
     'django.contrib.auth.middleware.AuthenticationMiddleware',
+    'saloon.middleware.SalonContextMiddleware',
+    'saloon.middleware.ReplicaRoutingMiddleware',
     'django.contrib.messages.middleware.MessageMiddleware',
     'django.middleware.clickjacking.XFrameOptionsMiddleware',
 ]
@@ -76,6 +80,52 @@ DATABASES = {
     'default': dj_database_url.config(default=os.getenv('DATABASE_URL'))
 }
 
+# Réplique en lecture optionnelle pour les listes et les rapports (voir saloon.routers)
+if os.getenv('DATABASE_REPLICA_URL'):
+    DATABASES['replica'] = dj_database_url.parse(os.getenv('DATABASE_REPLICA_URL'))
+    DATABASES['replica']['TEST'] = {'MIRROR': 'default'}
+
+DATABASE_ROUTERS = ['saloon.routers.ReplicaRouter']
+
+# Durée pendant laquelle un utilisateur qui vient d'écrire lit sur la base principale
+SALOON_REPLICA_STICKY_SECONDS = int(os.getenv('SALOON_REPLICA_STICKY_SECONDS', '10'))
+
+# Les listes lèvent QueryBudgetExceeded au-delà de leur max_queries (voir saloon.views.QueryBudgetMixin)
+SALOON_ENFORCE_QUERY_BUDGETS = os.getenv('SALOON_ENFORCE_QUERY_BUDGETS', str(DEBUG)) == 'True'
+
+
+# Cache
+# Les rapports des salons et leurs versions y sont gardés: le cache doit être partagé entre les workers,
+# sinon un worker sert des rapports périmés (vérifié par saloon.checks, avec manage.py check --deploy).
+# Hors DEBUG, la table du cache est créée par python manage.py createcachetable (phase release du Procfile).
+
+CACHES = {
+    'default': {
+        'BACKEND': os.getenv(
+            'CACHE_BACKEND',
+            'django.core.cache.backends.locmem.LocMemCache' if DEBUG else 'django.core.cache.backends.db.DatabaseCache',
+        ),
+        'LOCATION': os.getenv('CACHE_LOCATION', 'saloon-cache' if DEBUG else 'saloon_cache'),
+    }
+}
+
+SALOON_REPORT_CACHE_TIMEOUT = int(os.getenv('SALOON_REPORT_CACHE_TIMEOUT', '3600'))
+
+
+# API REST (/api/v1/) pour les caisses: authentification par jeton JWT, JSON uniquement
+
+REST_FRAMEWORK = {
+    'DEFAULT_AUTHENTICATION_CLASSES': ['rest_framework_simplejwt.authentication.JWTAuthentication'],
+    'DEFAULT_PERMISSION_CLASSES': ['rest_framework.permissions.IsAuthenticated'],
+    'DEFAULT_RENDERER_CLASSES': ['rest_framework.renderers.JSONRenderer'],
+    'DEFAULT_PARSER_CLASSES': ['rest_framework.parsers.JSONParser'],
+}
+
+SIMPLE_JWT = {
+    'ACCESS_TOKEN_LIFETIME': timedelta(minutes=int(os.getenv('JWT_ACCESS_MINUTES', '15'))),
+    'REFRESH_TOKEN_LIFETIME': timedelta(days=int(os.getenv('JWT_REFRESH_DAYS', '7'))),
+}
+
 
 # Password validation
 AUTH_PASSWORD_VALIDATORS = [
@@ -21,4 +21,5 @@ urlpatterns = [
     path('admin/', admin.site.urls),
     path('', include('accounts.urls')),
     path('saloon/', include('saloon.urls')),
+    path('api/v1/', include('saloon.api_urls')),
 ]
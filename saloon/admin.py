@@ -1,34 +1,39 @@
 from django.contrib import admin
+from django.db.models import Min, Max
+from django.utils import timezone
+from datetime import timedelta
 from django.utils.translation import gettext_lazy as _
 from unfold.admin import ModelAdmin
 from .models import (
     Salon, BarberType, Barber, Client, Commission, Currency, CashRegister,
-    PaymentType, Payment, Transaction, Hairstyle, HairstyleTariffHistory,
-    Shave, Item, ItemUsed, ItemPurchase
+    PaymentType, Payment, PayrollRun, Transaction, Hairstyle, HairstyleTariffHistory,
+    Shave, CommissionAccrual, Item, ItemUsed, ItemPurchase, RegisterClose
 )
 from .services import (
-    ShaveService, BarberService, CashRegisterService, InventoryService, FinancialService
+    ShaveService, BarberService, CashRegisterService, InventoryService, FinancialService, DailyStatsService,
+    deferred_balance_updates, as_day
 )
+from .middleware import get_salon_context
 
 class SalonAdminMixin:
     def get_form(self, request, obj=None, **kwargs):
         form = super().get_form(request, obj, **kwargs)
         if 'salon' in form.base_fields:
-            qs = Salon.objects.filter(owner=request.user)
+            qs = get_salon_context(request).salons
             form.base_fields['salon'].queryset = qs
             if not obj:  # Création d'un nouvel objet
-                form.base_fields['salon'].initial = qs.first()
+                form.base_fields['salon'].initial = get_salon_context(request).default_salon
             form.base_fields['salon'].widget.attrs['readonly'] = True
             form.base_fields['salon'].required = False
         return form
 
     def save_model(self, request, obj, form, change):
         if hasattr(obj, 'salon_id') and not obj.salon_id:  # Création d'un nouvel objet avec champ salon
-            obj.salon = Salon.objects.filter(owner=request.user).first()
+            obj.salon = get_salon_context(request).default_salon
         elif hasattr(obj, 'barber') and hasattr(obj.barber, 'salon'):  # Pour Commission
-            obj.barber.salon = Salon.objects.filter(owner=request.user).first()
+            obj.barber.salon = get_salon_context(request).default_salon
         elif hasattr(obj, 'hairstyle') and hasattr(obj.hairstyle, 'salon'):  # Pour HairstyleTariffHistory
-            obj.hairstyle.salon = Salon.objects.filter(owner=request.user).first()
+            obj.hairstyle.salon = get_salon_context(request).default_salon
         super().save_model(request, obj, form, change)
 
     def get_queryset(self, request):
@@ -45,7 +50,7 @@ class SalonAdminMixin:
     
     def formfield_for_foreignkey(self, db_field, request, **kwargs):
         if db_field.name == "salon":
-            kwargs["queryset"] = Salon.objects.filter(owner=request.user)
+            kwargs["queryset"] = get_salon_context(request).salons
         elif db_field.name == "barber":
             kwargs["queryset"] = Barber.objects.filter(salon__owner=request.user)
         elif db_field.name == "hairstyle":
@@ -56,6 +61,22 @@ class SalonAdminMixin:
             kwargs["queryset"] = CashRegister.objects.filter(salon__owner=request.user)
         return super().formfield_for_foreignkey(db_field, request, **kwargs)
 
+class DeferredBalanceAdminMixin:
+    # Inlines, bulk deletes and actions touch many rows: update each register once, after commit
+    def changeform_view(self, request, object_id=None, form_url='', extra_context=None):
+        with deferred_balance_updates():
+            return super().changeform_view(request, object_id, form_url, extra_context)
+
+    def changelist_view(self, request, extra_context=None):
+        if request.method != 'POST':
+            return super().changelist_view(request, extra_context)
+        with deferred_balance_updates():
+            return super().changelist_view(request, extra_context)
+
+    def delete_view(self, request, object_id, extra_context=None):
+        with deferred_balance_updates():
+            return super().delete_view(request, object_id, extra_context)
+
 class AutoCalculateDefaultCurrencyMixin:
     def get_readonly_fields(self, request, obj=None):
         readonly_fields = super().get_readonly_fields(request, obj)
@@ -73,17 +94,18 @@ class SalonAdmin(ModelAdmin):
     list_display = ('name', 'owner', 'is_active', 'total_revenue', 'total_profit')
     list_filter = ('is_active',)
     search_fields = ('name', 'owner__email')
+    list_select_related = ('owner',)
     readonly_fields = ('owner',)
 
     def get_fieldsets(self, request, obj=None):
         fieldsets = super().get_fieldsets(request, obj)
         if obj is None:  # Création d'un nouveau salon
             return (
-                (None, {'fields': ('name', 'description', 'address', 'phone', 'email', 'is_active')}),
+                (None, {'fields': ('name', 'description', 'address', 'phone', 'email', 'timezone', 'is_active')}),
             )
         else:  # Modification d'un salon existant
             return (
-                (None, {'fields': ('name', 'description', 'address', 'phone', 'email', 'is_active', 'owner')}),
+                (None, {'fields': ('name', 'description', 'address', 'phone', 'email', 'timezone', 'is_active', 'owner')}),
             )
 
     def save_model(self, request, obj, form, change):
@@ -96,13 +118,19 @@ class SalonAdmin(ModelAdmin):
             return self.readonly_fields + ('owner',)
         return self.readonly_fields
 
+    def get_queryset(self, request):
+        # The totals of every listed salon come from the same query as the salons
+        return FinancialService.annotate_summary(super().get_queryset(request))
+
     def total_revenue(self, obj):
-        return FinancialService.get_financial_summary(obj)['total_revenue']
+        return FinancialService.format_decimal(obj.total_revenue_value)
     total_revenue.short_description = _("Total Revenue")
+    total_revenue.admin_order_field = 'total_revenue_value'
 
     def total_profit(self, obj):
-        return FinancialService.get_financial_summary(obj)['profit']
+        return FinancialService.format_decimal(obj.total_profit_value)
     total_profit.short_description = _("Total Profit")
+    total_profit.admin_order_field = 'total_profit_value'
 
 @admin.register(BarberType)
 class BarberTypeAdmin(SalonAdminMixin, ModelAdmin):
@@ -117,7 +145,7 @@ class BarberTypeAdmin(SalonAdminMixin, ModelAdmin):
     
     def save_model(self, request, obj, form, change):
         if not change:  # Création d'un nouveau type de barbe
-            obj.salon = Salon.objects.filter(owner=request.user).first()
+            obj.salon = get_salon_context(request).default_salon
         super().save_model(request, obj, form, change)
 
 @admin.register(Barber)
@@ -125,22 +153,22 @@ class BarberAdmin(SalonAdminMixin, ModelAdmin):
     list_display = ('get_full_name', 'salon', 'barber_type', 'is_active', 'commission_balance')
     list_filter = ('salon', 'is_active', 'barber_type')
     search_fields = ('user__email', 'user__first_name', 'user__last_name')
-    list_select_related = ('user', 'salon', 'barber_type')
+    list_select_related = ('user', 'salon', 'barber_type__salon')
 
     def get_form(self, request, obj=None, **kwargs):
         form = super().get_form(request, obj, **kwargs)
         if not obj:  # Création d'un nouveau barbe
-            form.base_fields['salon'].initial = Salon.objects.filter(owner=request.user).first()
+            form.base_fields['salon'].initial = get_salon_context(request).default_salon
         return form
 
     def formfield_for_foreignkey(self, db_field, request, **kwargs):
         if db_field.name == "salon":
-            kwargs["queryset"] = Salon.objects.filter(owner=request.user)
+            kwargs["queryset"] = get_salon_context(request).salons
         elif db_field.name == "barber_type":
             if request.user.is_superuser:
                 pass  # Don't filter the queryset
             else:
-                salon = Salon.objects.filter(owner=request.user).first()
+                salon = get_salon_context(request).default_salon
                 if salon:
                     kwargs["queryset"] = BarberType.objects.filter(salon=salon)
                 else:
@@ -149,14 +177,24 @@ class BarberAdmin(SalonAdminMixin, ModelAdmin):
     
     def save_model(self, request, obj, form, change):
         if not obj.salon:
-            obj.salon = Salon.objects.filter(owner=request.user).first()
+            obj.salon = get_salon_context(request).default_salon
         super().save_model(request, obj, form, change)
 
     def get_full_name(self, obj):
         return obj.user.get_full_name()
     get_full_name.short_description = _("Full Name")
 
+    def get_changelist_instance(self, request):
+        # The balances of the whole page are computed together rather than per row
+        changelist = super().get_changelist_instance(request)
+        balances = BarberService.calculate_balances(changelist.result_list)
+        for barber in changelist.result_list:
+            barber.commission_balance_value = balances[barber.pk]
+        return changelist
+
     def commission_balance(self, obj):
+        if hasattr(obj, 'commission_balance_value'):
+            return obj.commission_balance_value
         return BarberService.calculate_balance(obj)
     commission_balance.short_description = _("Commission Balance")
 
@@ -181,6 +219,19 @@ class CommissionAdmin(SalonAdminMixin, ModelAdmin):
     def get_queryset(self, request):
         return super().get_queryset(request)
 
+@admin.register(CommissionAccrual)
+class CommissionAccrualAdmin(SalonAdminMixin, ModelAdmin):
+    list_display = ('barber', 'shave', 'date', 'percentage', 'fixed_amount', 'amount')
+    list_filter = ('salon', 'barber', 'date')
+    search_fields = ('barber__user__email', 'salon__name')
+    list_select_related = ('barber__user', 'barber__salon', 'shave__barber__user', 'shave__barber__salon', 'shave__hairstyle', 'salon')
+
+    def has_add_permission(self, request):
+        return False
+
+    def has_change_permission(self, request, obj=None):
+        return False
+
 @admin.register(Currency)
 class CurrencyAdmin(SalonAdminMixin, ModelAdmin):
     list_display = ('code', 'name', 'salon', 'is_default')
@@ -189,20 +240,41 @@ class CurrencyAdmin(SalonAdminMixin, ModelAdmin):
 
 @admin.register(CashRegister)
 class CashRegisterAdmin(SalonAdminMixin, ModelAdmin):
-    list_display = ('name', 'salon', 'balance_profit', 'balance_cash')
+    # Balances are kept up to date on every write; the reconcile_stale_balances command checks them in the background
+    list_display = ('name', 'salon', 'balance_profit', 'balance_cash', 'reconciled_at')
     list_filter = ('salon',)
     search_fields = ('name', 'salon__name')
-    readonly_fields = ('balance_profit', 'balance_cash')
-
-    def get_queryset(self, request):
-        queryset = super().get_queryset(request)
-        for cash_register in queryset:
-            CashRegisterService.update_balance(cash_register)
-        return queryset
-
-    def save_model(self, request, obj, form, change):
-        super().save_model(request, obj, form, change)
-        CashRegisterService.update_balance(obj)
+    readonly_fields = ('balance_profit', 'balance_cash', 'reconciled_at')
+    list_select_related = ('salon',)
+
+    actions = ['close_day', 'force_reconcile']
+
+    @admin.action(description=_("Recompute the balances of selected cash registers"))
+    def force_reconcile(self, request, queryset):
+        reconciled = CashRegisterService.recompute_many(queryset)
+        self.message_user(request, _(f"{len(reconciled)} cash registers were reconciled."))
+
+    @admin.action(description=_("Close the past days (Z-reports) of selected cash registers"))
+    def close_day(self, request, queryset):
+        # Up to yesterday in each salon's time zone: the current day is still open
+        closed = sum(
+            len(CashRegisterService.close_days(cash_register, CashRegisterService.get_last_closable_day(cash_register)))
+            for cash_register in queryset.select_related('salon')
+        )
+        self.message_user(request, _(f"{closed} days were closed."))
+
+@admin.register(RegisterClose)
+class RegisterCloseAdmin(SalonAdminMixin, ModelAdmin):
+    list_display = ('cashregister', 'date', 'income', 'expense', 'payments', 'purchases', 'items_cost', 'balance_cash', 'balance_profit')
+    list_filter = ('salon', 'cashregister', 'date')
+    search_fields = ('cashregister__name', 'salon__name')
+    list_select_related = ('cashregister', 'salon')
+
+    def has_add_permission(self, request):
+        return False
+
+    def has_change_permission(self, request, obj=None):
+        return False
 
 @admin.register(PaymentType)
 class PaymentTypeAdmin(SalonAdminMixin, ModelAdmin):
@@ -211,14 +283,26 @@ class PaymentTypeAdmin(SalonAdminMixin, ModelAdmin):
     search_fields = ('name', 'salon__name')
 
 @admin.register(Payment)
-class PaymentAdmin(SalonAdminMixin, AutoCalculateDefaultCurrencyMixin, ModelAdmin):
+class PaymentAdmin(DeferredBalanceAdminMixin, SalonAdminMixin, AutoCalculateDefaultCurrencyMixin, ModelAdmin):
     list_display = ('barber', 'amount', 'currency', 'payment_type', 'date_payment', 'amount_in_default_currency')
     list_filter = ('salon', 'payment_type', 'currency', 'date_payment')
     search_fields = ('barber__user__email', 'salon__name')
     list_select_related = ('barber', 'currency', 'payment_type', 'salon')
 
+@admin.register(PayrollRun)
+class PayrollRunAdmin(SalonAdminMixin, ModelAdmin):
+    list_display = ('salon', 'start_date', 'end_date', 'date_payment', 'cashregister', 'total', 'created_by')
+    list_filter = ('salon', 'date_payment')
+    list_select_related = ('salon', 'cashregister__salon', 'created_by')
+
+    def has_add_permission(self, request):
+        return False
+
+    def has_change_permission(self, request, obj=None):
+        return False
+
 @admin.register(Transaction)
-class TransactionAdmin(SalonAdminMixin, AutoCalculateDefaultCurrencyMixin, ModelAdmin):
+class TransactionAdmin(DeferredBalanceAdminMixin, SalonAdminMixin, AutoCalculateDefaultCurrencyMixin, ModelAdmin):
     list_display = ('trans_name', 'amount', 'currency', 'trans_type', 'date_trans', 'amount_in_default_currency')
     list_filter = ('salon', 'trans_type', 'currency', 'date_trans')
     search_fields = ('trans_name', 'salon__name')
@@ -251,7 +335,7 @@ class ItemUsedInline(admin.TabularInline):
     extra = 1
 
 @admin.register(Shave)
-class ShaveAdmin(SalonAdminMixin, AutoCalculateDefaultCurrencyMixin, ModelAdmin):
+class ShaveAdmin(DeferredBalanceAdminMixin, SalonAdminMixin, AutoCalculateDefaultCurrencyMixin, ModelAdmin):
     list_display = ('barber', 'hairstyle', 'amount', 'currency', 'status', 'date_shave', 'amount_in_default_currency')
     list_filter = ('salon', 'status', 'currency', 'date_shave')
     search_fields = ('barber__user__email', 'hairstyle__name', 'salon__name')
@@ -262,29 +346,35 @@ class ShaveAdmin(SalonAdminMixin, AutoCalculateDefaultCurrencyMixin, ModelAdmin)
 
     @admin.action(description=_("Mark selected shaves as completed"))
     def mark_as_completed(self, request, queryset):
+        cash_register_ids = set(queryset.values_list('cashregister_id', flat=True))
+        span = queryset.aggregate(first=Min('date_shave'), last=Max('date_shave'))
+        salon_ids = set(queryset.values_list('salon_id', flat=True))
+        shave_ids = list(queryset.values_list('pk', flat=True))
         updated = queryset.update(status=Shave.Status.COMPLETED)
+        # update() bypasses the signals, so the registers, commissions and daily stats are updated explicitly.
+        # A day on each side covers salons whose time zone is ahead or behind
+        CashRegisterService.mark_for_reconcile(cash_register_ids, as_day(span['first']) - timedelta(days=1) if span['first'] else None)
+        BarberService.accrue_shaves(Shave.objects.filter(pk__in=shave_ids))
+        if span['first']:
+            DailyStatsService.rebuild(salon_ids, as_day(span['first']) - timedelta(days=1), as_day(span['last']) + timedelta(days=1))
         self.message_user(request, _(f"{updated} shaves were successfully marked as completed."))
 
 @admin.register(Item)
 class ItemAdmin(SalonAdminMixin, AutoCalculateDefaultCurrencyMixin, ModelAdmin):
-    list_display = ('name', 'salon', 'price', 'currency', 'current_stock', 'amount_in_default_currency')
+    list_display = ('name', 'salon', 'price', 'currency', 'current_stock', 'amount_in_default_currency', 'average_cost')
     list_filter = ('salon', 'currency')
     search_fields = ('name', 'salon__name')
     list_select_related = ('salon', 'currency')
 
 @admin.register(ItemUsed)
-class ItemUsedAdmin(SalonAdminMixin, ModelAdmin):
-    list_display = ('item', 'shave', 'barber', 'quantity', 'get_amount_in_default_currency')
+class ItemUsedAdmin(DeferredBalanceAdminMixin, SalonAdminMixin, ModelAdmin):
+    list_display = ('item', 'shave', 'barber', 'quantity', 'cost_in_default_currency')
     list_filter = ('salon', 'item')
     search_fields = ('item__name', 'shave__barber__user__email', 'salon__name')
     list_select_related = ('item', 'shave', 'barber', 'salon')
 
-    def get_amount_in_default_currency(self, obj):
-        return obj.get_amount_in_default_currency()
-    get_amount_in_default_currency.short_description = _("Amount in default currency")
-
 @admin.register(ItemPurchase)
-class ItemPurchaseAdmin(SalonAdminMixin, ModelAdmin):
+class ItemPurchaseAdmin(DeferredBalanceAdminMixin, SalonAdminMixin, ModelAdmin):
     list_display = ('item', 'quantity', 'purchase_price', 'currency', 'purchase_date', 'purchase_price_in_default_currency')
     list_filter = ('salon', 'currency', 'item', 'purchase_date')
     search_fields = ('item__name', 'salon__name', 'supplier')
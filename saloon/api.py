@@ -0,0 +1,93 @@
+# api.py
+
+from django.db.models import ProtectedError
+from rest_framework import serializers, viewsets
+from rest_framework.pagination import CursorPagination
+from .middleware import get_salon_context
+from .services import InventoryService
+from .serializers import (
+    requested_fields, SalonSerializer, ShaveSerializer, ClientSerializer, ItemSerializer, TransactionSerializer,
+    PaymentSerializer, CashRegisterSerializer,
+)
+
+class SalonCursorPagination(CursorPagination):
+    # Opaque ?cursor= pages on the view's ordering: every page is an index seek, however deep
+    page_size = 50
+    page_size_query_param = 'page_size'
+    max_page_size = 200
+
+    def get_ordering(self, request, queryset, view):
+        return view.ordering
+
+class SalonViewSet(viewsets.ReadOnlyModelViewSet):
+    # The salons of the user, for clients to pick the one they work in
+    serializer_class = SalonSerializer
+    pagination_class = SalonCursorPagination
+    ordering = ('name', 'id')
+
+    def get_queryset(self):
+        return get_salon_context(self.request).salons
+
+class SalonScopedViewSet(viewsets.ModelViewSet):
+    """
+    CRUD on the rows of one salon of the user (/salons/<salon_id>/...). The queryset joins the relations
+    of the fields the serializer will output, ?fields= included.
+    """
+    pagination_class = SalonCursorPagination
+    ordering = ('-id',)
+
+    def initial(self, request, *args, **kwargs):
+        super().initial(request, *args, **kwargs)
+        # Raises Http404, answered as a 404, when the salon is not the user's
+        get_salon_context(request).get_salon(self.kwargs['salon_id'])
+
+    def get_queryset(self):
+        serializer_class = self.get_serializer_class()
+        fields = requested_fields(self.request)
+        queryset = serializer_class.Meta.model._default_manager.filter(salon_id=self.kwargs['salon_id'])
+        select_related = serializer_class.get_select_related(fields)
+        if select_related:
+            queryset = queryset.select_related(*select_related)
+        prefetch_related = serializer_class.get_prefetch_related(fields)
+        if prefetch_related:
+            queryset = queryset.prefetch_related(*prefetch_related)
+        return queryset
+
+    def get_serializer_context(self):
+        return {**super().get_serializer_context(), 'salon_id': self.kwargs['salon_id']}
+
+    def perform_create(self, serializer):
+        serializer.save(salon=get_salon_context(self.request).get_salon(self.kwargs['salon_id']))
+
+    def perform_destroy(self, instance):
+        try:
+            instance.delete()
+        except ProtectedError:
+            raise serializers.ValidationError(f"This {instance._meta.verbose_name} is still used and cannot be deleted.")
+
+class ShaveViewSet(SalonScopedViewSet):
+    serializer_class = ShaveSerializer
+    ordering = ('-date_shave', '-id')
+
+class ClientViewSet(SalonScopedViewSet):
+    serializer_class = ClientSerializer
+    ordering = ('name', 'id')
+
+class ItemViewSet(SalonScopedViewSet):
+    serializer_class = ItemSerializer
+    ordering = ('name', 'id')
+
+    def get_queryset(self):
+        return InventoryService.annotate_valuation(super().get_queryset())
+
+class TransactionViewSet(SalonScopedViewSet):
+    serializer_class = TransactionSerializer
+    ordering = ('-date_trans', '-id')
+
+class PaymentViewSet(SalonScopedViewSet):
+    serializer_class = PaymentSerializer
+    ordering = ('-date_payment', '-id')
+
+class CashRegisterViewSet(SalonScopedViewSet):
+    serializer_class = CashRegisterSerializer
+    ordering = ('name', 'id')
@@ -0,0 +1,21 @@
+from django.urls import path, include
+from rest_framework.routers import SimpleRouter
+from rest_framework_simplejwt.views import TokenObtainPairView, TokenRefreshView
+from . import api
+
+app_name = 'api_v1'
+
+router = SimpleRouter()
+router.register('shaves', api.ShaveViewSet, basename='shave')
+router.register('clients', api.ClientViewSet, basename='client')
+router.register('items', api.ItemViewSet, basename='item')
+router.register('transactions', api.TransactionViewSet, basename='transaction')
+router.register('payments', api.PaymentViewSet, basename='payment')
+router.register('cashregisters', api.CashRegisterViewSet, basename='cashregister')
+
+urlpatterns = [
+    path('auth/token/', TokenObtainPairView.as_view(), name='token_obtain_pair'),
+    path('auth/token/refresh/', TokenRefreshView.as_view(), name='token_refresh'),
+    path('salons/', api.SalonViewSet.as_view({'get': 'list'}), name='salon-list'),
+    path('salons/<int:salon_id>/', include(router.urls)),
+]
@@ -6,4 +6,5 @@ class SaloonConfig(AppConfig):
     name = 'saloon'
 
     def ready(self):
+        import saloon.checks
         import saloon.signals
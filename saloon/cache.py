@@ -0,0 +1,142 @@
+# cache.py
+
+import hashlib
+import secrets
+import time
+from functools import wraps
+from django.conf import settings
+from django.core.cache import cache
+from django.db import transaction
+from .routers import replica_reads_enabled
+
+LOCK_TIMEOUT = 30
+LOCK_POLL_INTERVAL = 0.05
+
+_MISSING = object()
+_reports = []
+
+def get_timeout():
+    return getattr(settings, 'SALOON_REPORT_CACHE_TIMEOUT', 3600)
+
+def version_key(salon_id):
+    return f"saloon:version:{salon_id}"
+
+def owner_version_key(user_id):
+    return f"saloon:owner-version:{user_id}"
+
+def new_counter():
+    # A lost or evicted counter restarts at a random value, never at one it may already have had
+    return secrets.randbits(62)
+
+def read_counter(key):
+    version = cache.get(key)
+    if version is None:
+        initial = new_counter()
+        cache.add(key, initial, None)
+        version = cache.get(key, initial)
+    return version
+
+def incr_counter(key):
+    try:
+        cache.incr(key)
+    except ValueError:
+        cache.add(key, new_counter(), None)
+
+def get_version(salon_id):
+    return read_counter(version_key(salon_id))
+
+def incr_version(salon_id):
+    incr_counter(version_key(salon_id))
+
+def bump_version(salon_id):
+    # Bumped now for reads inside this transaction, and again on commit so that a report computed
+    # from the data committed in between is not kept under the new version
+    if salon_id is None:
+        return
+    incr_version(salon_id)
+    transaction.on_commit(lambda: incr_version(salon_id))
+
+def get_owner_version(user_id):
+    # Version of the list of salons of a user, kept with the copy of that list in the session
+    return read_counter(owner_version_key(user_id))
+
+def bump_owner_version(user_id):
+    if user_id is None:
+        return
+    incr_counter(owner_version_key(user_id))
+    transaction.on_commit(lambda: incr_counter(owner_version_key(user_id)))
+
+def counter_key(name, kind):
+    return f"saloon:cache:{name}:{kind}"
+
+def count(name, kind):
+    try:
+        cache.incr(counter_key(name, kind))
+    except ValueError:
+        if not cache.add(counter_key(name, kind), 1, None):
+            cache.incr(counter_key(name, kind))
+
+def get_stats():
+    stats = {}
+    for name in _reports:
+        hits = cache.get(counter_key(name, 'hits'), 0)
+        misses = cache.get(counter_key(name, 'misses'), 0)
+        stats[name] = {
+            'hits': hits,
+            'misses': misses,
+            'ratio': hits / (hits + misses) if hits + misses else None,
+        }
+    return stats
+
+def reset_stats():
+    cache.delete_many([counter_key(name, kind) for name in _reports for kind in ('hits', 'misses')])
+
+def report_key(salon_id, name, args, kwargs):
+    # Dates, decimals and model instances all have a stable repr; hashed to keep memcached-safe keys
+    arguments = repr((args, sorted(kwargs.items()))).encode()
+    return f"saloon:report:{salon_id}:{get_version(salon_id)}:{name}:{hashlib.md5(arguments).hexdigest()}"
+
+def get_or_compute(key, name, compute, timeout=None):
+    # Single flight: the worker that takes the lock computes, the others wait for its result
+    value = cache.get(key, _MISSING)
+    if value is not _MISSING:
+        count(name, 'hits')
+        return value
+    count(name, 'misses')
+    if replica_reads_enabled():
+        # A lagging replica could store old figures under the current version
+        return compute()
+
+    lock_key = f"{key}:lock"
+    locked = cache.add(lock_key, 1, LOCK_TIMEOUT)
+    if not locked:
+        deadline = time.monotonic() + LOCK_TIMEOUT
+        while time.monotonic() < deadline:
+            time.sleep(LOCK_POLL_INTERVAL)
+            value = cache.get(key, _MISSING)
+            if value is not _MISSING:
+                return value
+            if cache.get(lock_key) is None:
+                break
+    try:
+        value = compute()
+        cache.set(key, value, get_timeout() if timeout is None else timeout)
+    finally:
+        if locked:
+            cache.delete(lock_key)
+    return value
+
+def cached_report(timeout=None):
+    # For service functions taking the salon (or its id) first
+    def decorator(func):
+        name = func.__qualname__
+        _reports.append(name)
+
+        @wraps(func)
+        def wrapper(salon, *args, **kwargs):
+            salon_id = getattr(salon, 'pk', salon)
+            key = report_key(salon_id, name, args, kwargs)
+            return get_or_compute(key, name, lambda: func(salon, *args, **kwargs), timeout)
+        wrapper.uncached = func
+        return wrapper
+    return decorator
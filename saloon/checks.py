@@ -0,0 +1,21 @@
+# checks.py
+
+from django.conf import settings
+from django.core.checks import Error, register, Tags
+
+# Kept in the memory of each process: a version bumped by one worker never reaches the others
+PER_PROCESS_CACHES = ('django.core.cache.backends.locmem.LocMemCache',)
+
+# A deployment check (manage.py check --deploy, run by the release phase): the test runner turns DEBUG off
+# before its own checks, so a DEBUG condition would stop the test suites of local, per-process setups
+@register(Tags.caches, deploy=True)
+def check_shared_cache(app_configs, **kwargs):
+    backend = settings.CACHES.get('default', {}).get('BACKEND')
+    if backend not in PER_PROCESS_CACHES:
+        return []
+    return [Error(
+        f"The default cache ({backend}) is not shared between processes.",
+        hint="The salon report versions live in the cache: set CACHE_BACKEND to a shared backend "
+             "(DatabaseCache, Redis or Memcached).",
+        id='saloon.E001',
+    )]
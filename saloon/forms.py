@@ -1,7 +1,7 @@
 from django import forms
 from .models import (
     Salon, BarberType, Barber, Client, Commission, Currency, CashRegister,
-    PaymentType, Payment, Transaction, Hairstyle, HairstyleTariffHistory,
+    PaymentType, Payment, PayrollRun, Transaction, Hairstyle, HairstyleTariffHistory,
     Shave, Item, ItemUsed, ItemPurchase
 )
 
@@ -16,7 +16,7 @@ class TailwindFormMixin:
 class SalonForm(TailwindFormMixin, forms.ModelForm):
     class Meta:
         model = Salon
-        fields = ['name', 'description', 'address', 'phone', 'email', 'owner', 'is_active']
+        fields = ['name', 'description', 'address', 'phone', 'email', 'timezone', 'owner', 'is_active']
 
 class BarberTypeForm(TailwindFormMixin, forms.ModelForm):
     class Meta:
@@ -53,7 +53,7 @@ class CurrencyForm(TailwindFormMixin, forms.ModelForm):
 class CashRegisterForm(TailwindFormMixin, forms.ModelForm):
     class Meta:
         model = CashRegister
-        fields = ['name', 'balance_profit', 'balance_cash', 'currency', 'salon']
+        fields = ['name', 'currency', 'salon']
 
 class PaymentTypeForm(TailwindFormMixin, forms.ModelForm):
     class Meta:
@@ -70,6 +70,27 @@ class PaymentForm(TailwindFormMixin, forms.ModelForm):
             'date_payment': forms.DateInput(attrs={'type': 'date'}),
         }
 
+class PayrollRunForm(TailwindFormMixin, forms.ModelForm):
+    def __init__(self, *args, salon=None, **kwargs):
+        super().__init__(*args, **kwargs)
+        if salon is not None:
+            self.fields['cashregister'].queryset = CashRegister.objects.filter(salon=salon)
+            self.fields['payment_type'].queryset = PaymentType.objects.filter(salon=salon, is_active=True)
+
+    class Meta:
+        model = PayrollRun
+        fields = ['cashregister', 'payment_type', 'start_date', 'end_date', 'date_payment']
+        widgets = {
+            'start_date': forms.DateInput(attrs={'type': 'date'}),
+            'end_date': forms.DateInput(attrs={'type': 'date'}),
+            'date_payment': forms.DateInput(attrs={'type': 'date'}),
+        }
+
+class CsvImportForm(TailwindFormMixin, forms.Form):
+    kind = forms.ChoiceField(label="Content", choices=[('shaves', "Shaves"), ('transactions', "Transactions")])
+    file = forms.FileField(label="CSV file")
+    dry_run = forms.BooleanField(label="Only validate", required=False)
+
 class TransactionForm(TailwindFormMixin, forms.ModelForm):
     class Meta:
         model = Transaction
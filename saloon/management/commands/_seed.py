@@ -0,0 +1,59 @@
+# Throwaway salon data for the benchmark commands (the leading underscore keeps this out of manage.py)
+
+import uuid
+from datetime import timedelta
+from decimal import Decimal
+from types import SimpleNamespace
+
+from django.contrib.auth import get_user_model
+from django.utils import timezone
+
+from saloon.models import Salon, BarberType, Barber, Currency, CashRegister, Hairstyle, Shave
+
+
+def create_salon_fixture(label):
+    suffix = uuid.uuid4().hex[:8]
+    User = get_user_model()
+    owner = User.objects.create_user(email=f'{label}-owner-{suffix}@example.com', password=uuid.uuid4().hex)
+    salon = Salon.objects.create(name=f'{label}-{suffix}', owner=owner)
+    currency = Currency.objects.create(code='USD', name='US Dollar', is_default=True, salon=salon)
+    barber_type = BarberType.objects.create(name='Barber', salon=salon)
+    barber_user = User.objects.create_user(email=f'{label}-barber-{suffix}@example.com', password=uuid.uuid4().hex)
+    barber = Barber.objects.create(user=barber_user, salon=salon, barber_type=barber_type, start_date=timezone.localdate())
+    hairstyle = Hairstyle.objects.create(name='Cut', current_tariff=Decimal('10.00'), currency=currency, salon=salon)
+    cash_register = CashRegister.objects.create(name='Main', currency=currency, salon=salon)
+    return SimpleNamespace(
+        owner=owner, salon=salon, currency=currency, barber=barber,
+        hairstyle=hairstyle, cash_register=cash_register,
+    )
+
+
+def build_shave(fixture, date_shave=None, amount=Decimal('10.00'), status=Shave.Status.COMPLETED):
+    return Shave(
+        barber=fixture.barber,
+        hairstyle=fixture.hairstyle,
+        amount=amount,
+        currency=fixture.currency,
+        amount_in_default_currency=amount,
+        cashregister=fixture.cash_register,
+        date_shave=date_shave or timezone.now(),
+        salon=fixture.salon,
+        status=status,
+    )
+
+
+def bulk_create_shaves(fixture, count, days=365, batch_size=5000, amounts=(Decimal('10.00'),)):
+    # Spread over the last `days` days, cycling through `amounts`; bulk_create skips the signals, as a pre-existing history would
+    now = timezone.now()
+    minutes = days * 24 * 60
+    created = 0
+    while created < count:
+        size = min(batch_size, count - created)
+        Shave.objects.bulk_create([
+            build_shave(
+                fixture, date_shave=now - timedelta(minutes=(created + i) % minutes),
+                amount=amounts[(created + i) % len(amounts)],
+            )
+            for i in range(size)
+        ], batch_size=batch_size)
+        created += size
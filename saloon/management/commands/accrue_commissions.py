@@ -0,0 +1,24 @@
+from django.core.management.base import BaseCommand
+
+from saloon.models import Barber
+from saloon.services import BarberService
+
+
+class Command(BaseCommand):
+    help = "Recomputes the commission accruals of every completed shave from the commission schedules."
+
+    def add_arguments(self, parser):
+        parser.add_argument('--salon', type=int, action='append', help="Only the barbers of this salon id (repeatable)")
+        parser.add_argument('--barber', type=int, action='append', help="Only this barber id (repeatable)")
+
+    def handle(self, *args, **options):
+        barbers = Barber.objects.all()
+        if options['salon']:
+            barbers = barbers.filter(salon_id__in=options['salon'])
+        if options['barber']:
+            barbers = barbers.filter(pk__in=options['barber'])
+
+        total = 0
+        for barber_id in barbers.values_list('pk', flat=True).iterator():
+            total += len(BarberService.reaccrue_barber(barber_id))
+        self.stdout.write(self.style.SUCCESS(f"{total} commission accrual(s) created."))
@@ -0,0 +1,49 @@
+import statistics
+import time
+
+from django.core.management.base import BaseCommand
+from django.db import transaction
+
+from saloon.services import CashRegisterService
+from ._seed import create_salon_fixture, build_shave, bulk_create_shaves
+
+
+class Command(BaseCommand):
+    help = "Measures the latency of saving a completed shave as the cash register history grows. All data is rolled back."
+
+    def add_arguments(self, parser):
+        parser.add_argument('--sizes', default='1000,10000,100000,1000000',
+                            help="Comma separated register history sizes (number of shaves)")
+        parser.add_argument('--samples', type=int, default=50, help="Shaves saved and timed at each size")
+        parser.add_argument('--reconcile', action='store_true',
+                            help="Also time the full recompute (update_balance) at each size")
+
+    def handle(self, *args, **options):
+        sizes = sorted(int(size) for size in options['sizes'].split(','))
+        samples = options['samples']
+
+        with transaction.atomic():
+            fixture = create_salon_fixture('bench-balances')
+            history = 0
+            for size in sizes:
+                if size > history:
+                    bulk_create_shaves(fixture, size - history)
+                    history = size
+
+                timings = []
+                for _ in range(samples):
+                    shave = build_shave(fixture)
+                    start = time.perf_counter()
+                    shave.save()
+                    timings.append((time.perf_counter() - start) * 1000)
+                history += samples
+
+                line = (f"history={size:>9,}  save mean={statistics.mean(timings):.2f}ms"
+                        f"  p95={statistics.quantiles(timings, n=20)[-1]:.2f}ms")
+                if options['reconcile']:
+                    start = time.perf_counter()
+                    CashRegisterService.update_balance(fixture.cash_register)
+                    line += f"  full recompute={(time.perf_counter() - start) * 1000:.2f}ms"
+                self.stdout.write(line)
+
+            transaction.set_rollback(True)
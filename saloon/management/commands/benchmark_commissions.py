@@ -0,0 +1,71 @@
+import time
+from datetime import timedelta
+from decimal import Decimal
+
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connection, transaction
+from django.utils import timezone
+
+from saloon.models import Commission, Shave
+from saloon.services import BarberService
+from ._seed import create_salon_fixture, bulk_create_shaves
+
+
+class QueryCounter:
+    def __init__(self):
+        self.count = 0
+
+    def __call__(self, execute, sql, params, many, context):
+        self.count += 1
+        return execute(sql, params, many, context)
+
+
+def timed(function, *args):
+    counter = QueryCounter()
+    with connection.execute_wrapper(counter):
+        start = time.perf_counter()
+        result = function(*args)
+        elapsed = time.perf_counter() - start
+    return result, f"{elapsed * 1000:.1f}ms  {counter.count} queries"
+
+
+def legacy_commission(barber):
+    # The per-shave lookup calculate_commission used to do, kept as the reference
+    total_commission = Decimal('0.00')
+    for shave in Shave.objects.filter(barber=barber, status=Shave.Status.COMPLETED):
+        commission = shave.barber.commissions.filter(effective_date__lte=shave.date_shave).order_by('-effective_date').first()
+        if commission:
+            total_commission += (shave.amount_in_default_currency * commission.percentage / 100) + commission.fixed_amount
+    return total_commission
+
+
+class Command(BaseCommand):
+    help = "Compares calculate_commission with the former per-shave lookup on a generated history. All data is rolled back."
+
+    def add_arguments(self, parser):
+        parser.add_argument('--shaves', type=int, default=100000, help="Completed shaves of the barber")
+        parser.add_argument('--skip-legacy', action='store_true', help="Only time the current calculation")
+
+    def handle(self, *args, **options):
+        with transaction.atomic():
+            fixture = create_salon_fixture('bench-commissions')
+            now = timezone.now()
+            # A schedule change every quarter, the first one before the history starts
+            for days, percentage, fixed_amount in ((400, '30.00', '0.00'), (270, '35.50', '1.25'), (180, '40.00', '0.00'), (90, '42.75', '2.00')):
+                Commission.objects.create(
+                    barber=fixture.barber, percentage=Decimal(percentage), fixed_amount=Decimal(fixed_amount),
+                    effective_date=now - timedelta(days=days),
+                )
+            bulk_create_shaves(fixture, options['shaves'], amounts=(Decimal('10.00'), Decimal('12.35'), Decimal('7.99'), Decimal('25.10')))
+
+            total, timing = timed(BarberService.calculate_commission, fixture.barber)
+            self.stdout.write(f"set-based: {total}  {timing}")
+
+            if not options['skip_legacy']:
+                legacy_total, timing = timed(legacy_commission, fixture.barber)
+                self.stdout.write(f"legacy:    {legacy_total}  {timing}")
+                if legacy_total != total or str(legacy_total) != str(total):
+                    raise CommandError("The totals differ.")
+                self.stdout.write(self.style.SUCCESS("Identical totals."))
+
+            transaction.set_rollback(True)
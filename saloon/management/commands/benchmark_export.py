@@ -0,0 +1,43 @@
+import time
+import tracemalloc
+
+from django.core.management.base import BaseCommand
+from django.db import transaction
+from django.test import RequestFactory
+
+from saloon.views import ShaveExportView
+from ._seed import create_salon_fixture, bulk_create_shaves
+
+
+class Command(BaseCommand):
+    help = "Streams the shave CSV export of a generated history and reports time to first byte and peak memory. All data is rolled back."
+
+    def add_arguments(self, parser):
+        parser.add_argument('--shaves', type=int, default=200000, help="Shaves of the salon")
+
+    def handle(self, *args, **options):
+        with transaction.atomic():
+            fixture = create_salon_fixture('bench-export')
+            bulk_create_shaves(fixture, options['shaves'])
+
+            request = RequestFactory().get(f'/saloon/{fixture.salon.pk}/shaves/export/')
+            request.user = fixture.owner
+            tracemalloc.start()
+            start = time.perf_counter()
+            response = ShaveExportView.as_view()(request, salon_id=fixture.salon.pk)
+            content = iter(response.streaming_content)
+            size = len(next(content))
+            first_byte = time.perf_counter() - start
+            lines = 1
+            for line in content:
+                size += len(line)
+                lines += 1
+            elapsed = time.perf_counter() - start
+            peak = tracemalloc.get_traced_memory()[1]
+            tracemalloc.stop()
+
+            self.stdout.write(
+                f"{lines} lines  {size / 1e6:.1f}MB  first byte {first_byte * 1000:.1f}ms  "
+                f"total {elapsed:.1f}s  peak memory {peak / 1e6:.1f}MB"
+            )
+            transaction.set_rollback(True)
@@ -0,0 +1,105 @@
+import uuid
+from decimal import Decimal
+
+from django.contrib.auth import get_user_model
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connection, transaction
+from django.test import RequestFactory, override_settings
+from django.test.utils import CaptureQueriesContext
+from django.utils import timezone
+
+from saloon import views
+from saloon.models import (
+    Barber, Client, Commission, Hairstyle, HairstyleTariffHistory, Item, ItemPurchase, ItemUsed,
+    Payment, PaymentType, Transaction,
+)
+from ._seed import create_salon_fixture, build_shave
+
+LIST_VIEWS = (
+    views.BarberListView, views.ClientListView, views.HairstyleListView, views.ShaveListView, views.ItemListView,
+    views.ItemPurchaseListView, views.ItemUsedListView, views.CommissionListView, views.CurrencyListView,
+    views.CashRegisterListView, views.PaymentTypeListView, views.PaymentListView, views.TransactionListView,
+    views.HairstyleTariffHistoryListView,
+)
+
+
+def add_rows(fixture, count):
+    # Adds count rows to every list, each with its own barber, hairstyle and item so that an N+1 shows
+    User = get_user_model()
+    salon, currency, cash_register = fixture.salon, fixture.currency, fixture.cash_register
+    payment_type = PaymentType.objects.create(name=f'Cash {uuid.uuid4().hex[:8]}', salon=salon)
+    today = timezone.localdate()
+    for _ in range(count):
+        suffix = uuid.uuid4().hex[:8]
+        user = User.objects.create_user(email=f'budget-{suffix}@example.com', password=suffix)
+        barber = Barber.objects.create(user=user, salon=salon, barber_type=fixture.barber.barber_type, start_date=today)
+        hairstyle = Hairstyle.objects.create(name=f'Cut {suffix}', current_tariff=Decimal('10.00'), currency=currency, salon=salon)
+        item = Item.objects.create(name=f'Wax {suffix}', price=Decimal('4.00'), currency=currency, amount_in_default_currency=Decimal('4.00'), salon=salon)
+        item.item_purpose.add(hairstyle, fixture.hairstyle)
+        shave = build_shave(fixture)
+        shave.barber, shave.hairstyle = barber, hairstyle
+        shave.save()
+        Client.objects.create(name=f'Client {suffix}', user=user, salon=salon)
+        Commission.objects.create(barber=barber, percentage=Decimal('30.00'))
+        HairstyleTariffHistory.objects.create(hairstyle=hairstyle, tariff=Decimal('10.00'))
+        ItemPurchase.objects.create(
+            item=item, quantity=5, purchase_price=Decimal('4.00'), currency=currency, exchange_rate=Decimal('1'),
+            purchase_price_in_default_currency=Decimal('4.00'), cashregister=cash_register, salon=salon,
+        )
+        ItemUsed.objects.create(item=item, shave=shave, barber=barber, quantity=1, salon=salon)
+        Payment.objects.create(
+            barber=barber, amount=Decimal('1.00'), currency=currency, exchange_rate=Decimal('1'), amount_in_default_currency=Decimal('1.00'),
+            start_date=today, end_date=today, payment_type=payment_type, cashregister=cash_register, salon=salon,
+        )
+        Transaction.objects.create(
+            trans_name=f'Rent {suffix}', amount=Decimal('1.00'), currency=currency, exchange_rate=Decimal('1'), amount_in_default_currency=Decimal('1.00'),
+            trans_type=Transaction.TransactionType.EXPENSE, cashregister=cash_register, salon=salon,
+        )
+
+
+class Command(BaseCommand):
+    help = (
+        "Renders every salon list with a few rows, then with many rows of distinct barbers, hairstyles and items, "
+        "and fails if a list goes over its max_queries or runs more queries for more rows. All data is rolled back. "
+        "saloon.tests.test_query_budgets runs the same checks."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--rows', type=int, default=30, help="Rows per list in the second pass")
+
+    def render_lists(self, fixture):
+        counts, failures = {}, []
+        for view_class in LIST_VIEWS:
+            request = RequestFactory().get('/')
+            request.user = fixture.owner
+            try:
+                with CaptureQueriesContext(connection) as queries:
+                    view_class.as_view()(request, salon_id=fixture.salon.pk)
+            except views.QueryBudgetExceeded as e:
+                failures.append(view_class.__name__)
+                self.stdout.write(self.style.ERROR(str(e).splitlines()[0]))
+                continue
+            counts[view_class.__name__] = len(queries)
+        return counts, failures
+
+    def handle(self, *args, **options):
+        with transaction.atomic(), override_settings(SALOON_ENFORCE_QUERY_BUDGETS=True):
+            fixture = create_salon_fixture('budget')
+            add_rows(fixture, 1)
+            few, failures = self.render_lists(fixture)
+            add_rows(fixture, options['rows'])
+            many, more_failures = self.render_lists(fixture)
+            failures += more_failures
+            for name, count in many.items():
+                if name not in few:
+                    continue
+                if count != few[name]:
+                    failures.append(name)
+                    self.stdout.write(self.style.ERROR(f"{name}: {few[name]} queries for 1 row, {count} for {options['rows'] + 1}"))
+                else:
+                    self.stdout.write(f"{name}: {count} queries")
+            transaction.set_rollback(True)
+
+        if failures:
+            raise CommandError(f"{len(failures)} list(s) over their query budget: {', '.join(sorted(set(failures)))}")
+        self.stdout.write(self.style.SUCCESS("Every list stays within its query budget."))
@@ -0,0 +1,150 @@
+import re
+from datetime import timedelta
+from decimal import Decimal
+
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connection, transaction
+from django.utils import timezone
+
+from saloon.models import Salon, Barber, CashRegister, Commission, Payment, PaymentType, Shave, Transaction
+from saloon.services import (
+    ShaveService, BarberService, CashRegisterService, DailyStatsService, FinancialService,
+)
+from ._seed import create_salon_fixture, bulk_create_shaves
+
+# Tables that grow with the activity of the salons: a full scan of one of them is a regression
+LARGE_TABLES = (
+    'saloon_shave', 'saloon_transaction', 'saloon_payment', 'saloon_commission', 'saloon_commissionaccrual',
+    'saloon_salondailystats', 'saloon_hairstyletariffhistory',
+)
+
+
+class QueryRecorder:
+    def __init__(self):
+        self.queries = []
+
+    def __call__(self, execute, sql, params, many, context):
+        if not many and sql.lstrip().upper().startswith('SELECT'):
+            self.queries.append((sql, params))
+        return execute(sql, params, many, context)
+
+
+def explain(sql, params):
+    with connection.cursor() as cursor:
+        if connection.vendor == 'sqlite':
+            cursor.execute(f'EXPLAIN QUERY PLAN {sql}', params)
+            return '\n'.join(row[-1] for row in cursor.fetchall())
+        cursor.execute(f'EXPLAIN {sql}', params)
+        return '\n'.join(row[0] for row in cursor.fetchall())
+
+
+def full_scans(sql, plan):
+    # sqlite names subquery tables by their alias (U0, V1...): mapped back through the FROM/JOIN clauses
+    aliases = dict((alias, table) for table, alias in re.findall(r'"(\w+)" ([A-Z]\d+)\b', sql))
+    if connection.vendor == 'sqlite':
+        scans = re.findall(r'\bSCAN (\w+)\b(?! USING (?:COVERING )?INDEX)', plan)
+    else:
+        scans = re.findall(r'Seq Scan on (\w+)', plan)
+    return sorted({aliases.get(table, table) for table in scans} & set(LARGE_TABLES))
+
+
+def seed(salons, shaves):
+    fixtures = [create_salon_fixture('plans') for _ in range(salons)]
+    now = timezone.now()
+    for fixture in fixtures:
+        bulk_create_shaves(fixture, shaves, days=365, amounts=(Decimal('10.00'), Decimal('12.50')))
+        Commission.objects.bulk_create([
+            Commission(barber=fixture.barber, percentage=Decimal('30.00') + i, effective_date=now - timedelta(days=400 - i * 8))
+            for i in range(50)
+        ])
+        Transaction.objects.bulk_create([
+            Transaction(
+                trans_name=f'plans-{i}', amount=Decimal('5.00'), currency=fixture.currency, amount_in_default_currency=Decimal('5.00'),
+                date_trans=(now - timedelta(days=i % 365)).date(), cashregister=fixture.cash_register, salon=fixture.salon,
+                trans_type=Transaction.TransactionType.EXPENSE if i % 2 else Transaction.TransactionType.INCOME,
+            ) for i in range(shaves // 5)
+        ], batch_size=1000)
+        payment_type = PaymentType.objects.create(name='Cash', salon=fixture.salon)
+        Payment.objects.bulk_create([
+            Payment(
+                barber=fixture.barber, amount=Decimal('20.00'), currency=fixture.currency, amount_in_default_currency=Decimal('20.00'),
+                start_date=(now - timedelta(days=i + 7)).date(), end_date=(now - timedelta(days=i)).date(),
+                date_payment=(now - timedelta(days=i)).date(), payment_type=payment_type,
+                cashregister=fixture.cash_register, salon=fixture.salon,
+            ) for i in range(shaves // 10)
+        ], batch_size=1000)
+    salon_ids = [fixture.salon.pk for fixture in fixtures]
+    BarberService.accrue_shaves(Shave.objects.filter(salon_id__in=salon_ids))
+    DailyStatsService.rebuild(salon_ids)
+    with connection.cursor() as cursor:
+        cursor.execute('ANALYZE')
+    return fixtures
+
+
+def hot_queries(fixtures):
+    # (name, callable) of the service calls whose plans must stay on the indexes
+    fixture = fixtures[len(fixtures) // 2]
+    salon, barber, cash_register = fixture.salon, fixture.barber, fixture.cash_register
+    end = timezone.now()
+    start = end - timedelta(days=30)
+    salon_ids = [f.salon.pk for f in fixtures]
+    return [
+        ("ShaveService.get_total_shaves", lambda: ShaveService.get_total_shaves(salon, start, end)),
+        ("FinancialService.get_financial_summary", lambda: FinancialService.get_financial_summary.uncached(salon, start, end)),
+        ("FinancialService.annotate_summary", lambda: list(FinancialService.annotate_summary(Salon.objects.filter(pk__in=salon_ids)))),
+        ("BarberService.get_commission_schedules", lambda: BarberService.get_commission_schedules([barber.pk])),
+        ("BarberService.calculate_commission", lambda: BarberService.calculate_commission(barber, start, end)),
+        ("BarberService.get_accrued_commission", lambda: BarberService.get_accrued_commission(barber, start, end)),
+        ("BarberService.calculate_balance", lambda: BarberService.calculate_balance(barber, start, end)),
+        ("BarberService.calculate_balances", lambda: BarberService.calculate_balances(Barber.objects.filter(salon=salon), start, end)),
+        ("CashRegisterService.recompute_many", lambda: CashRegisterService.recompute_many(CashRegister.objects.filter(pk=cash_register.pk))),
+        ("CashRegisterService.close_days", lambda: CashRegisterService.close_days(cash_register, (end - timedelta(days=1)).date())),
+        ("DailyStatsService.rebuild", lambda: DailyStatsService.rebuild([salon.pk], start.date(), end.date())),
+    ]
+
+
+def scanned_tables(check):
+    # Runs the check and returns its SELECTs with their plans, and the large tables any of them scans in full
+    recorder = QueryRecorder()
+    with connection.execute_wrapper(recorder):
+        check()
+    plans, scanned = [], set()
+    for sql, params in recorder.queries:
+        plan = explain(sql, params)
+        plans.append((sql, plan))
+        scanned.update(full_scans(sql, plan))
+    return plans, sorted(scanned)
+
+
+class Command(BaseCommand):
+    help = (
+        "Seeds a multi-salon history, runs the hot ShaveService, BarberService, CashRegisterService and "
+        "FinancialService queries and fails if EXPLAIN shows a full scan of a large table. All data is rolled back. "
+        "saloon.tests.test_query_plans runs the same checks on a smaller history."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--salons', type=int, default=20, help="Salons to generate")
+        parser.add_argument('--shaves', type=int, default=5000, help="Shaves per salon")
+        parser.add_argument('--verbose-plans', action='store_true', help="Print every plan")
+
+    def handle(self, *args, **options):
+        with transaction.atomic():
+            fixtures = seed(options['salons'], options['shaves'])
+            failures = []
+            for name, check in hot_queries(fixtures):
+                plans, scanned = scanned_tables(check)
+                if options['verbose_plans']:
+                    for sql, plan in plans:
+                        self.stdout.write(f"{name}\n{sql}\n{plan}\n")
+                if scanned:
+                    failures.append(name)
+                    self.stdout.write(self.style.ERROR(f"{name}: full scan of {', '.join(scanned)}"))
+                else:
+                    self.stdout.write(f"{name}: {len(plans)} select(s), index access only")
+
+            transaction.set_rollback(True)
+
+        if failures:
+            raise CommandError(f"{len(failures)} check(s) scan a large table: {', '.join(failures)}")
+        self.stdout.write(self.style.SUCCESS("Every checked query uses an index."))
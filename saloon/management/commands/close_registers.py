@@ -0,0 +1,33 @@
+from datetime import date
+
+from django.core.exceptions import ValidationError
+from django.core.management.base import BaseCommand
+
+from saloon.models import CashRegister
+from saloon.services import CashRegisterService
+
+
+class Command(BaseCommand):
+    help = "Closes the days (Z-reports) of cash registers up to a date, yesterday in each salon's time zone by default."
+
+    def add_arguments(self, parser):
+        parser.add_argument('--date', type=date.fromisoformat, help="Last day to close (YYYY-MM-DD)")
+        parser.add_argument('--salon', type=int, action='append', help="Only the registers of this salon id (repeatable)")
+
+    def handle(self, *args, **options):
+        cash_registers = CashRegister.objects.select_related('salon')
+        if options['salon']:
+            cash_registers = cash_registers.filter(salon_id__in=options['salon'])
+
+        total = 0
+        for cash_register in cash_registers.iterator():
+            end_day = options['date'] or CashRegisterService.get_last_closable_day(cash_register)
+            try:
+                closes = CashRegisterService.close_days(cash_register, end_day)
+            except ValidationError as e:
+                self.stderr.write(f"{cash_register}: {' '.join(e.messages)}")
+                continue
+            total += len(closes)
+            if closes:
+                self.stdout.write(f"{cash_register}: closed {len(closes)} day(s) up to {end_day}")
+        self.stdout.write(self.style.SUCCESS(f"{total} day(s) closed."))
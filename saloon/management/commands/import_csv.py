@@ -0,0 +1,42 @@
+import csv
+
+from django.core.exceptions import ValidationError
+from django.core.management.base import BaseCommand, CommandError
+
+from saloon.models import Salon
+from saloon.services import ImportService
+
+
+class Command(BaseCommand):
+    help = "Imports historical shaves or transactions of a salon from a CSV file (same columns as the exports)."
+
+    def add_arguments(self, parser):
+        parser.add_argument('salon', type=int, help="Salon id")
+        parser.add_argument('kind', choices=sorted(ImportService.COLUMNS), help="What the file contains")
+        parser.add_argument('path', help="CSV file, with a header row")
+        parser.add_argument('--chunk-size', type=int, default=1000, help="Rows validated and inserted at a time")
+        parser.add_argument('--dry-run', action='store_true', help="Only validate the rows")
+        parser.add_argument('--max-errors', type=int, default=50, help="Row errors to print")
+
+    def handle(self, *args, **options):
+        salon = Salon.objects.filter(pk=options['salon']).first()
+        if salon is None:
+            raise CommandError(f"Salon {options['salon']} does not exist.")
+
+        with open(options['path'], newline='', encoding='utf-8-sig') as f:
+            try:
+                result = ImportService.import_rows(
+                    salon, options['kind'], csv.DictReader(f), options['chunk_size'], options['dry_run']
+                )
+            except ValidationError as e:
+                raise CommandError(' '.join(e.messages))
+
+        for line, message in result['errors'][:options['max_errors']]:
+            self.stdout.write(self.style.ERROR(f"line {line}: {message}"))
+        if len(result['errors']) > options['max_errors']:
+            self.stdout.write(self.style.ERROR(f"... and {len(result['errors']) - options['max_errors']} more error(s)"))
+        self.stdout.write(
+            f"{result['rows']} row(s) read, {result['valid']} valid, {len(result['errors'])} rejected, "
+            f"{result['created']} created in {result['seconds']:.1f}s ({result['rows_per_second']:.0f} rows/s)"
+        )
+        self.stdout.write(self.style.SUCCESS("Dry run: nothing was saved." if options['dry_run'] else "Import done."))
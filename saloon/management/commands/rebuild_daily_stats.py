@@ -0,0 +1,25 @@
+from datetime import date
+
+from django.core.management.base import BaseCommand
+
+from saloon.models import Salon
+from saloon.services import DailyStatsService
+
+
+class Command(BaseCommand):
+    help = "Rebuilds the salon daily stats from the shaves, transactions, payments, purchases and items used."
+
+    def add_arguments(self, parser):
+        parser.add_argument('--salon', type=int, action='append', help="Only this salon id (repeatable)")
+        parser.add_argument('--start', type=date.fromisoformat, help="First day to rebuild (YYYY-MM-DD)")
+        parser.add_argument('--end', type=date.fromisoformat, help="Last day to rebuild (YYYY-MM-DD)")
+
+    def handle(self, *args, **options):
+        salons = Salon.objects.order_by('pk')
+        if options['salon']:
+            salons = salons.filter(pk__in=options['salon'])
+
+        total = 0
+        for salon_id in salons.values_list('pk', flat=True).iterator():
+            total += DailyStatsService.rebuild([salon_id], options['start'], options['end'])
+        self.stdout.write(self.style.SUCCESS(f"{total} daily stats row(s) rebuilt."))
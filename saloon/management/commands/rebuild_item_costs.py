@@ -0,0 +1,34 @@
+from django.core.management.base import BaseCommand
+
+from saloon.models import Item, CashRegister
+from saloon.services import InventoryService, CashRegisterService, DailyStatsService
+
+
+class Command(BaseCommand):
+    help = "Rebuilds the moving average cost of items, the cost of every item used and the FIFO lots from the purchase history."
+
+    def add_arguments(self, parser):
+        parser.add_argument('--salon', type=int, action='append', help="Only the items of this salon id (repeatable)")
+        parser.add_argument('--no-reconcile', action='store_true',
+                            help="Don't recompute the balances and daily stats affected")
+
+    def handle(self, *args, **options):
+        items = Item.objects.all()
+        if options['salon']:
+            items = items.filter(salon_id__in=options['salon'])
+
+        item_count, used_count = InventoryService.rebuild_item_costs(items)
+        self.stdout.write(f"{item_count} item(s) and {used_count} use(s) updated.")
+        consumption_count = InventoryService.rebuild_item_lots(items)
+        self.stdout.write(f"{consumption_count} lot consumption(s) rebuilt.")
+
+        if not options['no_reconcile']:
+            # Past profits changed: recompute the balances and reopen every day close
+            cash_register_ids = set(CashRegister.objects.filter(
+                shaves__items_used__item__in=items
+            ).values_list('pk', flat=True))
+            CashRegisterService.mark_for_reconcile(cash_register_ids)
+            self.stdout.write(f"{len(cash_register_ids)} cash register(s) reconciled.")
+            salon_ids = set(items.values_list('salon_id', flat=True))
+            DailyStatsService.rebuild(salon_ids)
+            self.stdout.write(f"Daily stats of {len(salon_ids)} salon(s) rebuilt.")
@@ -0,0 +1,102 @@
+import csv
+import json
+import time
+from concurrent.futures import ProcessPoolExecutor, as_completed
+from datetime import date, datetime
+
+import django
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connections
+from django.utils import timezone
+
+from saloon.models import CashRegister, Salon
+from saloon.services import CashRegisterService
+
+REPORT_FIELDS = [
+    'cashregister_id', 'cashregister', 'salon_id',
+    'stored_cash', 'recomputed_cash', 'stored_profit', 'recomputed_profit',
+]
+
+
+def init_worker():
+    # Forked workers must not share the parent's database connections; they open their own on first query
+    django.setup()
+    connections.close_all()
+
+
+def check_salons(salon_ids, since, repair):
+    cash_registers = CashRegister.objects.filter(salon_id__in=salon_ids)
+    if since:
+        cash_registers = CashRegisterService.get_registers_changed_since(cash_registers, since)
+    count = cash_registers.count()
+    discrepancies = CashRegisterService.find_discrepancies(cash_registers)
+    if repair and discrepancies:
+        CashRegisterService.recompute_many(
+            CashRegister.objects.filter(pk__in=[discrepancy['cashregister_id'] for discrepancy in discrepancies])
+        )
+    connections.close_all()
+    return count, discrepancies
+
+
+class Command(BaseCommand):
+    help = ("Recomputes the balances of every cash register in parallel, salon by salon, "
+            "and reports the registers whose stored balances differ.")
+
+    def add_arguments(self, parser):
+        parser.add_argument('--salon', type=int, action='append', help="Only this salon id (repeatable)")
+        parser.add_argument('--since', type=date.fromisoformat,
+                            help="Only registers with writes since this day (YYYY-MM-DD); deletions are not detected")
+        parser.add_argument('--workers', type=int, default=None, help="Worker processes, the number of CPUs by default")
+        parser.add_argument('--chunk', type=int, default=10, help="Salons handed to a worker at a time")
+        parser.add_argument('--report', help="Write the discrepancies to this .json or .csv file")
+        parser.add_argument('--repair', action='store_true', help="Recompute and save the registers found wrong")
+
+    def handle(self, *args, **options):
+        report = options['report']
+        if report and not report.endswith(('.json', '.csv')):
+            raise CommandError("The report must be a .json or .csv file.")
+
+        salons = Salon.objects.order_by('pk')
+        if options['salon']:
+            salons = salons.filter(pk__in=options['salon'])
+        salon_ids = list(salons.values_list('pk', flat=True))
+        chunks = [salon_ids[i:i + options['chunk']] for i in range(0, len(salon_ids), options['chunk'])]
+        since = options['since'] and timezone.make_aware(datetime.combine(options['since'], datetime.min.time()))
+
+        start = time.perf_counter()
+        checked = 0
+        discrepancies = []
+        # The workers inherit the process: don't hand them an open connection
+        connections.close_all()
+        with ProcessPoolExecutor(max_workers=options['workers'], initializer=init_worker) as executor:
+            futures = [executor.submit(check_salons, chunk, since, options['repair']) for chunk in chunks]
+            for future in as_completed(futures):
+                count, found = future.result()
+                checked += count
+                discrepancies.extend(found)
+        elapsed = time.perf_counter() - start
+
+        discrepancies.sort(key=lambda discrepancy: discrepancy['cashregister_id'])
+        for discrepancy in discrepancies:
+            self.stdout.write(
+                f"{discrepancy['cashregister']} (#{discrepancy['cashregister_id']}): "
+                f"cash {discrepancy['stored_cash']} != {discrepancy['recomputed_cash']}, "
+                f"profit {discrepancy['stored_profit']} != {discrepancy['recomputed_profit']}"
+            )
+        if report:
+            self.write_report(report, discrepancies)
+
+        rate = checked / elapsed if elapsed else 0
+        self.stdout.write(f"{checked} register(s) of {len(salon_ids)} salon(s) checked in {elapsed:.2f}s ({rate:.0f} registers/s).")
+        style = self.style.WARNING if discrepancies else self.style.SUCCESS
+        action = "repaired" if options['repair'] else "found"
+        self.stdout.write(style(f"{len(discrepancies)} discrepancy(ies) {action}."))
+
+    def write_report(self, path, discrepancies):
+        with open(path, 'w', newline='') as report_file:
+            if path.endswith('.json'):
+                json.dump(discrepancies, report_file, indent=2, default=str)
+            else:
+                writer = csv.DictWriter(report_file, fieldnames=REPORT_FIELDS)
+                writer.writeheader()
+                writer.writerows(discrepancies)
@@ -0,0 +1,39 @@
+import time
+from datetime import timedelta
+
+from django.core.management.base import BaseCommand
+from django.utils import timezone
+
+from saloon.models import CashRegister
+from saloon.services import CashRegisterService
+
+
+class Command(BaseCommand):
+    help = "Recomputes, in batches, the balances of cash registers not reconciled for a while."
+
+    def add_arguments(self, parser):
+        parser.add_argument('--max-age', type=float, default=24, help="Hours after which a reconciliation is stale")
+        parser.add_argument('--batch', type=int, default=100, help="Registers recomputed per transaction")
+        parser.add_argument('--salon', type=int, action='append', help="Only the registers of this salon id (repeatable)")
+        parser.add_argument('--loop', type=float, metavar='SECONDS',
+                            help="Keep running, checking for stale registers at this interval")
+
+    def handle(self, *args, **options):
+        max_age = timedelta(hours=options['max_age'])
+        cash_registers = None
+        if options['salon']:
+            cash_registers = CashRegister.objects.filter(salon_id__in=options['salon'])
+
+        while True:
+            # Registers reconciled during this pass are not stale again before the next one
+            reconciled_before = timezone.now() - max_age
+            total = 0
+            while True:
+                reconciled = CashRegisterService.reconcile_stale(reconciled_before, options['batch'], cash_registers)
+                total += reconciled
+                if reconciled < options['batch']:
+                    break
+            self.stdout.write(f"{total} cash register(s) reconciled.")
+            if not options['loop']:
+                break
+            time.sleep(options['loop'])
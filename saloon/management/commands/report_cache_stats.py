@@ -0,0 +1,20 @@
+from django.core.management.base import BaseCommand
+
+# Registers the cached reports
+import saloon.services  # noqa: F401
+from saloon.cache import get_stats, reset_stats
+
+
+class Command(BaseCommand):
+    help = "Shows the hit and miss counters of the cached salon reports (meaningful with a shared cache backend)."
+
+    def add_arguments(self, parser):
+        parser.add_argument('--reset', action='store_true', help="Reset the counters after showing them")
+
+    def handle(self, *args, **options):
+        for name, stats in get_stats().items():
+            ratio = '-' if stats['ratio'] is None else f"{stats['ratio']:.1%}"
+            self.stdout.write(f"{name:<40} hits {stats['hits']:>8}  misses {stats['misses']:>8}  hit ratio {ratio}")
+        if options['reset']:
+            reset_stats()
+            self.stdout.write(self.style.SUCCESS("Counters reset."))
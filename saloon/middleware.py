@@ -0,0 +1,132 @@
+# middleware.py
+
+from django.conf import settings
+from django.db import DEFAULT_DB_ALIAS
+from django.http import Http404
+from django.urls import Resolver404, resolve
+from .cache import get_owner_version
+from .models import Salon
+from .routers import read_from_replica, replica_configured, has_written
+
+PRIMARY_PIN_COOKIE = 'saloon_primary'
+SALON_SESSION_KEY = '_saloon_salons'
+
+class SalonContext:
+    """
+    The salons owned by the user of a request. Their ids are kept in the session under the user's owner
+    version, which the signals bump whenever one of the user's salons is saved or deleted, so that the menu
+    and the "create a salon first" redirect need no query. Those ids are only a hint: salons and get_salon()
+    always filter on the owner, and salon instances are loaded at most once per request.
+    """
+
+    def __init__(self, request):
+        self.request = request
+        self._ids = None
+        # Keyed by (user id, salon id): API views authenticate their token after the middleware ran
+        self._salons = {}
+
+    @property
+    def salon_ids(self):
+        user = self.request.user
+        user_id = user.pk if user.is_authenticated else None
+        if self._ids is None or self._ids[0] != user_id:
+            self._ids = (user_id, self.load_salon_ids(user) if user_id is not None else [])
+        return self._ids[1]
+
+    def load_salon_ids(self, user):
+        version = get_owner_version(user.pk)
+        # Only sessions the client already holds: token requests would otherwise create one per call
+        session = getattr(self.request, 'session', None)
+        if session is None or session.session_key is None:
+            session = None
+        cached = session.get(SALON_SESSION_KEY) if session is not None else None
+        if cached and cached['user'] == user.pk and cached['version'] == version:
+            return cached['ids']
+        # Read on the primary: a lagging replica would keep the new version with an outdated list
+        ids = list(Salon.objects.using(DEFAULT_DB_ALIAS).filter(owner=user).order_by('pk').values_list('pk', flat=True))
+        if session is not None:
+            session[SALON_SESSION_KEY] = {'user': user.pk, 'version': version, 'ids': ids}
+        return ids
+
+    @property
+    def salons(self):
+        user = self.request.user
+        return Salon.objects.filter(owner_id=user.pk) if user.is_authenticated else Salon.objects.none()
+
+    def get_salon(self, salon_id):
+        try:
+            key = (self.request.user.pk, int(salon_id))
+        except (TypeError, ValueError):
+            raise Http404("No salon matches the given query.")
+        if key not in self._salons:
+            try:
+                self._salons[key] = self.salons.get(pk=key[1])
+            except Salon.DoesNotExist:
+                raise Http404("No salon matches the given query.")
+        return self._salons[key]
+
+    @property
+    def default_salon(self):
+        # The first salon of the user, preselected in forms and shown in the menu
+        if not self.salon_ids:
+            return None
+        key = (self.request.user.pk, None)
+        if key not in self._salons:
+            self._salons[key] = self.salons.order_by('pk').first()
+        return self._salons[key]
+
+def get_salon_context(request):
+    # Requests that did not go through SalonContextMiddleware (RequestFactory, management commands) get theirs on first use
+    if not hasattr(request, 'salon_context'):
+        request.salon_context = SalonContext(request)
+    return request.salon_context
+
+class SalonContextMiddleware:
+    def __init__(self, get_response):
+        self.get_response = get_response
+
+    def __call__(self, request):
+        get_salon_context(request)
+        return self.get_response(request)
+
+def stream_from_replica(content):
+    # Streamed bodies run their queries while being sent, after the view has returned
+    with read_from_replica():
+        yield from content
+
+class ReplicaRoutingMiddleware:
+    """
+    Runs the GET/HEAD requests of views declaring use_replica = True against the replica. The whole request
+    below this middleware reads in the same block, so the view, its template and the other middleware run
+    through the usual handler. A request that writes pins its client to the primary for
+    SALOON_REPLICA_STICKY_SECONDS, so that the user's next pages show their own changes even when the replica lags.
+    """
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+
+    def __call__(self, request):
+        if not replica_configured():
+            return self.get_response(request)
+        use_replica = self.reads_from_replica(request)
+        with read_from_replica(enabled=use_replica):
+            response = self.get_response(request)
+            wrote = has_written()
+        if use_replica and response.streaming:
+            response.streaming_content = stream_from_replica(response.streaming_content)
+        if wrote:
+            response.set_cookie(
+                PRIMARY_PIN_COOKIE, '1', max_age=getattr(settings, 'SALOON_REPLICA_STICKY_SECONDS', 10),
+                httponly=True, samesite='Lax',
+            )
+        return response
+
+    def reads_from_replica(self, request):
+        # The handler resolves the URL after the middleware is called: resolve it here to find the view
+        if request.method not in ('GET', 'HEAD') or PRIMARY_PIN_COOKIE in request.COOKIES:
+            return False
+        try:
+            match = resolve(request.path_info, getattr(request, 'urlconf', None))
+        except Resolver404:
+            return False
+        return getattr(getattr(match.func, 'view_class', None), 'use_replica', False)
@@ -0,0 +1,36 @@
+# Generated by Django 5.1.1 on 2026-10-18 17:43
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('saloon', '0005_salon_image'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='RegisterClose',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('created_at', models.DateTimeField(auto_now_add=True, verbose_name='Created at')),
+                ('modified_at', models.DateTimeField(auto_now=True, verbose_name='Modified at')),
+                ('date', models.DateField(verbose_name='Date')),
+                ('income', models.DecimalField(decimal_places=2, default=0, max_digits=19, verbose_name='Income')),
+                ('expense', models.DecimalField(decimal_places=2, default=0, max_digits=19, verbose_name='Expense')),
+                ('payments', models.DecimalField(decimal_places=2, default=0, max_digits=19, verbose_name='Payments')),
+                ('purchases', models.DecimalField(decimal_places=2, default=0, max_digits=19, verbose_name='Purchases')),
+                ('items_cost', models.DecimalField(decimal_places=2, default=0, max_digits=19, verbose_name='Items cost')),
+                ('balance_cash', models.DecimalField(decimal_places=2, default=0, max_digits=19, verbose_name='Closing Cash Balance')),
+                ('balance_profit', models.DecimalField(decimal_places=2, default=0, max_digits=19, verbose_name='Closing Profit Balance')),
+                ('cashregister', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='closes', to='saloon.cashregister', verbose_name='Cash Register')),
+                ('salon', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='register_closes', to='saloon.salon', verbose_name='Salon')),
+            ],
+            options={
+                'ordering': ['-date'],
+                'unique_together': {('cashregister', 'date')},
+            },
+        ),
+    ]
@@ -0,0 +1,33 @@
+# Generated by Django 5.1.1 on 2026-10-18 17:44
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('saloon', '0006_registerclose'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='item',
+            name='average_cost',
+            field=models.DecimalField(decimal_places=6, default=0, editable=False, max_digits=19, verbose_name='Average unit cost'),
+        ),
+        migrations.AddField(
+            model_name='item',
+            name='stock_value',
+            field=models.DecimalField(decimal_places=2, default=0, editable=False, max_digits=19, verbose_name='Stock value'),
+        ),
+        migrations.AddField(
+            model_name='itemused',
+            name='cost_in_default_currency',
+            field=models.DecimalField(decimal_places=2, default=0, editable=False, max_digits=19, verbose_name='Cost in default currency'),
+        ),
+        migrations.AddField(
+            model_name='itemused',
+            name='unit_cost',
+            field=models.DecimalField(decimal_places=6, default=0, editable=False, max_digits=19, verbose_name='Unit cost'),
+        ),
+    ]
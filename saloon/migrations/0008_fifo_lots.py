@@ -0,0 +1,46 @@
+# Generated by Django 5.1.1 on 2026-10-18 17:48
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('saloon', '0007_item_average_cost'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='ItemLotConsumption',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('created_at', models.DateTimeField(auto_now_add=True, verbose_name='Created at')),
+                ('modified_at', models.DateTimeField(auto_now=True, verbose_name='Modified at')),
+                ('quantity', models.PositiveIntegerField(verbose_name='Quantity')),
+                ('unit_cost', models.DecimalField(decimal_places=6, max_digits=19, verbose_name='Unit cost')),
+            ],
+            options={
+                'abstract': False,
+            },
+        ),
+        migrations.AddField(
+            model_name='itempurchase',
+            name='remaining_quantity',
+            field=models.PositiveIntegerField(default=0, editable=False, verbose_name='Remaining quantity'),
+        ),
+        migrations.AddIndex(
+            model_name='itempurchase',
+            index=models.Index(condition=models.Q(('remaining_quantity__gt', 0)), fields=['item', 'purchase_date', 'id'], name='saloon_itempurchase_open_lot'),
+        ),
+        migrations.AddField(
+            model_name='itemlotconsumption',
+            name='item_used',
+            field=models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='lot_consumptions', to='saloon.itemused', verbose_name='Item used'),
+        ),
+        migrations.AddField(
+            model_name='itemlotconsumption',
+            name='purchase',
+            field=models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='consumptions', to='saloon.itempurchase', verbose_name='Purchase'),
+        ),
+    ]
@@ -0,0 +1,18 @@
+# Generated by Django 5.1.1 on 2026-10-18 17:50
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('saloon', '0008_fifo_lots'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='cashregister',
+            name='reconciled_at',
+            field=models.DateTimeField(blank=True, db_index=True, editable=False, null=True, verbose_name='Reconciled at'),
+        ),
+    ]
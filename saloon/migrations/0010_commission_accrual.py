@@ -0,0 +1,33 @@
+# Generated by Django 5.1.1 on 2026-10-18 17:57
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('saloon', '0009_cashregister_reconciled_at'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='CommissionAccrual',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('created_at', models.DateTimeField(auto_now_add=True, verbose_name='Created at')),
+                ('modified_at', models.DateTimeField(auto_now=True, verbose_name='Modified at')),
+                ('date', models.DateTimeField(verbose_name='Date')),
+                ('percentage', models.DecimalField(decimal_places=2, max_digits=5, verbose_name='Commission Percentage')),
+                ('fixed_amount', models.DecimalField(decimal_places=2, max_digits=19, verbose_name='Fixed Amount')),
+                ('amount', models.DecimalField(decimal_places=6, max_digits=23, verbose_name='Amount')),
+                ('barber', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='commission_accruals', to='saloon.barber', verbose_name='Barber')),
+                ('commission', models.ForeignKey(null=True, on_delete=django.db.models.deletion.SET_NULL, related_name='accruals', to='saloon.commission', verbose_name='Commission')),
+                ('salon', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='commission_accruals', to='saloon.salon', verbose_name='Salon')),
+                ('shave', models.OneToOneField(on_delete=django.db.models.deletion.CASCADE, related_name='commission_accrual', to='saloon.shave', verbose_name='Shave')),
+            ],
+            options={
+                'indexes': [models.Index(fields=['barber', 'date'], name='saloon_accrual_barber_date')],
+            },
+        ),
+    ]
@@ -0,0 +1,45 @@
+# Generated by Django 5.1.1 on 2026-10-18 18:00
+
+import django.db.models.deletion
+import django.utils.timezone
+from django.conf import settings
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('saloon', '0010_commission_accrual'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='PayrollRun',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('created_at', models.DateTimeField(auto_now_add=True, verbose_name='Created at')),
+                ('modified_at', models.DateTimeField(auto_now=True, verbose_name='Modified at')),
+                ('start_date', models.DateField(verbose_name='Start date')),
+                ('end_date', models.DateField(verbose_name='End date')),
+                ('date_payment', models.DateField(default=django.utils.timezone.now, verbose_name='Payment date')),
+                ('total', models.DecimalField(decimal_places=2, default=0, max_digits=19, verbose_name='Total')),
+                ('cashregister', models.ForeignKey(on_delete=django.db.models.deletion.PROTECT, related_name='payroll_runs', to='saloon.cashregister', verbose_name='Cash Register')),
+                ('created_by', models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.SET_NULL, to=settings.AUTH_USER_MODEL, verbose_name='Created by')),
+                ('payment_type', models.ForeignKey(on_delete=django.db.models.deletion.PROTECT, to='saloon.paymenttype', verbose_name='Payment type')),
+                ('salon', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='payroll_runs', to='saloon.salon', verbose_name='Salon')),
+            ],
+            options={
+                'ordering': ['-created_at'],
+            },
+        ),
+        migrations.AddField(
+            model_name='payment',
+            name='payroll_run',
+            field=models.ForeignKey(blank=True, editable=False, null=True, on_delete=django.db.models.deletion.PROTECT, related_name='payments', to='saloon.payrollrun', verbose_name='Payroll run'),
+        ),
+        migrations.AddConstraint(
+            model_name='payment',
+            constraint=models.UniqueConstraint(condition=models.Q(('payroll_run__isnull', False)), fields=('barber', 'start_date', 'end_date'), name='saloon_payment_unique_payroll_period'),
+        ),
+    ]
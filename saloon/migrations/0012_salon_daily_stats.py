@@ -0,0 +1,37 @@
+# Generated by Django 5.1.1 on 2026-10-18 18:03
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('saloon', '0011_payroll_run'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='SalonDailyStats',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('day', models.DateField(verbose_name='Day')),
+                ('shave_count', models.IntegerField(default=0, verbose_name='Shaves')),
+                ('revenue', models.DecimalField(decimal_places=2, default=0, max_digits=19, verbose_name='Revenue')),
+                ('income', models.DecimalField(decimal_places=2, default=0, max_digits=19, verbose_name='Income')),
+                ('expenses', models.DecimalField(decimal_places=2, default=0, max_digits=19, verbose_name='Expenses')),
+                ('payments', models.DecimalField(decimal_places=2, default=0, max_digits=19, verbose_name='Payments')),
+                ('purchases', models.DecimalField(decimal_places=2, default=0, max_digits=19, verbose_name='Purchases')),
+                ('items_cost', models.DecimalField(decimal_places=2, default=0, max_digits=19, verbose_name='Items cost')),
+                ('barber', models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.CASCADE, related_name='daily_stats', to='saloon.barber', verbose_name='Barber')),
+                ('cashregister', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='daily_stats', to='saloon.cashregister', verbose_name='Cash Register')),
+                ('salon', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='daily_stats', to='saloon.salon', verbose_name='Salon')),
+            ],
+            options={
+                'verbose_name': 'Salon daily stats',
+                'verbose_name_plural': 'Salon daily stats',
+                'indexes': [models.Index(fields=['salon', 'day'], name='saloon_dailystats_salon_day')],
+                'constraints': [models.UniqueConstraint(condition=models.Q(('barber__isnull', False)), fields=('salon', 'day', 'cashregister', 'barber'), name='saloon_dailystats_unique_barber_day'), models.UniqueConstraint(condition=models.Q(('barber__isnull', True)), fields=('salon', 'day', 'cashregister'), name='saloon_dailystats_unique_day')],
+            },
+        ),
+    ]
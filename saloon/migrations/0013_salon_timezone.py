@@ -0,0 +1,19 @@
+# Generated by Django 5.1.1 on 2026-10-18 18:07
+
+import saloon.models
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('saloon', '0012_salon_daily_stats'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='salon',
+            name='timezone',
+            field=models.CharField(default='UTC', max_length=64, validators=[saloon.models.validate_timezone], verbose_name='Time zone'),
+        ),
+    ]
@@ -0,0 +1,39 @@
+# Generated by Django 5.1.1 on 2026-10-18 18:16
+
+from django.conf import settings
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('saloon', '0013_salon_timezone'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='client',
+            index=models.Index(fields=['salon', 'name', 'id'], name='saloon_client_salon_name'),
+        ),
+        migrations.AddIndex(
+            model_name='itempurchase',
+            index=models.Index(fields=['salon', 'purchase_date', 'id'], name='saloon_itempurchase_salon_date'),
+        ),
+        migrations.AddIndex(
+            model_name='itemused',
+            index=models.Index(fields=['salon', 'used_date', 'id'], name='saloon_itemused_salon_date'),
+        ),
+        migrations.AddIndex(
+            model_name='payment',
+            index=models.Index(fields=['salon', 'date_payment', 'id'], name='saloon_payment_salon_date'),
+        ),
+        migrations.AddIndex(
+            model_name='shave',
+            index=models.Index(fields=['salon', 'date_shave', 'id'], name='saloon_shave_salon_date'),
+        ),
+        migrations.AddIndex(
+            model_name='transaction',
+            index=models.Index(fields=['salon', 'date_trans', 'id'], name='saloon_transaction_salon_date'),
+        ),
+    ]
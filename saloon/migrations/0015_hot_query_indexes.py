@@ -0,0 +1,41 @@
+# Generated by Django 5.1.1 on 2026-10-18 18:18
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('saloon', '0014_keyset_indexes'),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='commission',
+            index=models.Index(fields=['barber', 'effective_date'], name='saloon_commission_barber_date'),
+        ),
+        migrations.AddIndex(
+            model_name='hairstyletariffhistory',
+            index=models.Index(fields=['hairstyle', 'effective_date'], name='saloon_tariff_hairstyle_date'),
+        ),
+        migrations.AddIndex(
+            model_name='payment',
+            index=models.Index(fields=['barber', 'date_payment'], name='saloon_payment_barber_date'),
+        ),
+        migrations.AddIndex(
+            model_name='shave',
+            index=models.Index(condition=models.Q(('status', 'COMPLETED')), fields=['salon', 'date_shave'], name='saloon_shave_done_salon_date'),
+        ),
+        migrations.AddIndex(
+            model_name='shave',
+            index=models.Index(condition=models.Q(('status', 'COMPLETED')), fields=['barber', 'date_shave'], name='saloon_shave_done_barber_date'),
+        ),
+        migrations.AddIndex(
+            model_name='shave',
+            index=models.Index(condition=models.Q(('status', 'COMPLETED')), fields=['cashregister', 'date_shave'], name='saloon_shave_done_register'),
+        ),
+        migrations.AddIndex(
+            model_name='transaction',
+            index=models.Index(fields=['cashregister', 'trans_type', 'date_trans'], name='saloon_trans_register_type'),
+        ),
+    ]
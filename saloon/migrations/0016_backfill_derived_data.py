@@ -0,0 +1,25 @@
+from django.core.management import call_command
+from django.db import migrations
+
+
+def backfill(apps, schema_editor):
+    # The costs and lots of 0007 and 0008, the accruals of 0010 and the daily stats of 0012 start empty: fill them
+    # from the existing history once, with the management commands. Item costs and lots first (which also recomputes
+    # the registers whose profit they change), as the stats count the cost of the items used. A new database has no
+    # history and skips the commands, which use the current models.
+    if not any(apps.get_model('saloon', name).objects.exists() for name in ('Shave', 'ItemPurchase', 'Transaction', 'Payment')):
+        return
+    call_command('rebuild_item_costs')
+    call_command('accrue_commissions')
+    call_command('rebuild_daily_stats')
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('saloon', '0015_hot_query_indexes'),
+    ]
+
+    operations = [
+        migrations.RunPython(backfill, migrations.RunPython.noop),
+    ]
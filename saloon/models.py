@@ -7,12 +7,17 @@ from django.core.exceptions import ValidationError
 from django.db.models import Sum, F
 from django.utils import timezone
 from django.conf import settings
-from decimal import Decimal
+from decimal import Decimal, ROUND_HALF_UP
+import zoneinfo
 
 # Constants
 DECIMAL_MAX_DIGITS = 19
 DECIMAL_PLACES = 2
 
+def validate_timezone(value):
+    if value not in zoneinfo.available_timezones():
+        raise ValidationError(_("Unknown time zone."))
+
 class TimestampMixin(models.Model):
     created_at = models.DateTimeField(_("Created at"), auto_now_add=True)
     modified_at = models.DateTimeField(_("Modified at"), auto_now=True)
@@ -20,7 +25,23 @@ class TimestampMixin(models.Model):
     class Meta:
         abstract = True
 
-class Salon(TimestampMixin):
+class LoadedValuesMixin(models.Model):
+    # Remembers the values read from the database so that edits can reverse their previous effect
+    _loaded_values = None
+
+    class Meta:
+        abstract = True
+
+    @classmethod
+    def from_db(cls, db, field_names, values):
+        instance = super().from_db(db, field_names, values)
+        instance._loaded_values = dict(zip(field_names, values))
+        return instance
+
+    def get_current_values(self):
+        return {field.attname: getattr(self, field.attname) for field in self._meta.concrete_fields}
+
+class Salon(LoadedValuesMixin, TimestampMixin):
     name = models.CharField(_("Name"), max_length=255, unique=True)
     description = models.TextField(_("Description"), blank=True)
     address = models.CharField(_("Address"), max_length=255, blank=True, null=True)
@@ -30,10 +51,16 @@ class Salon(TimestampMixin):
     owner = models.ForeignKey(settings.AUTH_USER_MODEL, on_delete=models.CASCADE, related_name='owned_salons', verbose_name=_("Owner"))
     image = models.ImageField(_("Image"), upload_to='salons/', null=True, blank=True)
     is_active = models.BooleanField(_("Is active"), default=True)
+    # Business days (daily stats and reports) follow the salon's local time
+    timezone = models.CharField(_("Time zone"), max_length=64, default=settings.TIME_ZONE, validators=[validate_timezone])
 
     def __str__(self):
         return self.name
 
+    @property
+    def tzinfo(self):
+        return zoneinfo.ZoneInfo(self.timezone)
+
 class BarberType(TimestampMixin):
     name = models.CharField(_("Name"), max_length=255)
     description = models.TextField(_("Description"), blank=True)
@@ -82,7 +109,13 @@ class Client(TimestampMixin):
     def __str__(self):
         return self.name
 
-class Commission(TimestampMixin):
+    class Meta:
+        indexes = [
+            # Keyset pages of the client list
+            models.Index(fields=['salon', 'name', 'id'], name='saloon_client_salon_name'),
+        ]
+
+class Commission(LoadedValuesMixin, TimestampMixin):
     barber = models.ForeignKey(Barber, on_delete=models.CASCADE, related_name='commissions', verbose_name=_("Barber"))
     percentage = models.DecimalField(_("Commission Percentage"), max_digits=5, decimal_places=2, default=0.00) 
     fixed_amount = models.DecimalField(_("Fixed Amount"), max_digits=DECIMAL_MAX_DIGITS, decimal_places=DECIMAL_PLACES, default=0.00) 
@@ -93,6 +126,10 @@ class Commission(TimestampMixin):
 
     class Meta:
         ordering = ['-effective_date']
+        indexes = [
+            # Commission schedules of barbers
+            models.Index(fields=['barber', 'effective_date'], name='saloon_commission_barber_date'),
+        ]
 
 class Currency(TimestampMixin):
     code = models.CharField(_("Code"), max_length=3)
@@ -112,10 +149,67 @@ class CashRegister(TimestampMixin):
     balance_cash = models.DecimalField(_("Cash Balance"), max_digits=DECIMAL_MAX_DIGITS, decimal_places=DECIMAL_PLACES, default=0)
     currency = models.ForeignKey(Currency, on_delete=models.PROTECT, related_name='cash_registers')
     salon = models.ForeignKey(Salon, on_delete=models.CASCADE, related_name='cash_registers', verbose_name=_("Salon"))
+    # Last time the balances were recomputed from the full history
+    reconciled_at = models.DateTimeField(_("Reconciled at"), null=True, blank=True, editable=False, db_index=True)
         
     def __str__(self):
         return f"{self.name} - {self.salon.name}"
 
+class RegisterClose(TimestampMixin):
+    # Z-report: the totals of one day for a cash register and its balances at the end of that day
+    cashregister = models.ForeignKey(CashRegister, on_delete=models.CASCADE, related_name='closes', verbose_name=_("Cash Register"))
+    date = models.DateField(_("Date"))
+    income = models.DecimalField(_("Income"), max_digits=DECIMAL_MAX_DIGITS, decimal_places=DECIMAL_PLACES, default=0)
+    expense = models.DecimalField(_("Expense"), max_digits=DECIMAL_MAX_DIGITS, decimal_places=DECIMAL_PLACES, default=0)
+    payments = models.DecimalField(_("Payments"), max_digits=DECIMAL_MAX_DIGITS, decimal_places=DECIMAL_PLACES, default=0)
+    purchases = models.DecimalField(_("Purchases"), max_digits=DECIMAL_MAX_DIGITS, decimal_places=DECIMAL_PLACES, default=0)
+    items_cost = models.DecimalField(_("Items cost"), max_digits=DECIMAL_MAX_DIGITS, decimal_places=DECIMAL_PLACES, default=0)
+    balance_cash = models.DecimalField(_("Closing Cash Balance"), max_digits=DECIMAL_MAX_DIGITS, decimal_places=DECIMAL_PLACES, default=0)
+    balance_profit = models.DecimalField(_("Closing Profit Balance"), max_digits=DECIMAL_MAX_DIGITS, decimal_places=DECIMAL_PLACES, default=0)
+    salon = models.ForeignKey(Salon, on_delete=models.CASCADE, related_name='register_closes', verbose_name=_("Salon"))
+
+    def __str__(self):
+        return f"{self.cashregister.name} - {self.date}"
+
+    class Meta:
+        ordering = ['-date']
+        unique_together = ('cashregister', 'date')
+
+class SalonDailyStats(models.Model):
+    # Daily totals in the default currency per cash register and barber (null for transactions and purchases),
+    # kept up to date by the signals and rebuilt by the rebuild_daily_stats command
+    salon = models.ForeignKey(Salon, on_delete=models.CASCADE, related_name='daily_stats', verbose_name=_("Salon"))
+    day = models.DateField(_("Day"))
+    cashregister = models.ForeignKey(CashRegister, on_delete=models.CASCADE, related_name='daily_stats', verbose_name=_("Cash Register"))
+    barber = models.ForeignKey(Barber, on_delete=models.CASCADE, null=True, blank=True, related_name='daily_stats', verbose_name=_("Barber"))
+    shave_count = models.IntegerField(_("Shaves"), default=0)
+    revenue = models.DecimalField(_("Revenue"), max_digits=DECIMAL_MAX_DIGITS, decimal_places=DECIMAL_PLACES, default=0)
+    income = models.DecimalField(_("Income"), max_digits=DECIMAL_MAX_DIGITS, decimal_places=DECIMAL_PLACES, default=0)
+    expenses = models.DecimalField(_("Expenses"), max_digits=DECIMAL_MAX_DIGITS, decimal_places=DECIMAL_PLACES, default=0)
+    payments = models.DecimalField(_("Payments"), max_digits=DECIMAL_MAX_DIGITS, decimal_places=DECIMAL_PLACES, default=0)
+    purchases = models.DecimalField(_("Purchases"), max_digits=DECIMAL_MAX_DIGITS, decimal_places=DECIMAL_PLACES, default=0)
+    items_cost = models.DecimalField(_("Items cost"), max_digits=DECIMAL_MAX_DIGITS, decimal_places=DECIMAL_PLACES, default=0)
+
+    def __str__(self):
+        return f"{self.salon.name} - {self.day}"
+
+    class Meta:
+        verbose_name = _("Salon daily stats")
+        verbose_name_plural = _("Salon daily stats")
+        indexes = [
+            models.Index(fields=['salon', 'day'], name='saloon_dailystats_salon_day'),
+        ]
+        constraints = [
+            models.UniqueConstraint(
+                fields=['salon', 'day', 'cashregister', 'barber'], condition=models.Q(barber__isnull=False),
+                name='saloon_dailystats_unique_barber_day',
+            ),
+            models.UniqueConstraint(
+                fields=['salon', 'day', 'cashregister'], condition=models.Q(barber__isnull=True),
+                name='saloon_dailystats_unique_day',
+            ),
+        ]
+
 class PaymentType(TimestampMixin):
     name = models.CharField(_("Name"), max_length=50)
     description = models.TextField(_("Description"), blank=True)
@@ -125,7 +219,40 @@ class PaymentType(TimestampMixin):
     def __str__(self):
         return self.name
 
-class Payment(TimestampMixin):
+class PayrollRun(TimestampMixin):
+    # One batch of commission payments for all the barbers of a salon over a period
+    salon = models.ForeignKey(Salon, on_delete=models.CASCADE, related_name='payroll_runs', verbose_name=_("Salon"))
+    cashregister = models.ForeignKey(CashRegister, on_delete=models.PROTECT, related_name='payroll_runs', verbose_name=_("Cash Register"))
+    payment_type = models.ForeignKey(PaymentType, on_delete=models.PROTECT, verbose_name=_("Payment type"))
+    start_date = models.DateField(_("Start date"))
+    end_date = models.DateField(_("End date"))
+    date_payment = models.DateField(_("Payment date"), default=timezone.now)
+    total = models.DecimalField(_("Total"), max_digits=DECIMAL_MAX_DIGITS, decimal_places=DECIMAL_PLACES, default=0)
+    created_by = models.ForeignKey(settings.AUTH_USER_MODEL, on_delete=models.SET_NULL, null=True, blank=True, verbose_name=_("Created by"))
+
+    def __str__(self):
+        return f"{self.salon.name} - {self.start_date} / {self.end_date}"
+
+    def clean(self):
+        if self.start_date and self.end_date and self.start_date > self.end_date:
+            raise ValidationError(_("Start date must be before end date."))
+        if self.cashregister.salon != self.salon or self.payment_type.salon != self.salon:
+            raise ValidationError(_("Cash register and payment type must belong to the same salon as the payroll run."))
+        if self.start_date and self.end_date:
+            # A period paid twice would pay the shared days twice
+            overlapping = PayrollRun.objects.filter(
+                salon_id=self.salon_id, start_date__lte=self.end_date, end_date__gte=self.start_date
+            ).exclude(pk=self.pk).order_by('start_date').first()
+            if overlapping:
+                raise ValidationError(
+                    _("This period overlaps the payroll run from %(start)s to %(end)s.")
+                    % {'start': overlapping.start_date, 'end': overlapping.end_date}
+                )
+
+    class Meta:
+        ordering = ['-created_at']
+
+class Payment(LoadedValuesMixin, TimestampMixin):
     barber = models.ForeignKey(Barber, on_delete=models.CASCADE, related_name='payments', verbose_name=_("Barber"))
     amount = models.DecimalField(_("Amount"), max_digits=DECIMAL_MAX_DIGITS, decimal_places=DECIMAL_PLACES)
     currency = models.ForeignKey(Currency, on_delete=models.PROTECT, verbose_name=_("Currency"))
@@ -137,6 +264,7 @@ class Payment(TimestampMixin):
     cashregister = models.ForeignKey(CashRegister, on_delete=models.CASCADE, related_name='payments', verbose_name=_("Cash Register"))
     date_payment = models.DateField(_("Payment date"), default=timezone.now)
     salon = models.ForeignKey(Salon, on_delete=models.CASCADE, related_name='payments', verbose_name=_("Salon"))
+    payroll_run = models.ForeignKey(PayrollRun, on_delete=models.PROTECT, null=True, blank=True, editable=False, related_name='payments', verbose_name=_("Payroll run"))
 
     def __str__(self):
         return f"{self.barber} - {self.amount} {self.currency.code} - {self.payment_type}"
@@ -149,7 +277,22 @@ class Payment(TimestampMixin):
         if self.barber.salon != self.salon:
             raise ValidationError(_("Barber must belong to the same salon as the payment."))
 
-class Transaction(TimestampMixin):
+    class Meta:
+        constraints = [
+            # A barber is paid at most once per period by payroll runs
+            models.UniqueConstraint(
+                fields=['barber', 'start_date', 'end_date'], condition=models.Q(payroll_run__isnull=False),
+                name='saloon_payment_unique_payroll_period',
+            ),
+        ]
+        indexes = [
+            # Keyset pages of the payment list
+            models.Index(fields=['salon', 'date_payment', 'id'], name='saloon_payment_salon_date'),
+            # Payments of a barber over a period (balances, payroll)
+            models.Index(fields=['barber', 'date_payment'], name='saloon_payment_barber_date'),
+        ]
+
+class Transaction(LoadedValuesMixin, TimestampMixin):
     class TransactionType(models.TextChoices):
         INCOME = 'INCOME', _('Income')
         EXPENSE = 'EXPENSE', _('Expense')
@@ -175,6 +318,12 @@ class Transaction(TimestampMixin):
 
     class Meta:
         unique_together = ['trans_name', 'salon', 'date_trans']
+        indexes = [
+            # Keyset pages of the transaction list
+            models.Index(fields=['salon', 'date_trans', 'id'], name='saloon_transaction_salon_date'),
+            # Register totals and closes split by type
+            models.Index(fields=['cashregister', 'trans_type', 'date_trans'], name='saloon_trans_register_type'),
+        ]
 
 class Hairstyle(TimestampMixin):
     name = models.CharField(_("Name"), max_length=255)
@@ -203,8 +352,11 @@ class HairstyleTariffHistory(TimestampMixin):
 
     class Meta:
         ordering = ['-effective_date']
+        indexes = [
+            models.Index(fields=['hairstyle', 'effective_date'], name='saloon_tariff_hairstyle_date'),
+        ]
 
-class Shave(TimestampMixin):
+class Shave(LoadedValuesMixin, TimestampMixin):
     class Status(models.TextChoices):
         SCHEDULED = 'SCHEDULED', _('Scheduled')
         IN_PROGRESS = 'IN_PROGRESS', _('In Progress')
@@ -236,6 +388,36 @@ class Shave(TimestampMixin):
         if self.cashregister.salon != self.salon:
             raise ValidationError(_("Cash register must belong to the same salon as the shave."))
 
+    class Meta:
+        indexes = [
+            # Keyset pages of the shave list
+            models.Index(fields=['salon', 'date_shave', 'id'], name='saloon_shave_salon_date'),
+            # Completed shaves only: stats rebuilds per salon, commissions per barber, totals and closes per register
+            models.Index(fields=['salon', 'date_shave'], condition=models.Q(status='COMPLETED'), name='saloon_shave_done_salon_date'),
+            models.Index(fields=['barber', 'date_shave'], condition=models.Q(status='COMPLETED'), name='saloon_shave_done_barber_date'),
+            models.Index(fields=['cashregister', 'date_shave'], condition=models.Q(status='COMPLETED'), name='saloon_shave_done_register'),
+        ]
+
+class CommissionAccrual(TimestampMixin):
+    # Commission earned on a completed shave, with the schedule entry it was computed from
+    shave = models.OneToOneField(Shave, on_delete=models.CASCADE, related_name='commission_accrual', verbose_name=_("Shave"))
+    barber = models.ForeignKey(Barber, on_delete=models.CASCADE, related_name='commission_accruals', verbose_name=_("Barber"))
+    commission = models.ForeignKey(Commission, on_delete=models.SET_NULL, null=True, related_name='accruals', verbose_name=_("Commission"))
+    date = models.DateTimeField(_("Date"))
+    percentage = models.DecimalField(_("Commission Percentage"), max_digits=5, decimal_places=2)
+    fixed_amount = models.DecimalField(_("Fixed Amount"), max_digits=DECIMAL_MAX_DIGITS, decimal_places=DECIMAL_PLACES)
+    # Unrounded: percentages of amounts in cents need up to 6 decimals
+    amount = models.DecimalField(_("Amount"), max_digits=DECIMAL_MAX_DIGITS + 4, decimal_places=6)
+    salon = models.ForeignKey(Salon, on_delete=models.CASCADE, related_name='commission_accruals', verbose_name=_("Salon"))
+
+    def __str__(self):
+        return f"{self.barber} - {self.amount} - {self.date}"
+
+    class Meta:
+        indexes = [
+            models.Index(fields=['barber', 'date'], name='saloon_accrual_barber_date'),
+        ]
+
 class Item(TimestampMixin):
     name = models.CharField(_("Name"), max_length=255)
     item_purpose = models.ManyToManyField(Hairstyle, related_name='items', verbose_name=_("Item purpose"))
@@ -245,6 +427,9 @@ class Item(TimestampMixin):
     amount_in_default_currency = models.DecimalField(_("Amount in default currency"), max_digits=DECIMAL_MAX_DIGITS, decimal_places=DECIMAL_PLACES)
     salon = models.ForeignKey(Salon, on_delete=models.CASCADE, related_name='items', verbose_name=_("Salon"))
     current_stock = models.PositiveIntegerField(_("Current stock"), default=0)
+    # Moving weighted average: value of the stock on hand and its unit cost, kept up to date by the signals
+    stock_value = models.DecimalField(_("Stock value"), max_digits=DECIMAL_MAX_DIGITS, decimal_places=DECIMAL_PLACES, default=0, editable=False)
+    average_cost = models.DecimalField(_("Average unit cost"), max_digits=DECIMAL_MAX_DIGITS, decimal_places=6, default=0, editable=False)
 
     def __str__(self):
         return f"{self.name} - {self.salon.name}"
@@ -258,7 +443,7 @@ class Item(TimestampMixin):
         verbose_name_plural = _("Items")
         unique_together = ['name', 'salon']
 
-class ItemUsed(TimestampMixin):
+class ItemUsed(LoadedValuesMixin, TimestampMixin):
     item = models.ForeignKey(Item, on_delete=models.CASCADE, related_name='uses', verbose_name=_("Item"))
     shave = models.ForeignKey(Shave, on_delete=models.CASCADE, related_name='items_used', verbose_name=_("Shave"))
     barber = models.ForeignKey(Barber, on_delete=models.PROTECT, verbose_name=_("Barber"))
@@ -266,10 +451,20 @@ class ItemUsed(TimestampMixin):
     note = models.TextField(_("Note"), blank=True)
     used_date = models.DateField(_("Used date"), default=timezone.now)
     salon = models.ForeignKey(Salon, on_delete=models.CASCADE, related_name='items_used', verbose_name=_("Salon"))
+    # Average cost of the item when it was used
+    unit_cost = models.DecimalField(_("Unit cost"), max_digits=DECIMAL_MAX_DIGITS, decimal_places=6, default=0, editable=False)
+    cost_in_default_currency = models.DecimalField(_("Cost in default currency"), max_digits=DECIMAL_MAX_DIGITS, decimal_places=DECIMAL_PLACES, default=0, editable=False)
 
     def __str__(self):
         return f"{self.item} - {self.quantity} - {self.shave}"
 
+    def save(self, *args, **kwargs):
+        if self._state.adding or not self._loaded_values or self._loaded_values.get('item_id') != self.item_id:
+            self.unit_cost = Item.objects.filter(pk=self.item_id).values_list('average_cost', flat=True).first() or Decimal('0')
+        if self.quantity is not None:
+            self.cost_in_default_currency = (self.unit_cost * self.quantity).quantize(Decimal('0.01'), rounding=ROUND_HALF_UP)
+        super().save(*args, **kwargs)
+
     def clean(self):
         if self.quantity <= 0:
             raise ValidationError(_("Quantity must be positive."))
@@ -282,14 +477,15 @@ class ItemUsed(TimestampMixin):
 
     class Meta:
         unique_together = ('item', 'shave', 'salon')
+        indexes = [
+            # Keyset pages of the items used list
+            models.Index(fields=['salon', 'used_date', 'id'], name='saloon_itemused_salon_date'),
+        ]
 
     def get_amount_in_default_currency(self):
-        avg_purchase_price = self.item.purchases.aggregate(
-            avg_price=Sum('purchase_price_in_default_currency') / Sum('quantity')
-        )['avg_price'] or Decimal('0.00')
-        return avg_purchase_price * self.quantity
+        return self.cost_in_default_currency
 
-class ItemPurchase(TimestampMixin):
+class ItemPurchase(LoadedValuesMixin, TimestampMixin):
     item = models.ForeignKey(Item, on_delete=models.CASCADE, related_name='purchases', verbose_name=_("Item"))
     quantity = models.PositiveIntegerField(_("Quantity"))
     purchase_price = models.DecimalField(_("Purchase price"), max_digits=DECIMAL_MAX_DIGITS, decimal_places=DECIMAL_PLACES)
@@ -301,6 +497,8 @@ class ItemPurchase(TimestampMixin):
     supplier = models.CharField(_("Supplier"), max_length=255, blank=True)
     cashregister = models.ForeignKey(CashRegister, on_delete=models.PROTECT, related_name='purchases', verbose_name=_("Cash Register"))
     salon = models.ForeignKey(Salon, on_delete=models.CASCADE, related_name='item_purchases', verbose_name=_("Salon"))
+    # FIFO lot: quantity of this purchase not consumed by items used yet
+    remaining_quantity = models.PositiveIntegerField(_("Remaining quantity"), default=0, editable=False)
 
     def __str__(self):
         return f"{self.item.name} - {self.quantity} - {self.purchase_date}"
@@ -310,15 +508,18 @@ class ItemPurchase(TimestampMixin):
             self.total_purchase_price = self.purchase_price * self.quantity
             if self.exchange_rate is not None:
                 self.purchase_price_in_default_currency = self.total_purchase_price * self.exchange_rate
+        if self._state.adding:
+            self.remaining_quantity = self.quantity
+        elif kwargs.get('update_fields') is None:
+            # The remaining quantity is only changed by the lot consumption, under a row lock
+            kwargs['update_fields'] = [
+                field.name for field in self._meta.concrete_fields
+                if not field.primary_key and field.name != 'remaining_quantity'
+            ]
         super().save(*args, **kwargs)
     
-    @classmethod
-    def from_db(cls, db, field_names, values):
-        instance = super().from_db(db, field_names, values)
-        instance._loaded_values = dict(zip(field_names, values))
-        return instance
     def calculate_total_purchase_price(self):
-        if 'quantity' in self._loaded_values and 'purchase_price' in self._loaded_values:
+        if self._loaded_values and 'quantity' in self._loaded_values and 'purchase_price' in self._loaded_values:
             return self._loaded_values['purchase_price'] * self._loaded_values['quantity']
         return self.quantity * self.purchase_price
     
@@ -329,4 +530,25 @@ class ItemPurchase(TimestampMixin):
             raise ValidationError(_("Quantity must be positive."))
         if self.item.salon != self.salon or self.cashregister.salon != self.salon:
             raise ValidationError(_("Item and Cash Register must belong to the same salon as the purchase."))
+        if self.pk and self._loaded_values and 'remaining_quantity' in self._loaded_values:
+            consumed = self._loaded_values['quantity'] - self._loaded_values['remaining_quantity']
+            if self.quantity < consumed:
+                raise ValidationError(_("Quantity cannot be lower than the quantity already used."))
+
+    class Meta:
+        indexes = [
+            # Oldest open lot of an item
+            models.Index(fields=['item', 'purchase_date', 'id'], condition=models.Q(remaining_quantity__gt=0), name='saloon_itempurchase_open_lot'),
+            # Keyset pages of the purchase list
+            models.Index(fields=['salon', 'purchase_date', 'id'], name='saloon_itempurchase_salon_date'),
+        ]
+
+class ItemLotConsumption(TimestampMixin):
+    item_used = models.ForeignKey(ItemUsed, on_delete=models.CASCADE, related_name='lot_consumptions', verbose_name=_("Item used"))
+    purchase = models.ForeignKey(ItemPurchase, on_delete=models.CASCADE, related_name='consumptions', verbose_name=_("Purchase"))
+    quantity = models.PositiveIntegerField(_("Quantity"))
+    unit_cost = models.DecimalField(_("Unit cost"), max_digits=DECIMAL_MAX_DIGITS, decimal_places=6)
+
+    def __str__(self):
+        return f"{self.item_used} - {self.quantity} x {self.unit_cost}"
 
@@ -0,0 +1,59 @@
+# routers.py
+
+import threading
+from contextlib import contextmanager
+from django.conf import settings
+from django.db import connections
+
+REPLICA = 'replica'
+
+_state = threading.local()
+
+def replica_configured():
+    return REPLICA in settings.DATABASES
+
+@contextmanager
+def read_from_replica(enabled=True):
+    # Reads made inside the block may go to the replica; writes always go to the primary
+    # has_written() tells whether the block wrote; an enclosing block also sees the writes of the inner ones
+    previous = getattr(_state, 'use_replica', False), getattr(_state, 'wrote', False)
+    _state.use_replica, _state.wrote = enabled and replica_configured(), False
+    try:
+        yield
+    finally:
+        _state.use_replica, _state.wrote = previous[0], previous[1] or _state.wrote
+
+def replica_reads_enabled():
+    return getattr(_state, 'use_replica', False) and not getattr(_state, 'wrote', False)
+
+def has_written():
+    return getattr(_state, 'wrote', False)
+
+class ReplicaRouter:
+    """
+    Sends the reads of read_from_replica() blocks to the replica, unless the same block already wrote
+    or a transaction is open on the primary, where the replica could not see the uncommitted rows.
+    Only the saloon models are routed: sessions, users and the DatabaseCache table stay on the primary,
+    and writing them does not count as a write of the block.
+    """
+    app_label = 'saloon'
+
+    def db_for_read(self, model, **hints):
+        if model._meta.app_label != self.app_label:
+            return None
+        if not replica_reads_enabled() or connections['default'].in_atomic_block:
+            return None
+        return REPLICA
+
+    def db_for_write(self, model, **hints):
+        if model._meta.app_label != self.app_label:
+            return None
+        _state.wrote = True
+        return 'default'
+
+    def allow_relation(self, obj1, obj2, **hints):
+        # Both aliases hold the same data
+        return True
+
+    def allow_migrate(self, db, app_label, model_name=None, **hints):
+        return db != REPLICA
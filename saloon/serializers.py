@@ -0,0 +1,196 @@
+# serializers.py
+
+import copy
+from decimal import Decimal, ROUND_HALF_UP
+from django.core.exceptions import NON_FIELD_ERRORS, ValidationError as DjangoValidationError
+from django.db import models
+from rest_framework import serializers
+from rest_framework.settings import api_settings
+from .middleware import get_salon_context
+from .models import DECIMAL_MAX_DIGITS, DECIMAL_PLACES, Salon, Shave, Client, Item, Transaction, Payment, CashRegister
+
+def requested_fields(request):
+    # ?fields=a,b,c of a read request, None when every field is wanted
+    if request is None or request.method not in ('GET', 'HEAD'):
+        return None
+    fields = request.query_params.get('fields')
+    if not fields:
+        return None
+    return {name.strip() for name in fields.split(',') if name.strip()}
+
+class SalonScopedSerializer(serializers.ModelSerializer):
+    """
+    Serializer of the rows of the salon_id given in the context. Relations can only point at rows of that salon,
+    the model's own validation runs before saving, and ?fields= trims the representation of read requests.
+    related_fields and prefetch_fields map a field to the relations it is read through, for the view's queryset.
+    """
+    related_fields = {}
+    prefetch_fields = {}
+    # Field computed as amount * exchange_rate, like the admin and the CSV import do
+    default_currency_source = None
+
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        fields = requested_fields(self.context.get('request'))
+        if fields is not None:
+            unknown = fields - set(self.fields)
+            if unknown:
+                raise serializers.ValidationError({'fields': f"Unknown fields: {', '.join(sorted(unknown))}."})
+            for name in set(self.fields) - fields:
+                self.fields.pop(name)
+
+        salon_id = self.context.get('salon_id')
+        if salon_id is not None:
+            for field in self.fields.values():
+                relation = getattr(field, 'child_relation', field)
+                queryset = getattr(relation, 'queryset', None)
+                if queryset is not None and any(f.name == 'salon' for f in queryset.model._meta.fields):
+                    # The salon comes with the row, so the model's clean() compares salons without a query
+                    relation.queryset = queryset.filter(salon_id=salon_id).select_related('salon')
+
+    @staticmethod
+    def get_relations(mapping, fields=None):
+        return sorted({relation for name, relations in mapping.items() if fields is None or name in fields for relation in relations})
+
+    @classmethod
+    def get_select_related(cls, fields=None):
+        return cls.get_relations(cls.related_fields, fields)
+
+    @classmethod
+    def get_prefetch_related(cls, fields=None):
+        return cls.get_relations(cls.prefetch_fields, fields)
+
+    def get_salon(self):
+        return get_salon_context(self.context['request']).get_salon(self.context['salon_id'])
+
+    def validate(self, attrs):
+        attrs = super().validate(attrs)
+        model = self.Meta.model
+        if self.default_currency_source:
+            amount = attrs.get(self.default_currency_source, getattr(self.instance, self.default_currency_source, None))
+            exchange_rate = attrs.get('exchange_rate', getattr(self.instance, 'exchange_rate', Decimal('1')))
+            if amount is not None:
+                attrs['amount_in_default_currency'] = (Decimal(amount) * Decimal(exchange_rate)).quantize(Decimal('0.01'), rounding=ROUND_HALF_UP)
+
+        if self.instance is None:
+            for field in model._meta.fields:
+                # DateFields defaulting to timezone.now would hand the response a datetime instead of the stored date
+                if type(field) is models.DateField and field.has_default() and field.name not in attrs:
+                    attrs[field.name] = field.to_python(field.get_default())
+
+        many_to_many = {field.name for field in model._meta.many_to_many}
+        candidate = copy.copy(self.instance) if self.instance is not None else model()
+        for name, value in attrs.items():
+            if name not in many_to_many:
+                setattr(candidate, name, value)
+        candidate.salon = self.get_salon()
+        # full_clean() without re-fetching the relations that were already checked against the salon's rows
+        checked = many_to_many | {
+            field.name for field in model._meta.fields if field.is_relation and (field.name in attrs or field.name == 'salon')
+        }
+        try:
+            candidate.clean_fields(exclude=checked)
+            candidate.clean()
+            candidate.validate_unique(exclude=many_to_many)
+            candidate.validate_constraints(exclude=many_to_many)
+        except DjangoValidationError as e:
+            errors = serializers.as_serializer_error(e)
+            if NON_FIELD_ERRORS in errors:
+                errors[api_settings.NON_FIELD_ERRORS_KEY] = errors.pop(NON_FIELD_ERRORS)
+            raise serializers.ValidationError(errors)
+        return attrs
+
+class ShaveSerializer(SalonScopedSerializer):
+    barber_name = serializers.CharField(source='barber.user.get_full_name', read_only=True)
+    hairstyle_name = serializers.CharField(source='hairstyle.name', read_only=True)
+    currency_code = serializers.CharField(source='currency.code', read_only=True)
+    client_name = serializers.CharField(source='client.name', read_only=True, default=None)
+    related_fields = {
+        'barber_name': ('barber__user',),
+        'hairstyle_name': ('hairstyle',),
+        'currency_code': ('currency',),
+        'client_name': ('client',),
+    }
+    default_currency_source = 'amount'
+
+    class Meta:
+        model = Shave
+        fields = [
+            'id', 'barber', 'barber_name', 'hairstyle', 'hairstyle_name', 'amount', 'currency', 'currency_code',
+            'exchange_rate', 'amount_in_default_currency', 'client', 'client_name', 'cashregister', 'date_shave', 'status',
+        ]
+        read_only_fields = ['amount_in_default_currency']
+
+class ClientSerializer(SalonScopedSerializer):
+    class Meta:
+        model = Client
+        fields = ['id', 'name', 'address', 'phone']
+
+class ItemSerializer(SalonScopedSerializer):
+    currency_code = serializers.CharField(source='currency.code', read_only=True)
+    # Annotated by InventoryService.annotate_valuation on the view's queryset
+    remaining_quantity = serializers.IntegerField(read_only=True)
+    remaining_value = serializers.DecimalField(max_digits=DECIMAL_MAX_DIGITS, decimal_places=DECIMAL_PLACES, read_only=True)
+    # Unit cost at the precision of the annotation, not rounded to cents
+    avg_remaining_price = serializers.DecimalField(max_digits=19, decimal_places=6, read_only=True, default=None)
+    related_fields = {'currency_code': ('currency',)}
+    prefetch_fields = {'item_purpose': ('item_purpose',)}
+    default_currency_source = 'price'
+
+    class Meta:
+        model = Item
+        fields = [
+            'id', 'name', 'item_purpose', 'price', 'currency', 'currency_code', 'exchange_rate', 'amount_in_default_currency',
+            'remaining_quantity', 'remaining_value', 'avg_remaining_price',
+        ]
+        read_only_fields = ['amount_in_default_currency']
+
+class TransactionSerializer(SalonScopedSerializer):
+    currency_code = serializers.CharField(source='currency.code', read_only=True)
+    cashregister_name = serializers.CharField(source='cashregister.name', read_only=True)
+    related_fields = {'currency_code': ('currency',), 'cashregister_name': ('cashregister',)}
+    default_currency_source = 'amount'
+
+    class Meta:
+        model = Transaction
+        fields = [
+            'id', 'trans_name', 'trans_type', 'amount', 'currency', 'currency_code', 'exchange_rate',
+            'amount_in_default_currency', 'date_trans', 'cashregister', 'cashregister_name',
+        ]
+        read_only_fields = ['amount_in_default_currency']
+
+class PaymentSerializer(SalonScopedSerializer):
+    barber_name = serializers.CharField(source='barber.user.get_full_name', read_only=True)
+    currency_code = serializers.CharField(source='currency.code', read_only=True)
+    payment_type_name = serializers.CharField(source='payment_type.name', read_only=True)
+    cashregister_name = serializers.CharField(source='cashregister.name', read_only=True)
+    related_fields = {
+        'barber_name': ('barber__user',),
+        'currency_code': ('currency',),
+        'payment_type_name': ('payment_type',),
+        'cashregister_name': ('cashregister',),
+    }
+    default_currency_source = 'amount'
+
+    class Meta:
+        model = Payment
+        fields = [
+            'id', 'barber', 'barber_name', 'amount', 'currency', 'currency_code', 'exchange_rate', 'amount_in_default_currency',
+            'start_date', 'end_date', 'date_payment', 'payment_type', 'payment_type_name', 'cashregister', 'cashregister_name',
+            'payroll_run',
+        ]
+        read_only_fields = ['amount_in_default_currency', 'payroll_run']
+
+class CashRegisterSerializer(SalonScopedSerializer):
+    currency_code = serializers.CharField(source='currency.code', read_only=True)
+    related_fields = {'currency_code': ('currency',)}
+
+    class Meta:
+        model = CashRegister
+        fields = ['id', 'name', 'currency', 'currency_code', 'balance_cash', 'balance_profit', 'reconciled_at']
+        read_only_fields = ['balance_cash', 'balance_profit', 'reconciled_at']
+
+class SalonSerializer(serializers.ModelSerializer):
+    class Meta:
+        model = Salon
+        fields = ['id', 'name', 'address', 'phone', 'email', 'timezone', 'is_active']
@@ -1,23 +1,77 @@
 # services.py
 
+import threading
+import zoneinfo
+from bisect import bisect_right
+from contextlib import contextmanager
 from decimal import Decimal, ROUND_HALF_UP
-from django.db.models import Sum, F, Q, Count, OuterRef, Subquery, Avg
+from functools import partial
+from itertools import chain
+from time import perf_counter
+from django.core.exceptions import ValidationError
+from django.db import transaction, IntegrityError
+from django.db.models import Sum, F, Q, Count, OuterRef, Subquery, Avg, DecimalField, FloatField, Case, When, Exists, Func, Value, IntegerField
+from django.db.models.functions import Cast, Coalesce, Round, TruncDate, TruncDay, TruncWeek, TruncMonth
 from django.utils import timezone
-from datetime import timedelta
+from datetime import datetime, date, time, timedelta
 
-from .models import Shave, Barber, CashRegister, Item, ItemUsed, ItemPurchase, Payment, Transaction
+from .cache import cached_report, bump_version
+from .models import (
+    Salon, Shave, Barber, Client, Hairstyle, Commission, CommissionAccrual, Currency, CashRegister, Item, ItemUsed, ItemPurchase,
+    ItemLotConsumption, Payment, Transaction, RegisterClose, SalonDailyStats
+)
+
+_deferred = threading.local()
+
+def as_day(value, tzinfo=None):
+    # Business day of a DateField/DateTimeField value, in the given or the current time zone
+    if isinstance(value, datetime):
+        return timezone.localdate(value, tzinfo) if timezone.is_aware(value) else value.date()
+    return value
+
+def day_start(day, tzinfo=None):
+    return timezone.make_aware(datetime.combine(day, time.min), tzinfo)
+
+class DecimalDivide(Func):
+    # Numeric division: SQLite keeps whole decimals as integers, so it divides as reals there
+    arg_joiner = ' / '
+    template = '(%(expressions)s)'
+    output_field = DecimalField(max_digits=19, decimal_places=6)
+
+    def as_sqlite(self, compiler, connection, **extra_context):
+        dividend, divisor = self.get_source_expressions()
+        clone = self.copy()
+        clone.set_source_expressions([dividend, Cast(divisor, FloatField())])
+        return super(DecimalDivide, clone).as_sqlite(compiler, connection, **extra_context)
+
+@contextmanager
+def deferred_balance_updates():
+    """
+    Collects the balance and daily stats work of every write made inside the block and applies it
+    once per cash register (and stats row) after the transaction commits. Usable as a context manager or a decorator.
+    """
+    if getattr(_deferred, 'totals', None) is not None:
+        yield
+        return
+
+    _deferred.totals = {}
+    _deferred.reconcile = {}
+    _deferred.stats = {}
+    with transaction.atomic():
+        try:
+            yield
+        finally:
+            totals, reconcile, stats = _deferred.totals, _deferred.reconcile, _deferred.stats
+            _deferred.totals = _deferred.reconcile = _deferred.stats = None
+        transaction.on_commit(partial(CashRegisterService.flush_deferred, totals, reconcile))
+        transaction.on_commit(partial(DailyStatsService.apply_totals, stats))
 
 class ShaveService:
     @staticmethod
     def get_total_shaves(salon, start_date=None, end_date=None):
-        queryset = Shave.objects.filter(salon=salon, status=Shave.Status.COMPLETED)
-        if start_date:
-            queryset = queryset.filter(date_shave__gte=start_date)
-        if end_date:
-            queryset = queryset.filter(date_shave__lte=end_date)
-        result = queryset.aggregate(
-            total_count=Count('id'),
-            total_amount=Sum('amount_in_default_currency')
+        result = DailyStatsService.get_stats(salon, start_date, end_date).aggregate(
+            total_count=Sum('shave_count'),
+            total_amount=Sum('revenue')
         )
         return {
             'total_count': result['total_count'] or 0,
@@ -35,6 +89,26 @@ class BarberService:
     def format_decimal(value):
         return Decimal(value).quantize(Decimal('0.01'), rounding=ROUND_HALF_UP)
     
+    @staticmethod
+    def get_commission_schedules(barber_ids):
+        # {barber_id: (effective dates, commissions)} sorted for as-of lookups; the latest commission wins a tie
+        schedules = {barber_id: ([], []) for barber_id in barber_ids}
+        for commission in Commission.objects.filter(barber_id__in=barber_ids).order_by('effective_date', 'pk'):
+            effective_dates, commissions = schedules[commission.barber_id]
+            effective_dates.append(commission.effective_date)
+            commissions.append(commission)
+        return schedules
+
+    @staticmethod
+    def get_commission_schedule(barber):
+        return BarberService.get_commission_schedules([barber.pk])[barber.pk]
+
+    @staticmethod
+    def get_commission_as_of(schedule, when):
+        effective_dates, commissions = schedule
+        index = bisect_right(effective_dates, when)
+        return commissions[index - 1] if index else None
+
     @staticmethod
     def calculate_commission(barber, start_date=None, end_date=None):
         shaves = Shave.objects.filter(barber=barber, status=Shave.Status.COMPLETED)
@@ -42,18 +116,67 @@ class BarberService:
             shaves = shaves.filter(date_shave__gte=start_date)
         if end_date:
             shaves = shaves.filter(date_shave__lte=end_date)
+
+        schedule = BarberService.get_commission_schedule(barber)
+        if not schedule[1]:
+            return Decimal('0.00')
         
         total_commission = Decimal('0.00')
-        for shave in shaves:
-            commission = shave.barber.commissions.filter(effective_date__lte=shave.date_shave).order_by('-effective_date').first()
+        for date_shave, amount in shaves.values_list('date_shave', 'amount_in_default_currency').iterator(chunk_size=5000):
+            commission = BarberService.get_commission_as_of(schedule, date_shave)
             if commission:
-                total_commission += (shave.amount_in_default_currency * commission.percentage / 100) + commission.fixed_amount
+                total_commission += (amount * commission.percentage / 100) + commission.fixed_amount
         
         return total_commission
 
+    @staticmethod
+    def accrue_shaves(shaves):
+        # Replaces the commission accruals of the given shaves; only completed shaves with a commission accrue
+        with transaction.atomic():
+            CommissionAccrual.objects.filter(shave__in=shaves).delete()
+            completed = list(shaves.filter(status=Shave.Status.COMPLETED).values_list(
+                'pk', 'barber_id', 'salon_id', 'date_shave', 'amount_in_default_currency'
+            ))
+            schedules = BarberService.get_commission_schedules({barber_id for _, barber_id, _, _, _ in completed})
+            accruals = []
+            for shave_id, barber_id, salon_id, date_shave, amount in completed:
+                commission = BarberService.get_commission_as_of(schedules[barber_id], date_shave)
+                if commission:
+                    accruals.append(CommissionAccrual(
+                        shave_id=shave_id, barber_id=barber_id, salon_id=salon_id, date=date_shave,
+                        commission=commission, percentage=commission.percentage, fixed_amount=commission.fixed_amount,
+                        amount=(amount * commission.percentage / 100) + commission.fixed_amount,
+                    ))
+            CommissionAccrual.objects.bulk_create(accruals, batch_size=1000)
+        return accruals
+
+    @staticmethod
+    def reaccrue_barber(barber_id, start_date=None):
+        # After a schedule change: only the shaves from the first affected date are recomputed
+        shaves = Shave.objects.filter(barber_id=barber_id)
+        if start_date:
+            shaves = shaves.filter(date_shave__gte=start_date)
+        return BarberService.accrue_shaves(shaves)
+
+    @staticmethod
+    def get_shave_accrual_changed(old, new):
+        if new['status'] != Shave.Status.COMPLETED and (old is None or old['status'] != Shave.Status.COMPLETED):
+            return False
+        fields = ('status', 'barber_id', 'salon_id', 'date_shave', 'amount_in_default_currency')
+        return old is None or any(old[field] != new[field] for field in fields)
+
+    @staticmethod
+    def get_accrued_commission(barber, start_date=None, end_date=None):
+        accruals = CommissionAccrual.objects.filter(barber=barber)
+        if start_date:
+            accruals = accruals.filter(date__gte=start_date)
+        if end_date:
+            accruals = accruals.filter(date__lte=end_date)
+        return accruals.aggregate(total=Sum('amount'))['total'] or Decimal('0.00')
+
     @staticmethod
     def calculate_balance(barber, start_date=None, end_date=None):
-        total_commission = BarberService.calculate_commission(barber, start_date, end_date)
+        total_commission = BarberService.get_accrued_commission(barber, start_date, end_date)
         payments = Payment.objects.filter(barber=barber)
         if start_date:
             payments = payments.filter(date_payment__gte=start_date)
@@ -63,46 +186,576 @@ class BarberService:
         
         return BarberService.format_decimal(total_commission) - BarberService.format_decimal(total_paid)
 
+    @staticmethod
+    def calculate_balances(barbers, start_date=None, end_date=None):
+        # {barber_id: balance} for many barbers from one grouped query on accruals and one on payments
+        barber_ids = [barber.pk for barber in barbers]
+        accruals = CommissionAccrual.objects.filter(barber_id__in=barber_ids)
+        payments = Payment.objects.filter(barber_id__in=barber_ids)
+        if start_date:
+            accruals = accruals.filter(date__gte=start_date)
+            payments = payments.filter(date_payment__gte=start_date)
+        if end_date:
+            accruals = accruals.filter(date__lte=end_date)
+            payments = payments.filter(date_payment__lte=end_date)
+        commissions = dict(accruals.values('barber').annotate(total=Sum('amount')).values_list('barber', 'total'))
+        paid = dict(payments.values('barber').annotate(total=Sum('amount_in_default_currency')).values_list('barber', 'total'))
+
+        return {
+            barber_id: BarberService.format_decimal(commissions.get(barber_id) or Decimal('0.00'))
+            - BarberService.format_decimal(paid.get(barber_id) or Decimal('0.00'))
+            for barber_id in barber_ids
+        }
+
 class CashRegisterService:
+    # Balances are maintained incrementally: every write hands its signed effect on the register
+    # to apply_entries. recompute_many recomputes everything and is only used for reconciliation.
+    # Entries are (cash_register_id, date, cash, profit); dates become days of the register's salon
+    # when applied, like the days of the closes (Z-reports).
+
+    @staticmethod
+    def get_shave_items_cost(shave_id):
+        return ItemUsed.objects.filter(shave_id=shave_id).aggregate(total=Sum('cost_in_default_currency'))['total'] or Decimal('0.00')
+
+    @staticmethod
+    def shave_entries(values, sign=1, items_cost=None):
+        if not values or values['status'] != Shave.Status.COMPLETED:
+            return []
+        amount = values['amount_in_default_currency'] or Decimal('0.00')
+        if items_cost is None:
+            items_cost = CashRegisterService.get_shave_items_cost(values['id'])
+        return [(values['cashregister_id'], values['date_shave'], sign * amount, sign * (amount - items_cost))]
+
+    @staticmethod
+    def transaction_entries(values, sign=1):
+        if not values:
+            return []
+        amount = values['amount_in_default_currency'] or Decimal('0.00')
+        if values['trans_type'] == Transaction.TransactionType.EXPENSE:
+            amount = -amount
+        return [(values['cashregister_id'], values['date_trans'], sign * amount, sign * amount)]
+
+    @staticmethod
+    def payment_entries(values, sign=1):
+        if not values:
+            return []
+        amount = values['amount_in_default_currency'] or Decimal('0.00')
+        return [(values['cashregister_id'], values['date_payment'], -sign * amount, -sign * amount)]
+
+    @staticmethod
+    def item_purchase_entries(values, sign=1):
+        if not values:
+            return []
+        amount = values['purchase_price_in_default_currency'] or Decimal('0.00')
+        return [(values['cashregister_id'], values['purchase_date'], -sign * amount, Decimal('0.00'))]
+
+    @staticmethod
+    def item_used_entries(values, sign=1):
+        if not values:
+            return []
+        shave = Shave.objects.filter(pk=values['shave_id']).values('status', 'cashregister_id', 'date_shave').first()
+        if not shave or shave['status'] != Shave.Status.COMPLETED:
+            return []
+        cost = values['cost_in_default_currency'] or Decimal('0.00')
+        return [(shave['cashregister_id'], shave['date_shave'], Decimal('0.00'), -sign * cost)]
+
+    @staticmethod
+    def get_shave_change_entries(old, new):
+        old_completed = bool(old) and old['status'] == Shave.Status.COMPLETED
+        new_completed = bool(new) and new['status'] == Shave.Status.COMPLETED
+        if not old_completed and not new_completed:
+            return []
+        # Items used only move with the shave when it changes register or completion status
+        if old_completed and new_completed and old['cashregister_id'] == new['cashregister_id']:
+            items_cost = Decimal('0.00')
+        else:
+            items_cost = CashRegisterService.get_shave_items_cost((new or old)['id'])
+        return (CashRegisterService.shave_entries(old, -1, items_cost)
+                + CashRegisterService.shave_entries(new, 1, items_cost))
+
+    @staticmethod
+    def get_register_timezones(cash_register_ids):
+        return {
+            cash_register_id: zoneinfo.ZoneInfo(name)
+            for cash_register_id, name in CashRegister.objects.filter(pk__in=cash_register_ids).values_list('pk', 'salon__timezone')
+        }
+
+    @staticmethod
+    def apply_entries(entries):
+        deferred_totals = getattr(_deferred, 'totals', None)
+        totals = deferred_totals if deferred_totals is not None else {}
+        # Dates of DateFields already are salon days: only the datetimes need the time zone
+        timezones = CashRegisterService.get_register_timezones({
+            cash_register_id for cash_register_id, value, _, _ in entries if isinstance(value, datetime)
+        })
+        for cash_register_id, value, cash, profit in entries:
+            day = as_day(value, timezones.get(cash_register_id))
+            total = totals.setdefault(cash_register_id, [Decimal('0.00'), Decimal('0.00'), day])
+            total[0] += cash
+            total[1] += profit
+            total[2] = min(total[2], day)
+
+        if deferred_totals is None:
+            CashRegisterService.apply_totals(totals)
+
+    @staticmethod
+    def apply_totals(totals):
+        with transaction.atomic():
+            # Always lock registers in the same order to avoid deadlocks between concurrent writers
+            for cash_register_id in sorted(totals):
+                cash, profit, first_day = totals[cash_register_id]
+                if cash or profit:
+                    CashRegister.objects.filter(pk=cash_register_id).update(
+                        balance_cash=F('balance_cash') + cash,
+                        balance_profit=F('balance_profit') + profit,
+                    )
+                # Day closes from the earliest touched day onwards no longer match the history
+                RegisterClose.objects.filter(cashregister_id=cash_register_id, date__gte=first_day).delete()
+
+    @staticmethod
+    def mark_for_reconcile(cash_register_ids, first_day=None):
+        # For writes that bypass the signals (queryset.update, bulk_create)
+        if getattr(_deferred, 'reconcile', None) is not None:
+            for cash_register_id in cash_register_ids:
+                previous = _deferred.reconcile.get(cash_register_id, first_day)
+                _deferred.reconcile[cash_register_id] = min(previous, first_day) if previous and first_day else None
+            return
+        CashRegisterService.reconcile(dict.fromkeys(cash_register_ids, first_day))
+
+    @staticmethod
+    def reconcile(cash_registers_days):
+        # Maps register ids to the first day they changed, None when unknown (drops every close)
+        if not cash_registers_days:
+            return
+        stale_closes = Q()
+        for cash_register_id, first_day in cash_registers_days.items():
+            condition = Q(cashregister_id=cash_register_id)
+            if first_day:
+                condition &= Q(date__gte=first_day)
+            stale_closes |= condition
+        with transaction.atomic():
+            RegisterClose.objects.filter(stale_closes).delete()
+            CashRegisterService.recompute_many(CashRegister.objects.filter(pk__in=cash_registers_days))
+
+    @staticmethod
+    def flush_deferred(totals, reconcile):
+        # A recompute already includes the collected deltas of the same register
+        CashRegisterService.apply_totals({
+            cash_register_id: total for cash_register_id, total in totals.items()
+            if cash_register_id not in reconcile
+        })
+        CashRegisterService.reconcile(reconcile)
+
+    @staticmethod
+    def annotate_recomputed_totals(queryset):
+        def total(model_queryset, register_field, amount):
+            return Coalesce(Subquery(
+                model_queryset.filter(**{register_field: OuterRef('pk')}).values(register_field).annotate(
+                    total=Sum(amount)
+                ).values('total')
+            ), Decimal('0.00'), output_field=DecimalField())
+
+        # Income transactions add to both balances and expenses remove from both: one signed sum
+        signed_transaction = Case(
+            When(trans_type=Transaction.TransactionType.EXPENSE, then=-F('amount_in_default_currency')),
+            default=F('amount_in_default_currency'),
+        )
+        return queryset.annotate(
+            shaves_total=total(Shave.objects.filter(status=Shave.Status.COMPLETED), 'cashregister', 'amount_in_default_currency'),
+            transactions_total=total(Transaction.objects.all(), 'cashregister', signed_transaction),
+            payments_total=total(Payment.objects.all(), 'cashregister', 'amount_in_default_currency'),
+            purchases_total=total(ItemPurchase.objects.all(), 'cashregister', 'purchase_price_in_default_currency'),
+            items_cost_total=total(ItemUsed.objects.filter(shave__status=Shave.Status.COMPLETED), 'shave__cashregister', 'cost_in_default_currency'),
+        )
+
+    @staticmethod
+    def recompute_many(queryset):
+        # Recomputes the balances of every register of the queryset in one select and one bulk update
+        with transaction.atomic():
+            # Holding the row locks makes concurrent deltas wait until the recomputed values are saved
+            cash_registers = list(CashRegisterService.annotate_recomputed_totals(
+                queryset.select_for_update().order_by('pk')
+            ))
+            now = timezone.now()
+            for cash_register in cash_registers:
+                net = cash_register.shaves_total + cash_register.transactions_total - cash_register.payments_total
+                cash_register.balance_profit = net - cash_register.items_cost_total
+                cash_register.balance_cash = net - cash_register.purchases_total
+                cash_register.reconciled_at = now
+            CashRegister.objects.bulk_update(cash_registers, ['balance_profit', 'balance_cash', 'reconciled_at'], batch_size=500)
+        return cash_registers
+
+    @staticmethod
+    def get_stale_registers(reconciled_before):
+        # Never reconciled first, then the oldest reconciliations
+        return CashRegister.objects.filter(
+            Q(reconciled_at__isnull=True) | Q(reconciled_at__lt=reconciled_before)
+        ).order_by(F('reconciled_at').asc(nulls_first=True), 'pk')
+
+    @staticmethod
+    def reconcile_stale(reconciled_before, batch_size=100, queryset=None):
+        # Recomputes one batch of stale registers and returns how many were reconciled
+        stale = CashRegisterService.get_stale_registers(reconciled_before)
+        if queryset is not None:
+            stale = stale.filter(pk__in=queryset.values('pk'))
+        batch = list(stale.values_list('pk', flat=True)[:batch_size])
+        if not batch:
+            return 0
+        return len(CashRegisterService.recompute_many(CashRegister.objects.filter(pk__in=batch)))
+
+    @staticmethod
+    def get_registers_changed_since(queryset, since):
+        # Registers with a shave, transaction, payment, purchase or item used written since the given time
+        def changed(model_queryset, register_field):
+            return Exists(model_queryset.filter(**{register_field: OuterRef('pk'), 'modified_at__gte': since}))
+
+        return queryset.filter(
+            changed(Shave.objects.all(), 'cashregister') | changed(Transaction.objects.all(), 'cashregister')
+            | changed(Payment.objects.all(), 'cashregister') | changed(ItemPurchase.objects.all(), 'cashregister')
+            | changed(ItemUsed.objects.all(), 'shave__cashregister')
+        )
+
+    @staticmethod
+    def find_discrepancies(queryset):
+        # Stored balances that differ from a recompute, without locking the registers
+        discrepancies = []
+        for cash_register in CashRegisterService.annotate_recomputed_totals(queryset.order_by('pk')):
+            net = cash_register.shaves_total + cash_register.transactions_total - cash_register.payments_total
+            balance_profit = net - cash_register.items_cost_total
+            balance_cash = net - cash_register.purchases_total
+            if balance_profit != cash_register.balance_profit or balance_cash != cash_register.balance_cash:
+                discrepancies.append({
+                    'cashregister_id': cash_register.pk,
+                    'cashregister': cash_register.name,
+                    'salon_id': cash_register.salon_id,
+                    'stored_cash': cash_register.balance_cash,
+                    'recomputed_cash': balance_cash,
+                    'stored_profit': cash_register.balance_profit,
+                    'recomputed_profit': balance_profit,
+                })
+        return discrepancies
+
     @staticmethod
     def update_balance(cash_register):
-        income = Shave.objects.filter(cashregister=cash_register, status=Shave.Status.COMPLETED).aggregate(total=Sum('amount_in_default_currency'))['total'] or Decimal('0.00')
-        income += Transaction.objects.filter(cashregister=cash_register, trans_type=Transaction.TransactionType.INCOME).aggregate(total=Sum('amount_in_default_currency'))['total'] or Decimal('0.00')
-        
-        profit_expense = Payment.objects.filter(cashregister=cash_register).aggregate(total=Sum('amount_in_default_currency'))['total'] or Decimal('0.00')
-        profit_expense += Transaction.objects.filter(cashregister=cash_register, trans_type=Transaction.TransactionType.EXPENSE).aggregate(total=Sum('amount_in_default_currency'))['total'] or Decimal('0.00')
-                
-        items_used_cost = Decimal('0.00')
-        for item_used in ItemUsed.objects.filter(shave__cashregister=cash_register, shave__status=Shave.Status.COMPLETED):
-            items_used_cost += item_used.get_amount_in_default_currency()
-        
-        profit_expense += items_used_cost
-        
-        cash_register.balance_profit = income - profit_expense
-        
-        # Calculate expenses for cash balance
-        cash_expense = Payment.objects.filter(cashregister=cash_register).aggregate(total=Sum('amount_in_default_currency'))['total'] or Decimal('0.00')
-        cash_expense += Transaction.objects.filter(cashregister=cash_register, trans_type=Transaction.TransactionType.EXPENSE).aggregate(total=Sum('amount_in_default_currency'))['total'] or Decimal('0.00')
-        cash_expense += ItemPurchase.objects.filter(cashregister=cash_register).aggregate(total=Sum('purchase_price_in_default_currency'))['total'] or Decimal('0.00')
+        recomputed = CashRegisterService.recompute_many(CashRegister.objects.filter(pk=cash_register.pk))
+        if recomputed:
+            cash_register.balance_profit = recomputed[0].balance_profit
+            cash_register.balance_cash = recomputed[0].balance_cash
+
+    @staticmethod
+    def get_day_totals(cash_register_ids, start_day=None, end_day=None, tzinfo=None):
+        # {(cash_register_id, day): {'income': ..., 'expense': ..., ...}} in one grouped query per source,
+        # days in the given time zone (the registers' salon's)
+        def grouped(queryset, register_field, date_field, total, is_datetime):
+            if is_datetime:
+                if start_day:
+                    queryset = queryset.filter(**{f'{date_field}__gte': day_start(start_day, tzinfo)})
+                if end_day:
+                    queryset = queryset.filter(**{f'{date_field}__lt': day_start(end_day + timedelta(days=1), tzinfo)})
+                day = TruncDate(date_field, tzinfo=tzinfo)
+            else:
+                if start_day:
+                    queryset = queryset.filter(**{f'{date_field}__gte': start_day})
+                if end_day:
+                    queryset = queryset.filter(**{f'{date_field}__lte': end_day})
+                day = F(date_field)
+            return queryset.filter(**{f'{register_field}__in': cash_register_ids}).annotate(
+                register=F(register_field), day=day
+            ).values('register', 'day').annotate(total=Sum(total)).values_list('register', 'day', 'total')
+
+        sources = {
+            'income': [
+                grouped(Shave.objects.filter(status=Shave.Status.COMPLETED), 'cashregister_id', 'date_shave', 'amount_in_default_currency', True),
+                grouped(Transaction.objects.filter(trans_type=Transaction.TransactionType.INCOME), 'cashregister_id', 'date_trans', 'amount_in_default_currency', False),
+            ],
+            'expense': [
+                grouped(Transaction.objects.filter(trans_type=Transaction.TransactionType.EXPENSE), 'cashregister_id', 'date_trans', 'amount_in_default_currency', False),
+            ],
+            'payments': [
+                grouped(Payment.objects.all(), 'cashregister_id', 'date_payment', 'amount_in_default_currency', False),
+            ],
+            'purchases': [
+                grouped(ItemPurchase.objects.all(), 'cashregister_id', 'purchase_date', 'purchase_price_in_default_currency', False),
+            ],
+            'items_cost': [
+                grouped(ItemUsed.objects.filter(shave__status=Shave.Status.COMPLETED), 'shave__cashregister_id', 'shave__date_shave', 'cost_in_default_currency', True),
+            ],
+        }
+        totals = {}
+        for name, querysets in sources.items():
+            for queryset in querysets:
+                for register_id, day, total in queryset:
+                    day_totals = totals.setdefault((register_id, day), dict.fromkeys(sources, Decimal('0.00')))
+                    day_totals[name] += total or Decimal('0.00')
+        return totals
+
+    @staticmethod
+    def get_day_balance_change(day_totals):
+        spent = day_totals['expense'] + day_totals['payments']
+        return (
+            day_totals['income'] - spent - day_totals['purchases'],
+            day_totals['income'] - spent - day_totals['items_cost'],
+        )
+
+    @staticmethod
+    def get_last_closable_day(cash_register):
+        # Yesterday in the salon's time zone: the current day can still receive entries
+        return timezone.localdate(timezone=cash_register.salon.tzinfo) - timedelta(days=1)
+
+    @staticmethod
+    def close_days(cash_register, end_day):
+        # Closes every day not closed yet up to end_day (from the first activity for a new register)
+        last_closable_day = CashRegisterService.get_last_closable_day(cash_register)
+        if end_day > last_closable_day:
+            raise ValidationError(f"{end_day} is not over yet in the salon's time zone: the last day that can be closed is {last_closable_day}.")
+        if cash_register.closes.filter(date=end_day).exists():
+            return []
+        last_close = cash_register.closes.filter(date__lt=end_day).order_by('-date').first()
+        start_day = last_close.date + timedelta(days=1) if last_close else None
+        totals = CashRegisterService.get_day_totals([cash_register.pk], start_day, end_day, cash_register.salon.tzinfo)
+        if start_day is None:
+            start_day = min([day for _, day in totals] + [end_day])
 
-        cash_register.balance_cash = income - cash_expense
+        balance_cash = last_close.balance_cash if last_close else Decimal('0.00')
+        balance_profit = last_close.balance_profit if last_close else Decimal('0.00')
+        empty = dict.fromkeys(['income', 'expense', 'payments', 'purchases', 'items_cost'], Decimal('0.00'))
+        closes = []
+        day = start_day
+        while day <= end_day:
+            day_totals = totals.get((cash_register.pk, day), empty)
+            cash, profit = CashRegisterService.get_day_balance_change(day_totals)
+            balance_cash += cash
+            balance_profit += profit
+            closes.append(RegisterClose(
+                cashregister=cash_register, salon_id=cash_register.salon_id, date=day,
+                balance_cash=balance_cash, balance_profit=balance_profit, **day_totals
+            ))
+            day += timedelta(days=1)
+        return RegisterClose.objects.bulk_create(closes)
 
-        cash_register.save()
+    @staticmethod
+    def get_balance_as_of(cash_register, day):
+        # Last close on or before the day, plus whatever happened after it
+        last_close = cash_register.closes.filter(date__lte=day).order_by('-date').first()
+        balance_cash = last_close.balance_cash if last_close else Decimal('0.00')
+        balance_profit = last_close.balance_profit if last_close else Decimal('0.00')
+        if not last_close or last_close.date < day:
+            start_day = last_close.date + timedelta(days=1) if last_close else None
+            for day_totals in CashRegisterService.get_day_totals([cash_register.pk], start_day, day, cash_register.salon.tzinfo).values():
+                cash, profit = CashRegisterService.get_day_balance_change(day_totals)
+                balance_cash += cash
+                balance_profit += profit
+        return {
+            'profit_balance': balance_profit,
+            'cash_balance': balance_cash
+        }
 
     @staticmethod
     def get_balance(cash_register):
-        CashRegisterService.update_balance(cash_register)
+        cash_register.refresh_from_db(fields=['balance_profit', 'balance_cash'])
         return {
             'profit_balance': cash_register.balance_profit or Decimal('0.00'),
             'cash_balance': cash_register.balance_cash or Decimal('0.00')
         }
 
+class DailyStatsService:
+    # Changes are ((salon_id, date, cashregister_id, barber_id), {field: delta}); barber_id is None for
+    # transactions and purchases. Dates become business days in the salon's time zone when applied.
+    # The cost of items used goes to the day and register of their shave.
+
+    @staticmethod
+    def shave_changes(values, sign=1):
+        if not values or values['status'] != Shave.Status.COMPLETED:
+            return []
+        amount = values['amount_in_default_currency'] or Decimal('0.00')
+        key = (values['salon_id'], values['date_shave'], values['cashregister_id'], values['barber_id'])
+        return [(key, {'shave_count': sign, 'revenue': sign * amount})]
+
+    @staticmethod
+    def shave_items_cost_changes(values, sign=1):
+        if not values or values['status'] != Shave.Status.COMPLETED:
+            return []
+        costs = ItemUsed.objects.filter(shave_id=values['id']).values('barber').annotate(
+            total=Sum('cost_in_default_currency')
+        ).values_list('barber', 'total')
+        return [
+            ((values['salon_id'], values['date_shave'], values['cashregister_id'], barber_id), {'items_cost': sign * total})
+            for barber_id, total in costs
+        ]
+
+    @staticmethod
+    def get_shave_change_changes(old, new):
+        changes = DailyStatsService.shave_changes(old, -1) + DailyStatsService.shave_changes(new)
+        # Items used only move with the shave when its completion, salon, day or register changes
+        def items_key(values):
+            if not values or values['status'] != Shave.Status.COMPLETED:
+                return None
+            return values['salon_id'], values['date_shave'], values['cashregister_id']
+        if items_key(old) != items_key(new):
+            changes += DailyStatsService.shave_items_cost_changes(old, -1) + DailyStatsService.shave_items_cost_changes(new)
+        return changes
+
+    @staticmethod
+    def transaction_changes(values, sign=1):
+        if not values:
+            return []
+        amount = values['amount_in_default_currency'] or Decimal('0.00')
+        field = 'expenses' if values['trans_type'] == Transaction.TransactionType.EXPENSE else 'income'
+        return [((values['salon_id'], values['date_trans'], values['cashregister_id'], None), {field: sign * amount})]
+
+    @staticmethod
+    def payment_changes(values, sign=1):
+        if not values:
+            return []
+        amount = values['amount_in_default_currency'] or Decimal('0.00')
+        key = (values['salon_id'], values['date_payment'], values['cashregister_id'], values['barber_id'])
+        return [(key, {'payments': sign * amount})]
+
+    @staticmethod
+    def item_purchase_changes(values, sign=1):
+        if not values:
+            return []
+        amount = values['purchase_price_in_default_currency'] or Decimal('0.00')
+        return [((values['salon_id'], values['purchase_date'], values['cashregister_id'], None), {'purchases': sign * amount})]
+
+    @staticmethod
+    def item_used_changes(values, sign=1):
+        if not values:
+            return []
+        shave = Shave.objects.filter(pk=values['shave_id']).values('status', 'salon_id', 'cashregister_id', 'date_shave').first()
+        if not shave or shave['status'] != Shave.Status.COMPLETED:
+            return []
+        cost = values['cost_in_default_currency'] or Decimal('0.00')
+        key = (shave['salon_id'], shave['date_shave'], shave['cashregister_id'], values['barber_id'])
+        return [(key, {'items_cost': sign * cost})]
+
+    @staticmethod
+    def get_salon_timezones(salon_ids):
+        return {
+            salon_id: zoneinfo.ZoneInfo(name)
+            for salon_id, name in Salon.objects.filter(pk__in=salon_ids).values_list('pk', 'timezone')
+        }
+
+    @staticmethod
+    def apply_changes(changes):
+        if not changes:
+            return
+        deferred_stats = getattr(_deferred, 'stats', None)
+        totals = deferred_stats if deferred_stats is not None else {}
+        timezones = DailyStatsService.get_salon_timezones({key[0] for key, _ in changes})
+        for (salon_id, value, cash_register_id, barber_id), deltas in changes:
+            if salon_id not in timezones:
+                continue
+            key = (salon_id, as_day(value, timezones[salon_id]), cash_register_id, barber_id)
+            total = totals.setdefault(key, {})
+            for field, delta in deltas.items():
+                total[field] = total.get(field, 0) + delta
+
+        if deferred_stats is None:
+            DailyStatsService.apply_totals(totals)
+
+    @staticmethod
+    def apply_totals(totals):
+        with transaction.atomic():
+            # Same lock order for every writer
+            for key in sorted(totals, key=lambda key: (key[0], key[1], key[2], key[3] or 0)):
+                deltas = {field: delta for field, delta in totals[key].items() if delta}
+                if not deltas:
+                    continue
+                salon_id, day, cash_register_id, barber_id = key
+                rows = SalonDailyStats.objects.filter(salon_id=salon_id, day=day, cashregister_id=cash_register_id, barber_id=barber_id)
+                if rows.update(**{field: F(field) + delta for field, delta in deltas.items()}):
+                    continue
+                try:
+                    with transaction.atomic():
+                        SalonDailyStats.objects.create(
+                            salon_id=salon_id, day=day, cashregister_id=cash_register_id, barber_id=barber_id, **deltas
+                        )
+                except IntegrityError:
+                    # Created concurrently since the update
+                    rows.update(**{field: F(field) + delta for field, delta in deltas.items()})
+
+    @staticmethod
+    def rebuild(salon_ids, start_day=None, end_day=None):
+        # Recomputes the rows of the salons between two days (inclusive) from the raw tables
+        rows = {}
+        salons_by_timezone = {}
+        for salon_id, tzinfo in DailyStatsService.get_salon_timezones(salon_ids).items():
+            salons_by_timezone.setdefault(tzinfo, []).append(salon_id)
+        for tzinfo, timezone_salon_ids in salons_by_timezone.items():
+            for values in DailyStatsService.get_raw_totals(timezone_salon_ids, tzinfo, start_day, end_day):
+                key = (values.pop('stats_salon'), as_day(values.pop('stats_day')), values.pop('stats_register'), values.pop('stats_barber'))
+                row = rows.setdefault(key, SalonDailyStats(salon_id=key[0], day=key[1], cashregister_id=key[2], barber_id=key[3]))
+                for field, total in values.items():
+                    if total:
+                        setattr(row, field, getattr(row, field) + total)
+
+        with transaction.atomic():
+            stale = SalonDailyStats.objects.filter(salon_id__in=salon_ids)
+            if start_day:
+                stale = stale.filter(day__gte=start_day)
+            if end_day:
+                stale = stale.filter(day__lte=end_day)
+            stale.delete()
+            SalonDailyStats.objects.bulk_create(rows.values(), batch_size=1000)
+            for salon_id in salon_ids:
+                bump_version(salon_id)
+        return len(rows)
+
+    @staticmethod
+    def get_raw_totals(salon_ids, tzinfo, start_day=None, end_day=None):
+        # Grouped totals per source, by business day in the given time zone
+        def grouped(queryset, date_field, is_datetime, salon_field, register_field, barber_field, **totals):
+            if is_datetime:
+                if start_day:
+                    queryset = queryset.filter(**{f'{date_field}__gte': day_start(start_day, tzinfo)})
+                if end_day:
+                    queryset = queryset.filter(**{f'{date_field}__lt': day_start(end_day + timedelta(days=1), tzinfo)})
+                day = TruncDate(date_field, tzinfo=tzinfo)
+            else:
+                if start_day:
+                    queryset = queryset.filter(**{f'{date_field}__gte': start_day})
+                if end_day:
+                    queryset = queryset.filter(**{f'{date_field}__lte': end_day})
+                day = F(date_field)
+            return queryset.filter(**{f'{salon_field}__in': salon_ids}).annotate(
+                stats_salon=F(salon_field), stats_day=day, stats_register=F(register_field),
+                stats_barber=F(barber_field) if barber_field else Value(None, output_field=IntegerField()),
+            ).values('stats_salon', 'stats_day', 'stats_register', 'stats_barber').annotate(**totals)
+
+        expense = Q(trans_type=Transaction.TransactionType.EXPENSE)
+        sources = [
+            grouped(Shave.objects.filter(status=Shave.Status.COMPLETED), 'date_shave', True, 'salon', 'cashregister', 'barber',
+                    shave_count=Count('pk'), revenue=Sum('amount_in_default_currency')),
+            grouped(ItemUsed.objects.filter(shave__status=Shave.Status.COMPLETED), 'shave__date_shave', True,
+                    'shave__salon', 'shave__cashregister', 'barber', items_cost=Sum('cost_in_default_currency')),
+            grouped(Transaction.objects.all(), 'date_trans', False, 'salon', 'cashregister', None,
+                    income=Sum('amount_in_default_currency', filter=~expense), expenses=Sum('amount_in_default_currency', filter=expense)),
+            grouped(Payment.objects.all(), 'date_payment', False, 'salon', 'cashregister', 'barber',
+                    payments=Sum('amount_in_default_currency')),
+            grouped(ItemPurchase.objects.all(), 'purchase_date', False, 'salon', 'cashregister', None,
+                    purchases=Sum('purchase_price_in_default_currency')),
+        ]
+        for source in sources:
+            yield from source
+
+    @staticmethod
+    def get_stats(salon, start_date=None, end_date=None):
+        # Rows of a salon between two days (inclusive); datetimes are taken as their business day in the salon
+        stats = SalonDailyStats.objects.filter(salon=salon)
+        if start_date:
+            stats = stats.filter(day__gte=as_day(start_date, salon.tzinfo))
+        if end_date:
+            stats = stats.filter(day__lte=as_day(end_date, salon.tzinfo))
+        return stats
+
 class InventoryService:
     @staticmethod
+    @cached_report()
     def get_stock_level(salon):
-        result = Item.objects.filter(salon=salon).aggregate(
-            total_items=Sum('current_stock'),
-            total_value=Sum(F('current_stock') * F('price'))
+        result = InventoryService.valuation(salon).aggregate(
+            total_items=Sum('remaining_quantity'),
+            total_value=Sum('remaining_value'),
         )
         return {
             'total_items': result['total_items'] or 0,
@@ -113,6 +766,220 @@ class InventoryService:
     def get_low_stock_items(salon, threshold=10):
         return Item.objects.filter(salon=salon, current_stock__lt=threshold)
 
+    @staticmethod
+    def item_purchase_stock_changes(values, sign=1):
+        if not values:
+            return []
+        return [(values['item_id'], sign * values['quantity'], sign * (values['purchase_price_in_default_currency'] or Decimal('0.00')))]
+
+    @staticmethod
+    def item_used_stock_changes(values, sign=1):
+        if not values:
+            return []
+        return [(values['item_id'], -sign * values['quantity'], -sign * (values['cost_in_default_currency'] or Decimal('0.00')))]
+
+    @staticmethod
+    def apply_stock_changes(changes):
+        # (item_id, quantity, value): the average cost is the value of the stock on hand divided by its quantity
+        totals = {}
+        for item_id, quantity, value in changes:
+            total = totals.setdefault(item_id, [0, Decimal('0.00')])
+            total[0] += quantity
+            total[1] += value
+
+        with transaction.atomic():
+            items = Item.objects.select_for_update().filter(pk__in=[
+                item_id for item_id, (quantity, value) in totals.items() if quantity or value
+            ]).order_by('pk')
+            for item in items:
+                quantity, value = totals[item.pk]
+                item.current_stock += quantity
+                item.stock_value += value
+                if item.current_stock > 0:
+                    item.average_cost = (item.stock_value / item.current_stock).quantize(Decimal('0.000001'), rounding=ROUND_HALF_UP)
+                item.save(update_fields=['current_stock', 'stock_value', 'average_cost'])
+
+    @staticmethod
+    def consume_lots(item_used):
+        # Takes the quantity from the oldest open purchases; each lookup is one index seek
+        open_lots = ItemPurchase.objects.select_for_update().filter(
+            item_id=item_used.item_id, remaining_quantity__gt=0
+        ).order_by('purchase_date', 'id')
+        needed = item_used.quantity
+        consumptions = []
+        with transaction.atomic():
+            while needed > 0:
+                lot = open_lots.first()
+                if lot is None:
+                    break
+                taken = min(needed, lot.remaining_quantity)
+                ItemPurchase.objects.filter(pk=lot.pk).update(remaining_quantity=F('remaining_quantity') - taken)
+                consumptions.append(ItemLotConsumption(
+                    item_used=item_used, purchase=lot, quantity=taken,
+                    unit_cost=lot.purchase_price * lot.exchange_rate,
+                ))
+                needed -= taken
+            ItemLotConsumption.objects.bulk_create(consumptions)
+        return consumptions
+
+    @staticmethod
+    def release_lots(item_used_id):
+        with transaction.atomic():
+            consumptions = list(ItemLotConsumption.objects.filter(item_used_id=item_used_id).values_list('pk', 'purchase_id', 'quantity'))
+            for pk, purchase_id, quantity in sorted(consumptions, key=lambda consumption: consumption[1]):
+                ItemPurchase.objects.filter(pk=purchase_id).update(remaining_quantity=F('remaining_quantity') + quantity)
+            ItemLotConsumption.objects.filter(pk__in=[pk for pk, _, _ in consumptions]).delete()
+
+    @staticmethod
+    def has_later_uses(item_used_id, item_id, used_date, created_at):
+        # Uses that rebuild_item_lots replays after this one: consuming or releasing its lots in place would diverge
+        return ItemUsed.objects.filter(item_id=item_id).exclude(pk=item_used_id).filter(
+            Q(used_date__gt=used_date) | Q(used_date=used_date, created_at__gt=created_at)
+            | Q(used_date=used_date, created_at=created_at, pk__gt=item_used_id)
+        ).exists()
+
+    @staticmethod
+    def is_out_of_order_lot(purchase_id, item_id, purchase_date):
+        # A lot older than lots already drawn from, or stock that earlier uses are still short of, reorders the consumptions
+        later_lots_drawn = ItemLotConsumption.objects.filter(purchase__item_id=item_id).filter(
+            Q(purchase__purchase_date__gt=purchase_date) | Q(purchase__purchase_date=purchase_date, purchase_id__gt=purchase_id)
+        )
+        short_uses = ItemUsed.objects.filter(item_id=item_id).annotate(
+            consumed=Coalesce(Sum('lot_consumptions__quantity'), 0)
+        ).filter(consumed__lt=F('quantity'))
+        return later_lots_drawn.exists() or short_uses.exists()
+
+    @staticmethod
+    def resize_lot(purchase_id, delta):
+        # The purchase model refuses a quantity below what was already consumed
+        ItemPurchase.objects.filter(pk=purchase_id).update(remaining_quantity=F('remaining_quantity') + delta)
+
+    @staticmethod
+    def get_fifo_cost_expression(item_ref='pk'):
+        # Cost of the lot slices consumed by the uses of an item, to annotate Item querysets
+        consumed = ItemLotConsumption.objects.filter(item_used__item=OuterRef(item_ref)).values('item_used__item').annotate(
+            total=Sum(F('quantity') * F('unit_cost'))
+        ).values('total')
+        return Coalesce(Subquery(consumed), Decimal('0.00'), output_field=DecimalField())
+
+    @staticmethod
+    def get_fifo_stock_value_expression(item_ref='pk'):
+        # Value of the open lots of an item, to annotate Item querysets
+        open_lots = ItemPurchase.objects.filter(item=OuterRef(item_ref), remaining_quantity__gt=0).values('item').annotate(
+            total=Sum(F('remaining_quantity') * F('purchase_price') * F('exchange_rate'))
+        ).values('total')
+        return Coalesce(Subquery(open_lots), Decimal('0.00'), output_field=DecimalField())
+
+    @staticmethod
+    def annotate_valuation(queryset):
+        # Stock of every item of the queryset, one independent subquery per total so that the sums never
+        # multiply each other: purchased, used, remaining quantity, FIFO cost of the uses and of the open lots
+        def total(model, amount):
+            return Coalesce(Subquery(
+                model.objects.filter(item=OuterRef('pk')).values('item').annotate(total=Sum(amount)).values('total')
+            ), 0)
+
+        return queryset.annotate(
+            total_purchased=total(ItemPurchase, 'quantity'),
+            total_used=total(ItemUsed, 'quantity'),
+            remaining_quantity=F('total_purchased') - F('total_used'),
+            total_used_amount=InventoryService.get_fifo_cost_expression(),
+            remaining_value=InventoryService.get_fifo_stock_value_expression(),
+            avg_remaining_price=Case(
+                When(remaining_quantity__gt=0, then=Round(DecimalDivide('remaining_value', 'remaining_quantity'), 6)),
+                default=None,
+                output_field=DecimalField(max_digits=19, decimal_places=6),
+            ),
+        )
+
+    @staticmethod
+    def valuation(salon):
+        return InventoryService.annotate_valuation(Item.objects.filter(salon=salon))
+
+    @staticmethod
+    @cached_report()
+    def get_fifo_valuation(salon, start_date=None, end_date=None):
+        consumptions = ItemLotConsumption.objects.filter(item_used__salon=salon, item_used__shave__status=Shave.Status.COMPLETED)
+        if start_date:
+            consumptions = consumptions.filter(item_used__shave__date_shave__gte=start_date)
+        if end_date:
+            consumptions = consumptions.filter(item_used__shave__date_shave__lte=end_date)
+        cost_of_goods = consumptions.aggregate(total=Sum(F('quantity') * F('unit_cost')))['total']
+        stock_value = ItemPurchase.objects.filter(salon=salon, remaining_quantity__gt=0).aggregate(
+            total=Sum(F('remaining_quantity') * F('purchase_price') * F('exchange_rate'))
+        )['total']
+        return {
+            'cost_of_goods': cost_of_goods or Decimal('0.00'),
+            'stock_value': stock_value or Decimal('0.00')
+        }
+
+    @staticmethod
+    def rebuild_item_lots(items):
+        # Replays every use of the items against their purchases, oldest first
+        item_ids = list(items.values_list('pk', flat=True))
+        lots = {}
+        purchases = ItemPurchase.objects.filter(item_id__in=item_ids).order_by('purchase_date', 'id').only(
+            'pk', 'item_id', 'quantity', 'purchase_price', 'exchange_rate'
+        )
+        for purchase in purchases:
+            purchase.remaining_quantity = purchase.quantity
+            lots.setdefault(purchase.item_id, []).append(purchase)
+
+        consumptions = []
+        uses = ItemUsed.objects.filter(item_id__in=item_ids).order_by('used_date', 'created_at', 'id').values_list('pk', 'item_id', 'quantity')
+        for item_used_id, item_id, needed in uses.iterator(chunk_size=2000):
+            for lot in lots.get(item_id, []):
+                if needed == 0:
+                    break
+                taken = min(needed, lot.remaining_quantity)
+                if taken:
+                    lot.remaining_quantity -= taken
+                    needed -= taken
+                    consumptions.append(ItemLotConsumption(
+                        item_used_id=item_used_id, purchase_id=lot.pk, quantity=taken,
+                        unit_cost=lot.purchase_price * lot.exchange_rate,
+                    ))
+
+        with transaction.atomic():
+            ItemLotConsumption.objects.filter(item_used__item_id__in=item_ids).delete()
+            ItemPurchase.objects.bulk_update([lot for item_lots in lots.values() for lot in item_lots], ['remaining_quantity'], batch_size=1000)
+            ItemLotConsumption.objects.bulk_create(consumptions, batch_size=1000)
+        return len(consumptions)
+
+    @staticmethod
+    def rebuild_item_costs(items):
+        # Replays purchases and uses in date order to recompute the moving average and every cost snapshot
+        item_ids = list(items.values_list('pk', flat=True))
+        events = {}
+        for item_id, day, created_at, pk, quantity, value in ItemPurchase.objects.filter(item_id__in=item_ids).values_list(
+                'item_id', 'purchase_date', 'created_at', 'pk', 'quantity', 'purchase_price_in_default_currency'):
+            events.setdefault(item_id, []).append((day, created_at, 0, pk, quantity, value))
+        for item_id, day, created_at, pk, quantity in ItemUsed.objects.filter(item_id__in=item_ids).values_list(
+                'item_id', 'used_date', 'created_at', 'pk', 'quantity'):
+            events.setdefault(item_id, []).append((day, created_at, 1, pk, quantity, None))
+
+        updated_items, updated_uses = [], []
+        for item_id in item_ids:
+            stock, stock_value, average_cost = 0, Decimal('0.00'), Decimal('0')
+            # Events of the same day are replayed in the order they were recorded
+            for day, created_at, kind, pk, quantity, value in sorted(events.get(item_id, [])):
+                if kind == 0:
+                    stock += quantity
+                    stock_value += value
+                else:
+                    cost = (average_cost * quantity).quantize(Decimal('0.01'), rounding=ROUND_HALF_UP)
+                    stock -= quantity
+                    stock_value -= cost
+                    updated_uses.append(ItemUsed(pk=pk, unit_cost=average_cost, cost_in_default_currency=cost))
+                if stock > 0:
+                    average_cost = (stock_value / stock).quantize(Decimal('0.000001'), rounding=ROUND_HALF_UP)
+            updated_items.append(Item(pk=item_id, stock_value=stock_value, average_cost=average_cost))
+
+        with transaction.atomic():
+            Item.objects.bulk_update(updated_items, ['stock_value', 'average_cost'], batch_size=1000)
+            ItemUsed.objects.bulk_update(updated_uses, ['unit_cost', 'cost_in_default_currency'], batch_size=1000)
+        return len(updated_items), len(updated_uses)
+
    
 class FinancialService:
     @staticmethod
@@ -120,63 +987,357 @@ class FinancialService:
         return Decimal(value).quantize(Decimal('0.01'), rounding=ROUND_HALF_UP)
 
     @staticmethod
+    @cached_report()
     def get_total_revenue(salon, start_date=None, end_date=None):
-        shaves = Shave.objects.filter(salon=salon, status=Shave.Status.COMPLETED)
-
-        if start_date:
-            shaves = shaves.filter(date_shave__gte=start_date)
-        if end_date:
-            shaves = shaves.filter(date_shave__lte=end_date)
-        
-        total_revenue = shaves.aggregate(total=Sum('amount_in_default_currency'))['total'] or Decimal('0.00')
+        total_revenue = DailyStatsService.get_stats(salon, start_date, end_date).aggregate(total=Sum('revenue'))['total'] or Decimal('0.00')
 
         return FinancialService.format_decimal(total_revenue)
+
+    @staticmethod
+    @cached_report()
+    def get_total_expenses(salon, start_date=None, end_date=None):
+        # Payments, expense transactions and the cost of the items used
+        total_expenses = DailyStatsService.get_stats(salon, start_date, end_date).aggregate(
+            total=Sum(F('payments') + F('expenses') + F('items_cost'))
+        )['total']
+        return total_expenses or Decimal('0.00')
     
     @staticmethod
+    @cached_report()
     def get_total_profit(salon, start_date=None, end_date=None):
         total_revenue = FinancialService.get_total_revenue(salon, start_date, end_date)
+        return FinancialService.format_decimal(total_revenue - FinancialService.get_total_expenses(salon, start_date, end_date))
 
-        expenses = Payment.objects.filter(salon=salon)
-        expense_transactions = Transaction.objects.filter(salon=salon, trans_type=Transaction.TransactionType.EXPENSE)
-        items_used = ItemUsed.objects.filter(salon=salon, shave__status=Shave.Status.COMPLETED)
+    @staticmethod
+    @cached_report()
+    def get_financial_summary(salon, start_date=None, end_date=None):
+        totals = DailyStatsService.get_stats(salon, start_date, end_date).aggregate(
+            revenue=Sum('revenue'),
+            expenses=Sum(F('payments') + F('expenses') + F('items_cost')),
+            count=Sum('shave_count'),
+        )
+        total_revenue = FinancialService.format_decimal(totals['revenue'] or Decimal('0.00'))
+        total_profit = FinancialService.format_decimal(total_revenue - (totals['expenses'] or Decimal('0.00')))
 
-        if start_date:
-            expenses = expenses.filter(date_payment__gte=start_date)
-            expense_transactions = expense_transactions.filter(date_trans__gte=start_date)
-            items_used = items_used.filter(shave__date_shave__gte=start_date)
-        if end_date:
-            expenses = expenses.filter(date_payment__lte=end_date)
-            expense_transactions = expense_transactions.filter(date_trans__lte=end_date)
-            items_used = items_used.filter(shave__date_shave__lte=end_date)
+        stock_value = InventoryService.get_stock_level(salon)['total_value']
 
-        total_expenses = expenses.aggregate(total=Sum('amount_in_default_currency'))['total'] or Decimal('0.00')
-        total_expense_transactions = expense_transactions.aggregate(total=Sum('amount_in_default_currency'))['total'] or Decimal('0.00')
+        return {
+            'total_revenue': total_revenue,
+            'profit': total_profit,
+            'total_shaves': totals['count'] or 0,
+            'stock_value': FinancialService.format_decimal(stock_value)
+        }
 
-        items_used_cost = Decimal('0.00')
-        for item_used in items_used:
-            items_used_cost += item_used.get_amount_in_default_currency()
+    @staticmethod
+    def annotate_summary(queryset):
+        # Lifetime revenue and profit of every salon of the queryset, as subqueries on the daily stats
+        def total(amount):
+            return Coalesce(Subquery(
+                SalonDailyStats.objects.filter(salon=OuterRef('pk')).values('salon').annotate(
+                    total=Sum(amount)
+                ).values('total')
+            ), Decimal('0.00'), output_field=DecimalField())
 
-        total_expenses += total_expense_transactions + items_used_cost
+        return queryset.annotate(
+            total_revenue_value=total('revenue'),
+            total_profit_value=total(F('revenue') - F('payments') - F('expenses') - F('items_cost')),
+        )
 
-        return FinancialService.format_decimal(total_revenue - total_expenses)
+class ReportService:
+    METRICS = {
+        'revenue': Sum('revenue'),
+        'shaves': Sum('shave_count'),
+        'expenses': Sum(F('payments') + F('expenses') + F('items_cost')),
+        'profit': Sum(F('revenue') - F('payments') - F('expenses') - F('items_cost')),
+    }
+    BUCKETS = {
+        'day': TruncDay,
+        'week': TruncWeek,
+        'month': TruncMonth,
+    }
 
     @staticmethod
-    def get_financial_summary(salon, start_date=None, end_date=None):
-        total_revenue = FinancialService.get_total_revenue(salon, start_date, end_date)
-        total_profit = FinancialService.get_total_profit(salon, start_date, end_date)
+    def bucket_start(day, bucket):
+        if bucket == 'week':
+            return day - timedelta(days=day.weekday())
+        if bucket == 'month':
+            return day.replace(day=1)
+        return day
 
-        shaves = Shave.objects.filter(salon=salon, status=Shave.Status.COMPLETED)
-        if start_date:
-            shaves = shaves.filter(date_shave__gte=start_date)
-        if end_date:
-            shaves = shaves.filter(date_shave__lte=end_date)
-        total_shaves = shaves.count()
+    @staticmethod
+    def next_bucket(day, bucket):
+        if bucket == 'week':
+            return day + timedelta(days=7)
+        if bucket == 'month':
+            return (day.replace(day=28) + timedelta(days=4)).replace(day=1)
+        return day + timedelta(days=1)
 
-        stock_value = InventoryService.get_stock_level(salon)['total_value']
+    @staticmethod
+    @cached_report()
+    def timeseries(salon, metric, start_date, end_date, bucket='day'):
+        # One grouped query over the daily stats, then every bucket of the range, empty ones at zero
+        if metric not in ReportService.METRICS:
+            raise ValueError(f"Unknown metric: {metric}")
+        if bucket not in ReportService.BUCKETS:
+            raise ValueError(f"Unknown bucket: {bucket}")
+        start_day = as_day(start_date, salon.tzinfo)
+        end_day = as_day(end_date, salon.tzinfo)
+        if start_day > end_day:
+            raise ValueError("The start date must be before the end date")
+
+        rows = DailyStatsService.get_stats(salon, start_day, end_day).annotate(
+            period=ReportService.BUCKETS[bucket]('day')
+        ).values('period').annotate(value=ReportService.METRICS[metric]).order_by('period')
+        values = {row['period']: row['value'] for row in rows}
+
+        zero = 0 if metric == 'shaves' else Decimal('0.00')
+        series = []
+        period = ReportService.bucket_start(start_day, bucket)
+        while period <= end_day:
+            value = values.get(period) or zero
+            series.append({
+                'period': period,
+                'value': value if metric == 'shaves' else FinancialService.format_decimal(value),
+            })
+            period = ReportService.next_bucket(period, bucket)
+        return series
+
+class PayrollService:
+    @staticmethod
+    def preview(salon, start_date, end_date):
+        """
+        Outstanding commission for the period, in salon days, of the active barbers. A barber paid by a payroll run
+        whose period overlaps this one is left out; other payments overlapping the period are deducted in proportion
+        to the days they share with it.
+        """
+        already_paid = Payment.objects.filter(
+            barber=OuterRef('pk'), payroll_run__isnull=False, start_date__lte=end_date, end_date__gte=start_date
+        )
+        barbers = list(Barber.objects.filter(salon=salon, is_active=True).exclude(Exists(already_paid)).select_related('user').order_by('pk'))
+        barber_ids = [barber.pk for barber in barbers]
+
+        commissions = dict(CommissionAccrual.objects.filter(
+            barber_id__in=barber_ids, date__gte=day_start(start_date, salon.tzinfo), date__lt=day_start(end_date + timedelta(days=1), salon.tzinfo)
+        ).values('barber').annotate(total=Sum('amount')).values_list('barber', 'total'))
+        paid = {}
+        for barber_id, payment_start, payment_end, amount in Payment.objects.filter(
+            barber_id__in=barber_ids, start_date__lte=end_date, end_date__gte=start_date
+        ).values_list('barber', 'start_date', 'end_date', 'amount_in_default_currency'):
+            shared_days = (min(payment_end, end_date) - max(payment_start, start_date)).days + 1
+            paid[barber_id] = paid.get(barber_id, Decimal('0.00')) + amount * shared_days / ((payment_end - payment_start).days + 1)
+
+        rows = []
+        for barber in barbers:
+            commission = BarberService.format_decimal(commissions.get(barber.pk) or Decimal('0.00'))
+            already = BarberService.format_decimal(paid.get(barber.pk) or Decimal('0.00'))
+            rows.append({'barber': barber, 'commission': commission, 'paid': already, 'amount': commission - already})
+        return rows
+
+    @staticmethod
+    def run(payroll_run):
+        # Saves the run and pays every barber with an outstanding amount: one insert and one register update
+        with transaction.atomic():
+            # Concurrent runs of the same salon wait here and then find the barbers already paid
+            Salon.objects.select_for_update().filter(pk=payroll_run.salon_id).first()
+            rows = [
+                row for row in PayrollService.preview(payroll_run.salon, payroll_run.start_date, payroll_run.end_date)
+                if row['amount'] > 0
+            ]
+            if not rows:
+                return []
+            currency = Currency.objects.filter(salon=payroll_run.salon, is_default=True).first() or payroll_run.cashregister.currency
+            payroll_run.total = sum((row['amount'] for row in rows), Decimal('0.00'))
+            payroll_run.save()
 
+            payments = Payment.objects.bulk_create([
+                Payment(
+                    barber=row['barber'], amount=row['amount'], currency=currency, exchange_rate=Decimal('1'),
+                    amount_in_default_currency=row['amount'], start_date=payroll_run.start_date, end_date=payroll_run.end_date,
+                    payment_type=payroll_run.payment_type, cashregister=payroll_run.cashregister,
+                    date_payment=payroll_run.date_payment, salon=payroll_run.salon, payroll_run=payroll_run,
+                ) for row in rows
+            ])
+            # bulk_create skips the signals: the payments reach the register as one balance update
+            CashRegisterService.apply_entries([
+                entry for payment in payments for entry in CashRegisterService.payment_entries(payment.get_current_values())
+            ])
+            DailyStatsService.apply_changes([
+                change for payment in payments for change in DailyStatsService.payment_changes(payment.get_current_values())
+            ])
+            bump_version(payroll_run.salon_id)
+        return payments
+
+class ImportService:
+    # Columns of the CSV files per kind, and whether they are required; extra columns (as in the exports) are ignored
+    COLUMNS = {
+        'shaves': {
+            'date': True, 'barber': True, 'hairstyle': True, 'amount': True, 'currency': True, 'cash_register': True,
+            'client': False, 'status': False, 'exchange_rate': False,
+        },
+        'transactions': {
+            'date': True, 'name': True, 'type': True, 'amount': True, 'currency': True, 'cash_register': True,
+            'exchange_rate': False,
+        },
+    }
+
+    @staticmethod
+    def get_lookups(salon):
+        # Names (case-insensitive) to ids, loaded once per import; None marks a name shared by several rows
+        def index(rows):
+            mapping = {}
+            for pk, *names in rows:
+                for name in names:
+                    if name and name.strip():
+                        key = name.strip().casefold()
+                        mapping[key] = None if key in mapping and mapping[key] != pk else pk
+            return mapping
+
+        barbers = Barber.objects.filter(salon=salon).values_list('pk', 'user__first_name', 'user__last_name', 'user__email')
         return {
-            'total_revenue': total_revenue,
-            'profit': total_profit,
-            'total_shaves': total_shaves,
-            'stock_value': FinancialService.format_decimal(stock_value)
-        }
\ No newline at end of file
+            'barber': index((pk, f"{first_name} {last_name}", email) for pk, first_name, last_name, email in barbers),
+            'hairstyle': index(Hairstyle.objects.filter(salon=salon).values_list('pk', 'name')),
+            'currency': index(Currency.objects.filter(salon=salon).values_list('pk', 'code')),
+            'cash_register': index(CashRegister.objects.filter(salon=salon).values_list('pk', 'name')),
+            'client': index(Client.objects.filter(salon=salon).values_list('pk', 'name')),
+        }
+
+    @staticmethod
+    def resolve(lookups, column, value):
+        key = (value or '').strip().casefold()
+        if key not in lookups[column]:
+            raise ValidationError(f"{column}: unknown '{value}'")
+        if lookups[column][key] is None:
+            raise ValidationError(f"{column}: '{value}' matches several records")
+        return lookups[column][key]
+
+    @staticmethod
+    def clean_field(model, field_name, value):
+        # The field's own parsing and validators, without a full_clean of the row
+        try:
+            return model._meta.get_field(field_name).clean(value, None)
+        except ValidationError as e:
+            raise ValidationError(f"{field_name}: {' '.join(e.messages)}")
+
+    @staticmethod
+    def clean_choice(choices, column, value, default=None):
+        if not (value or '').strip():
+            if default is None:
+                raise ValidationError(f"{column}: required")
+            return default
+        key = value.strip().casefold()
+        for choice in choices:
+            if key in (choice.value.casefold(), str(choice.label).casefold()):
+                return choice.value
+        raise ValidationError(f"{column}: unknown '{value}'")
+
+    @staticmethod
+    def build_amounts(model, row):
+        amount = ImportService.clean_field(model, 'amount', row['amount'])
+        exchange_rate = ImportService.clean_field(model, 'exchange_rate', (row.get('exchange_rate') or '').strip() or '1')
+        if exchange_rate <= 0:
+            raise ValidationError("exchange_rate: must be greater than zero")
+        amount_in_default_currency = (amount * exchange_rate).quantize(Decimal('0.01'), rounding=ROUND_HALF_UP)
+        return amount, exchange_rate, ImportService.clean_field(model, 'amount_in_default_currency', amount_in_default_currency)
+
+    @staticmethod
+    def build_shave(salon, lookups, row, seen):
+        amount, exchange_rate, amount_in_default_currency = ImportService.build_amounts(Shave, row)
+        if amount < 0:
+            raise ValidationError("amount: cannot be negative")
+        date_shave = ImportService.clean_field(Shave, 'date_shave', row['date'])
+        if timezone.is_naive(date_shave):
+            date_shave = timezone.make_aware(date_shave, salon.tzinfo)
+        return Shave(
+            salon=salon, date_shave=date_shave, amount=amount, exchange_rate=exchange_rate,
+            amount_in_default_currency=amount_in_default_currency,
+            barber_id=ImportService.resolve(lookups, 'barber', row['barber']),
+            hairstyle_id=ImportService.resolve(lookups, 'hairstyle', row['hairstyle']),
+            currency_id=ImportService.resolve(lookups, 'currency', row['currency']),
+            cashregister_id=ImportService.resolve(lookups, 'cash_register', row['cash_register']),
+            client_id=ImportService.resolve(lookups, 'client', row['client']) if (row.get('client') or '').strip() else None,
+            status=ImportService.clean_choice(Shave.Status, 'status', row.get('status'), Shave.Status.COMPLETED),
+        )
+
+    @staticmethod
+    def build_transaction(salon, lookups, row, seen):
+        amount, exchange_rate, amount_in_default_currency = ImportService.build_amounts(Transaction, row)
+        if amount <= 0:
+            raise ValidationError("amount: must be greater than zero")
+        trans_name = ImportService.clean_field(Transaction, 'trans_name', (row['name'] or '').strip())
+        date_trans = ImportService.clean_field(Transaction, 'date_trans', row['date'])
+        # (name, salon, date) is unique: checked against the file and the salon's existing rows
+        if (trans_name, date_trans) in seen:
+            raise ValidationError(f"a transaction '{trans_name}' already exists on {date_trans}")
+        seen.add((trans_name, date_trans))
+        return Transaction(
+            salon=salon, trans_name=trans_name, date_trans=date_trans, amount=amount, exchange_rate=exchange_rate,
+            amount_in_default_currency=amount_in_default_currency,
+            trans_type=ImportService.clean_choice(Transaction.TransactionType, 'type', row['type']),
+            currency_id=ImportService.resolve(lookups, 'currency', row['currency']),
+            cashregister_id=ImportService.resolve(lookups, 'cash_register', row['cash_register']),
+        )
+
+    @staticmethod
+    def import_rows(salon, kind, rows, chunk_size=1000, dry_run=False):
+        """
+        Validates and inserts CSV rows (dicts) of the given kind for a salon, chunk by chunk, without
+        per-row signals. Registers, daily stats and commission accruals are brought up to date once at
+        the end. Invalid rows are skipped and reported with their line number.
+        """
+        start = perf_counter()
+        rows = iter(rows)
+        first_row = next(rows, None)
+        if first_row is None:
+            return {'created': 0, 'valid': 0, 'errors': [], 'rows': 0, 'seconds': 0, 'rows_per_second': 0}
+        missing = [column for column, required in ImportService.COLUMNS[kind].items() if required and column not in first_row]
+        if missing:
+            raise ValidationError(f"Missing columns: {', '.join(missing)}")
+
+        model, build = (Shave, ImportService.build_shave) if kind == 'shaves' else (Transaction, ImportService.build_transaction)
+        lookups = ImportService.get_lookups(salon)
+        seen = set(Transaction.objects.filter(salon=salon).values_list('trans_name', 'date_trans')) if kind == 'transactions' else set()
+        errors, first_days = [], {}
+        count = valid = created = 0
+        last_day = None
+
+        def insert(objects):
+            nonlocal created, last_day
+            if dry_run or not objects:
+                return
+            model.objects.bulk_create(objects, batch_size=chunk_size)
+            for obj in objects:
+                day = as_day(obj.date_shave if kind == 'shaves' else obj.date_trans, salon.tzinfo)
+                first_days[obj.cashregister_id] = min(first_days.get(obj.cashregister_id, day), day)
+                last_day = max(last_day, day) if last_day else day
+            if kind == 'shaves':
+                BarberService.accrue_shaves(Shave.objects.filter(pk__in=[obj.pk for obj in objects]))
+            created += len(objects)
+
+        with transaction.atomic():
+            chunk = []
+            for line, row in enumerate(chain([first_row], rows), start=2):
+                count += 1
+                try:
+                    chunk.append(build(salon, lookups, row, seen))
+                    valid += 1
+                except ValidationError as e:
+                    errors.append((line, ' '.join(e.messages)))
+                if len(chunk) >= chunk_size:
+                    insert(chunk)
+                    chunk = []
+            insert(chunk)
+
+            if created:
+                for cash_register_id, first_day in first_days.items():
+                    CashRegisterService.mark_for_reconcile([cash_register_id], first_day)
+                DailyStatsService.rebuild([salon.pk], min(first_days.values()), last_day)
+
+        seconds = perf_counter() - start
+        return {
+            'created': created,
+            'valid': valid,
+            'errors': errors,
+            'rows': count,
+            'seconds': seconds,
+            'rows_per_second': count / seconds if seconds else 0,
+        }
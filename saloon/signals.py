@@ -1,60 +1,204 @@
 # signals.py
 
-from django.db.models.signals import post_save, post_delete
+from django.db.models.signals import pre_save, post_save, pre_delete, post_delete
 from django.dispatch import receiver
-from .models import Shave, ItemUsed, ItemPurchase, Payment, Transaction, Item
-from .services import CashRegisterService
+from .models import Salon, Barber, CashRegister, Shave, ItemUsed, ItemPurchase, Payment, Transaction, Item, Commission, RegisterClose
+from .services import CashRegisterService, InventoryService, BarberService, DailyStatsService
+from .cache import bump_version, bump_owner_version
 from decimal import Decimal
 
+@receiver(pre_save, sender=Shave)
+@receiver(pre_save, sender=Transaction)
+@receiver(pre_save, sender=ItemUsed)
+@receiver(pre_save, sender=ItemPurchase)
+@receiver(pre_save, sender=Payment)
+@receiver(pre_save, sender=Commission)
+@receiver(pre_save, sender=Salon)
+def load_previous_values(sender, instance, **kwargs):
+    # Instances built by hand or loaded with deferred fields don't know what they are replacing
+    if instance._state.adding or instance.pk is None:
+        return
+    if instance._loaded_values is None or len(instance._loaded_values) < len(sender._meta.concrete_fields):
+        instance._loaded_values = sender._base_manager.filter(pk=instance.pk).values().first()
+
+def is_owner_cascade(origin):
+    # Deleting a salon, register or barber also deletes their daily stats rows: nothing to update
+    model = origin.model if hasattr(origin, 'model') else type(origin)
+    return model in (Salon, CashRegister, Barber)
+
+def get_saved_values(instance, created):
+    # Values before this save (None on creation) and after it; the instance then tracks the new state
+    old = None if created else instance._loaded_values
+    new = instance.get_current_values()
+    instance._loaded_values = new
+    return old, new
+
 @receiver(post_save, sender=Shave)
 def update_cashregister_on_shave(sender, instance, created, **kwargs):
-    if instance.status == Shave.Status.COMPLETED:
-        CashRegisterService.update_balance(instance.cashregister)
+    old, new = get_saved_values(instance, created)
+    CashRegisterService.apply_entries(CashRegisterService.get_shave_change_entries(old, new))
+    DailyStatsService.apply_changes(DailyStatsService.get_shave_change_changes(old, new))
+    if BarberService.get_shave_accrual_changed(old, new):
+        BarberService.accrue_shaves(Shave.objects.filter(pk=instance.pk))
 
 @receiver(post_save, sender=Transaction)
 def update_cashregister_on_transaction(sender, instance, created, **kwargs):
-    CashRegisterService.update_balance(instance.cashregister)
+    old, new = get_saved_values(instance, created)
+    CashRegisterService.apply_entries(
+        CashRegisterService.transaction_entries(old, -1) + CashRegisterService.transaction_entries(new)
+    )
+    DailyStatsService.apply_changes(
+        DailyStatsService.transaction_changes(old, -1) + DailyStatsService.transaction_changes(new)
+    )
 
 @receiver(post_save, sender=ItemUsed)
 def update_stock_and_cashregister_on_item_used(sender, instance, created, **kwargs):
-    if created:
-        instance.item.current_stock -= instance.quantity
-        instance.item.save()
-    CashRegisterService.update_balance(instance.shave.cashregister)
+    old, new = get_saved_values(instance, created)
+    InventoryService.apply_stock_changes(
+        InventoryService.item_used_stock_changes(old, -1) + InventoryService.item_used_stock_changes(new)
+    )
+    if old is None or any(old[field] != new[field] for field in ('item_id', 'quantity', 'used_date')):
+        # Uses are taken from the lots in date order: only the last use of an item can be consumed in place
+        positions = [new] if old is None else [old, new]
+        if any(InventoryService.has_later_uses(instance.pk, values['item_id'], values['used_date'], values['created_at']) for values in positions):
+            InventoryService.rebuild_item_lots(Item.objects.filter(pk__in={values['item_id'] for values in positions}))
+        else:
+            if old is not None:
+                InventoryService.release_lots(instance.pk)
+            InventoryService.consume_lots(instance)
+    CashRegisterService.apply_entries(
+        CashRegisterService.item_used_entries(old, -1) + CashRegisterService.item_used_entries(new)
+    )
+    DailyStatsService.apply_changes(
+        DailyStatsService.item_used_changes(old, -1) + DailyStatsService.item_used_changes(new)
+    )
 
 @receiver(post_save, sender=ItemPurchase)
 def update_stock_and_cashregister_on_item_purchase(sender, instance, created, **kwargs):
-    if created:
-        instance.item.current_stock += instance.quantity
-        instance.item.save()
-    CashRegisterService.update_balance(instance.cashregister)
+    old, new = get_saved_values(instance, created)
+    InventoryService.apply_stock_changes(
+        InventoryService.item_purchase_stock_changes(old, -1) + InventoryService.item_purchase_stock_changes(new)
+    )
+    if old is not None and (old['item_id'] != new['item_id'] or old['purchase_date'] != new['purchase_date']):
+        InventoryService.rebuild_item_lots(Item.objects.filter(pk__in=[old['item_id'], new['item_id']]))
+    elif old is None or old['quantity'] != new['quantity']:
+        if InventoryService.is_out_of_order_lot(instance.pk, new['item_id'], new['purchase_date']):
+            InventoryService.rebuild_item_lots(Item.objects.filter(pk=new['item_id']))
+        elif old is not None:
+            InventoryService.resize_lot(instance.pk, new['quantity'] - old['quantity'])
+    CashRegisterService.apply_entries(
+        CashRegisterService.item_purchase_entries(old, -1) + CashRegisterService.item_purchase_entries(new)
+    )
+    DailyStatsService.apply_changes(
+        DailyStatsService.item_purchase_changes(old, -1) + DailyStatsService.item_purchase_changes(new)
+    )
 
 @receiver(post_save, sender=Payment)
 def update_cashregister_on_payment(sender, instance, created, **kwargs):
-    CashRegisterService.update_balance(instance.cashregister)
+    old, new = get_saved_values(instance, created)
+    CashRegisterService.apply_entries(
+        CashRegisterService.payment_entries(old, -1) + CashRegisterService.payment_entries(new)
+    )
+    DailyStatsService.apply_changes(
+        DailyStatsService.payment_changes(old, -1) + DailyStatsService.payment_changes(new)
+    )
+
+@receiver(post_save, sender=Salon)
+@receiver(post_delete, sender=Salon)
+def invalidate_owner_salons(sender, instance, **kwargs):
+    # Retires the session copies of the salon lists of the previous and the current owner (see SalonContext);
+    # connected before the receivers that replace _loaded_values with the saved state
+    previous = instance._loaded_values or {}
+    for owner_id in {previous.get('owner_id'), instance.owner_id}:
+        bump_owner_version(owner_id)
+
+@receiver(post_save, sender=Salon)
+def rebuild_daily_stats_on_timezone_change(sender, instance, created, **kwargs):
+    old, new = get_saved_values(instance, created)
+    if old is not None and old['timezone'] != new['timezone']:
+        DailyStatsService.rebuild([instance.pk])
+        # The closes counted their days in the previous time zone
+        RegisterClose.objects.filter(salon=instance).delete()
+
+@receiver(post_save, sender=Commission)
+def reaccrue_on_commission(sender, instance, created, **kwargs):
+    old, new = get_saved_values(instance, created)
+    if old is None or old['barber_id'] == new['barber_id']:
+        start_date = new['effective_date'] if old is None else min(old['effective_date'], new['effective_date'])
+        BarberService.reaccrue_barber(new['barber_id'], start_date)
+    else:
+        BarberService.reaccrue_barber(old['barber_id'], old['effective_date'])
+        BarberService.reaccrue_barber(new['barber_id'], new['effective_date'])
+
+@receiver(post_delete, sender=Commission)
+def reaccrue_on_commission_delete(sender, instance, **kwargs):
+    BarberService.reaccrue_barber(instance.barber_id, instance.effective_date)
 
 @receiver(post_delete, sender=Shave)
 def revert_cashregister_on_shave_delete(sender, instance, **kwargs):
-    if instance.status == Shave.Status.COMPLETED:
-        CashRegisterService.update_balance(instance.cashregister)
+    # Items used are deleted (and reverted) before the shave itself
+    CashRegisterService.apply_entries(
+        CashRegisterService.get_shave_change_entries(instance.get_current_values(), None)
+    )
+    if not is_owner_cascade(kwargs.get('origin')):
+        DailyStatsService.apply_changes(DailyStatsService.get_shave_change_changes(instance.get_current_values(), None))
+
+@receiver(pre_delete, sender=ItemUsed)
+def release_lots_on_item_used_delete(sender, instance, **kwargs):
+    InventoryService.release_lots(instance.pk)
+    # The later uses move up to the released lots
+    instance._had_later_uses = InventoryService.has_later_uses(instance.pk, instance.item_id, instance.used_date, instance.created_at)
 
 @receiver(post_delete, sender=ItemUsed)
 def revert_stock_and_cashregister_on_item_used_delete(sender, instance, **kwargs):
-    instance.item.current_stock += instance.quantity
-    instance.item.save()
-    CashRegisterService.update_balance(instance.shave.cashregister)
+    if instance._had_later_uses:
+        InventoryService.rebuild_item_lots(Item.objects.filter(pk=instance.item_id))
+    InventoryService.apply_stock_changes(InventoryService.item_used_stock_changes(instance.get_current_values(), -1))
+    CashRegisterService.apply_entries(CashRegisterService.item_used_entries(instance.get_current_values(), -1))
+    if not is_owner_cascade(kwargs.get('origin')):
+        DailyStatsService.apply_changes(DailyStatsService.item_used_changes(instance.get_current_values(), -1))
+
+@receiver(pre_delete, sender=ItemPurchase)
+def check_lot_consumptions_on_item_purchase_delete(sender, instance, **kwargs):
+    instance._had_consumptions = instance.consumptions.exists()
 
 @receiver(post_delete, sender=ItemPurchase)
 def revert_stock_and_cashregister_on_item_purchase_delete(sender, instance, **kwargs):
-    instance.item.current_stock -= instance.quantity
-    instance.item.save()
-    CashRegisterService.update_balance(instance.cashregister)
+    if instance._had_consumptions:
+        # The uses that drew from this lot take from the other lots instead
+        InventoryService.rebuild_item_lots(Item.objects.filter(pk=instance.item_id))
+    InventoryService.apply_stock_changes(InventoryService.item_purchase_stock_changes(instance.get_current_values(), -1))
+    CashRegisterService.apply_entries(CashRegisterService.item_purchase_entries(instance.get_current_values(), -1))
+    if not is_owner_cascade(kwargs.get('origin')):
+        DailyStatsService.apply_changes(DailyStatsService.item_purchase_changes(instance.get_current_values(), -1))
 
 @receiver(post_delete, sender=Payment)
 def revert_cashregister_on_payment_delete(sender, instance, **kwargs):
-    CashRegisterService.update_balance(instance.cashregister)
+    CashRegisterService.apply_entries(CashRegisterService.payment_entries(instance.get_current_values(), -1))
+    if not is_owner_cascade(kwargs.get('origin')):
+        DailyStatsService.apply_changes(DailyStatsService.payment_changes(instance.get_current_values(), -1))
 
 @receiver(post_delete, sender=Transaction)
 def revert_cashregister_on_transaction_delete(sender, instance, **kwargs):
-    CashRegisterService.update_balance(instance.cashregister)
+    CashRegisterService.apply_entries(CashRegisterService.transaction_entries(instance.get_current_values(), -1))
+    if not is_owner_cascade(kwargs.get('origin')):
+        DailyStatsService.apply_changes(DailyStatsService.transaction_changes(instance.get_current_values(), -1))
 
+@receiver(post_save, sender=Shave)
+@receiver(post_save, sender=Transaction)
+@receiver(post_save, sender=ItemUsed)
+@receiver(post_save, sender=ItemPurchase)
+@receiver(post_save, sender=Payment)
+@receiver(post_save, sender=Item)
+@receiver(post_save, sender=Salon)
+@receiver(post_delete, sender=Shave)
+@receiver(post_delete, sender=Transaction)
+@receiver(post_delete, sender=ItemUsed)
+@receiver(post_delete, sender=ItemPurchase)
+@receiver(post_delete, sender=Payment)
+@receiver(post_delete, sender=Item)
+@receiver(post_delete, sender=CashRegister)
+@receiver(post_delete, sender=Barber)
+def invalidate_salon_reports(sender, instance, **kwargs):
+    # Cached reports are keyed by the salon version: bumping it retires them all at once
+    bump_version(instance.pk if sender is Salon else instance.salon_id)
@@ -0,0 +1,49 @@
+from unittest import mock
+
+from django.test import TestCase, override_settings
+from django.urls import reverse
+
+from saloon.management.commands._seed import create_salon_fixture, build_shave
+from saloon.middleware import SALON_SESSION_KEY
+
+
+# Without DEBUG the settings redirect plain http to https, before the views answer
+@override_settings(SECURE_SSL_REDIRECT=False)
+class SalonOwnershipTests(TestCase):
+    def setUp(self):
+        self.fixture = create_salon_fixture('access')
+        build_shave(self.fixture).save()
+        self.other = create_salon_fixture('other')
+        self.client.force_login(self.fixture.owner)
+
+    def urls(self, salon):
+        return [
+            reverse('saloon:shave_list', kwargs={'salon_id': salon.pk}),
+            reverse('saloon:shave_export', kwargs={'salon_id': salon.pk}),
+            reverse('saloon:report_timeseries', kwargs={'salon_id': salon.pk}),
+        ]
+
+    def test_owner_reads_own_salon(self):
+        for url in self.urls(self.fixture.salon):
+            self.assertEqual(self.client.get(url).status_code, 200, url)
+
+    def test_foreign_salon_is_not_served(self):
+        response = self.client.get(self.urls(self.other.salon)[0])
+        self.assertNotContains(response, self.other.barber.user.email)
+        for url in self.urls(self.other.salon)[1:]:
+            self.assertEqual(self.client.get(url).status_code, 404, url)
+
+    def test_stale_session_ids_do_not_grant_access(self):
+        # The owner versions do not move, as when the cache lost or never shared the bump
+        with mock.patch('saloon.middleware.get_owner_version', return_value=1):
+            self.client.get(self.urls(self.fixture.salon)[0])
+            self.assertIn(self.fixture.salon.pk, self.client.session[SALON_SESSION_KEY]['ids'])
+            self.fixture.salon.owner = self.other.owner
+            self.fixture.salon.save()
+
+            self.assertIn(self.fixture.salon.pk, self.client.session[SALON_SESSION_KEY]['ids'])
+            list_url, export_url, timeseries_url = self.urls(self.fixture.salon)
+            response = self.client.get(list_url)
+            self.assertEqual(list(response.context['object_list']), [])
+            self.assertEqual(self.client.get(export_url).status_code, 404)
+            self.assertEqual(self.client.get(timeseries_url).status_code, 404)
@@ -0,0 +1,141 @@
+from decimal import Decimal
+
+from django.test import override_settings
+from django.urls import reverse
+from rest_framework.test import APITestCase
+
+from saloon.management.commands._seed import create_salon_fixture, build_shave
+from saloon.models import Item, ItemPurchase, Shave
+
+
+# Without DEBUG the settings redirect plain http to https, before the API answers
+@override_settings(PASSWORD_HASHERS=['django.contrib.auth.hashers.MD5PasswordHasher'], SECURE_SSL_REDIRECT=False)
+class ApiTestCase(APITestCase):
+    password = 'api-password-1'
+
+    def setUp(self):
+        self.fixture = create_salon_fixture('api')
+        self.fixture.owner.set_password(self.password)
+        self.fixture.owner.save()
+        self.other = create_salon_fixture('api-other')
+        response = self.client.post(reverse('api_v1:token_obtain_pair'), {'email': self.fixture.owner.email, 'password': self.password}, format='json')
+        self.assertEqual(response.status_code, 200)
+        self.tokens = response.json()
+        self.client.credentials(HTTP_AUTHORIZATION=f"Bearer {self.tokens['access']}")
+
+    def url(self, name, salon=None, **kwargs):
+        return reverse(f'api_v1:{name}', kwargs={'salon_id': (salon or self.fixture.salon).pk, **kwargs})
+
+    def shave_payload(self, fixture=None):
+        fixture = fixture or self.fixture
+        return {
+            'barber': fixture.barber.pk, 'hairstyle': fixture.hairstyle.pk, 'amount': '12.50',
+            'currency': fixture.currency.pk, 'exchange_rate': '2', 'cashregister': fixture.cash_register.pk,
+        }
+
+
+class AuthenticationTests(ApiTestCase):
+    def test_requests_without_token_are_refused(self):
+        self.client.credentials()
+        self.assertEqual(self.client.get(self.url('shave-list')).status_code, 401)
+
+    def test_wrong_password_gets_no_token(self):
+        response = self.client.post(reverse('api_v1:token_obtain_pair'), {'email': self.fixture.owner.email, 'password': 'wrong'}, format='json')
+        self.assertEqual(response.status_code, 401)
+
+    def test_refresh_token_gives_a_working_access_token(self):
+        response = self.client.post(reverse('api_v1:token_refresh'), {'refresh': self.tokens['refresh']}, format='json')
+        self.assertEqual(response.status_code, 200)
+        self.client.credentials(HTTP_AUTHORIZATION=f"Bearer {response.json()['access']}")
+        self.assertEqual(self.client.get(self.url('shave-list')).status_code, 200)
+
+    def test_token_requests_create_no_session(self):
+        self.client.get(self.url('shave-list'))
+        self.assertNotIn('sessionid', self.client.cookies)
+
+
+class IsolationTests(ApiTestCase):
+    def test_salon_list_shows_own_salons_only(self):
+        ids = [salon['id'] for salon in self.client.get(reverse('api_v1:salon-list')).json()['results']]
+        self.assertEqual(ids, [self.fixture.salon.pk])
+
+    def test_other_owners_salon_is_not_found(self):
+        shave = build_shave(self.other)
+        shave.save()
+        for name in ('shave-list', 'item-list', 'client-list', 'transaction-list', 'payment-list', 'cashregister-list'):
+            self.assertEqual(self.client.get(self.url(name, self.other.salon)).status_code, 404, name)
+        self.assertEqual(self.client.get(self.url('shave-detail', self.other.salon, pk=shave.pk)).status_code, 404)
+        self.assertEqual(self.client.post(self.url('shave-list', self.other.salon), self.shave_payload(self.other), format='json').status_code, 404)
+        self.assertEqual(self.client.delete(self.url('shave-detail', self.other.salon, pk=shave.pk)).status_code, 404)
+        self.assertTrue(Shave.objects.filter(pk=shave.pk).exists())
+
+    def test_rows_of_another_salon_cannot_be_referenced(self):
+        payload = dict(self.shave_payload(), barber=self.other.barber.pk)
+        response = self.client.post(self.url('shave-list'), payload, format='json')
+        self.assertEqual(response.status_code, 400)
+        self.assertIn('barber', response.json())
+
+    def test_transferred_salon_is_no_longer_served(self):
+        self.fixture.salon.owner = self.other.owner
+        self.fixture.salon.save()
+        self.assertEqual(self.client.get(self.url('shave-list')).status_code, 404)
+
+
+class ShaveApiTests(ApiTestCase):
+    def test_create_computes_the_default_currency_amount(self):
+        response = self.client.post(self.url('shave-list'), self.shave_payload(), format='json')
+        self.assertEqual(response.status_code, 201)
+        shave = Shave.objects.get(pk=response.json()['id'])
+        self.assertEqual(shave.salon, self.fixture.salon)
+        self.assertEqual(shave.amount_in_default_currency, Decimal('25.00'))
+
+    def test_cursor_pagination_walks_every_row_once(self):
+        for _ in range(7):
+            build_shave(self.fixture).save()
+        seen, url = [], self.url('shave-list') + '?page_size=3'
+        while url:
+            with self.assertNumQueries(3):
+                page = self.client.get(url).json()
+            self.assertLessEqual(len(page['results']), 3)
+            seen += [shave['id'] for shave in page['results']]
+            url = page['next']
+        expected = list(Shave.objects.filter(salon=self.fixture.salon).order_by('-date_shave', '-id').values_list('pk', flat=True))
+        self.assertEqual(seen, expected)
+
+    def test_sparse_fields(self):
+        build_shave(self.fixture).save()
+        with self.assertNumQueries(3):
+            response = self.client.get(self.url('shave-list') + '?fields=id,amount,barber_name')
+        self.assertEqual(set(response.json()['results'][0]), {'id', 'amount', 'barber_name'})
+
+    def test_unknown_field_is_a_bad_request(self):
+        self.assertEqual(self.client.get(self.url('shave-list') + '?fields=id,nope').status_code, 400)
+
+    def test_duplicate_transaction_is_a_bad_request(self):
+        payload = {
+            'trans_name': 'Rent', 'trans_type': 'EXPENSE', 'amount': '5', 'currency': self.fixture.currency.pk,
+            'exchange_rate': '1', 'cashregister': self.fixture.cash_register.pk,
+        }
+        self.assertEqual(self.client.post(self.url('transaction-list'), payload, format='json').status_code, 201)
+        response = self.client.post(self.url('transaction-list'), payload, format='json')
+        self.assertEqual(response.status_code, 400)
+        self.assertIn('non_field_errors', response.json())
+
+
+class ItemApiTests(ApiTestCase):
+    def test_items_carry_their_valuation(self):
+        item = Item.objects.create(
+            name='Wax', price=Decimal('4.00'), currency=self.fixture.currency,
+            amount_in_default_currency=Decimal('4.00'), salon=self.fixture.salon,
+        )
+        for quantity, price in ((1, '10.00'), (2, '5.00')):
+            ItemPurchase.objects.create(
+                item=item, quantity=quantity, purchase_price=Decimal(price), currency=self.fixture.currency, exchange_rate=Decimal('1'),
+                purchase_price_in_default_currency=Decimal(price), cashregister=self.fixture.cash_register, salon=self.fixture.salon,
+            )
+        response = self.client.get(self.url('item-list'))
+        self.assertEqual(response.status_code, 200)
+        row = response.json()['results'][0]
+        self.assertEqual(row['remaining_quantity'], 3)
+        self.assertEqual(row['remaining_value'], '20.00')
+        self.assertEqual(row['avg_remaining_price'], '6.666667')
@@ -0,0 +1,134 @@
+from datetime import timedelta
+from decimal import Decimal
+from unittest import mock
+
+from django.db.models import F
+from django.utils import timezone
+
+from saloon.management.commands._seed import build_shave
+from saloon.management.commands.reconcile_registers import check_salons
+from saloon.models import CashRegister, Payment, PaymentType, Shave, Transaction
+from saloon.services import CashRegisterService, deferred_balance_updates
+from saloon.tests.test_inventory import InventoryTestCase
+
+
+class LedgerTestCase(InventoryTestCase):
+    # Writes of every kind that reaches a register, through the models and their signals
+    def setUp(self):
+        super().setUp()
+        self.other_register = CashRegister.objects.create(name='Back', currency=self.fixture.currency, salon=self.fixture.salon)
+        self.payment_type = PaymentType.objects.create(name='Cash', salon=self.fixture.salon)
+
+    def shave(self, amount='10.00', days_ago=0, status=Shave.Status.COMPLETED):
+        shave = build_shave(self.fixture, date_shave=timezone.now() - timedelta(days=days_ago), amount=Decimal(amount), status=status)
+        shave.save()
+        return shave
+
+    def transaction(self, amount, trans_type=Transaction.TransactionType.INCOME, days_ago=0):
+        return Transaction.objects.create(
+            trans_name='Tip', amount=Decimal(amount), currency=self.fixture.currency, amount_in_default_currency=Decimal(amount),
+            date_trans=timezone.localdate() - timedelta(days=days_ago), trans_type=trans_type,
+            cashregister=self.fixture.cash_register, salon=self.fixture.salon,
+        )
+
+    def payment(self, amount, days_ago=0):
+        day = timezone.localdate() - timedelta(days=days_ago)
+        return Payment.objects.create(
+            barber=self.fixture.barber, amount=Decimal(amount), currency=self.fixture.currency,
+            amount_in_default_currency=Decimal(amount), start_date=day, end_date=day, date_payment=day,
+            payment_type=self.payment_type, cashregister=self.fixture.cash_register, salon=self.fixture.salon,
+        )
+
+    def write_history(self):
+        """
+        Creates, edits and deletes one row of every kind, each edit touching the fields the balances depend on,
+        and yields after each write.
+        """
+        shave = self.shave('30.00', days_ago=3)
+        yield 'shave created'
+        shave.amount = shave.amount_in_default_currency = Decimal('35.00')
+        shave.save()
+        yield 'shave amount changed'
+        shave.cashregister = self.other_register
+        shave.save()
+        yield 'shave moved to another register'
+        scheduled = self.shave('20.00', status=Shave.Status.SCHEDULED)
+        scheduled.status = Shave.Status.COMPLETED
+        scheduled.save()
+        yield 'shave completed'
+
+        purchase = self.purchase(4, '2.50', days_ago=5)
+        yield 'purchase created'
+        purchase.quantity = 6
+        purchase.save()
+        yield 'purchase quantity changed'
+        item_used = self.use(2)
+        yield 'item used'
+        item_used.quantity = 3
+        item_used.save()
+        yield 'item used quantity changed'
+        item_used.shave.status = Shave.Status.CANCELLED
+        item_used.shave.save()
+        yield 'shave with items cancelled'
+
+        income = self.transaction('12.00', days_ago=1)
+        expense = self.transaction('7.00', Transaction.TransactionType.EXPENSE)
+        yield 'transactions created'
+        income.trans_type = Transaction.TransactionType.EXPENSE
+        income.save()
+        yield 'transaction type changed'
+        payment = self.payment('8.00', days_ago=2)
+        yield 'payment created'
+        payment.amount = payment.amount_in_default_currency = Decimal('9.00')
+        payment.cashregister = self.other_register
+        payment.save()
+        yield 'payment changed'
+
+        for instance in (expense, payment, item_used, shave, scheduled):
+            instance.delete()
+            yield f'{instance._meta.model_name} deleted'
+        purchase.delete()
+        yield 'purchase deleted'
+
+
+class BalanceConsistencyTests(LedgerTestCase):
+    def registers(self):
+        return CashRegister.objects.filter(salon=self.fixture.salon)
+
+    def test_signal_deltas_match_a_recompute(self):
+        for step in self.write_history():
+            with self.subTest(step=step):
+                self.assertEqual(CashRegisterService.find_discrepancies(self.registers()), [])
+
+        stored = dict(self.registers().values_list('pk', 'balance_cash'))
+        recomputed = {cash_register.pk: cash_register.balance_cash for cash_register in CashRegisterService.recompute_many(self.registers())}
+        self.assertEqual(stored, recomputed)
+
+    def test_deferred_updates_match_a_recompute(self):
+        with self.captureOnCommitCallbacks(execute=True):
+            with deferred_balance_updates():
+                for step in self.write_history():
+                    pass
+        self.assertEqual(CashRegisterService.find_discrepancies(self.registers()), [])
+
+
+# The workers close their connections when done, which would end the test's transaction
+@mock.patch('saloon.management.commands.reconcile_registers.connections.close_all')
+class ReconcileTests(LedgerTestCase):
+    def test_history_has_no_discrepancies(self, close_all):
+        for step in self.write_history():
+            pass
+        self.assertEqual(check_salons([self.fixture.salon.pk], None, repair=False), (2, []))
+
+    def test_drifted_balances_are_found_and_repaired(self, close_all):
+        self.shave('10.00')
+        self.transaction('5.00')
+        # update() skips the signals, like a write made outside the application
+        CashRegister.objects.filter(pk=self.fixture.cash_register.pk).update(balance_cash=F('balance_cash') + 1)
+
+        count, discrepancies = check_salons([self.fixture.salon.pk], None, repair=True)
+        self.assertEqual(count, 2)
+        self.assertEqual([(d['cashregister_id'], d['stored_cash'], d['recomputed_cash']) for d in discrepancies], [
+            (self.fixture.cash_register.pk, Decimal('16.00'), Decimal('15.00')),
+        ])
+        self.assertEqual(check_salons([self.fixture.salon.pk], None, repair=False), (2, []))
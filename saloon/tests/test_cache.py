@@ -0,0 +1,49 @@
+from io import StringIO
+
+from django.core.cache import cache
+from django.core.management import call_command
+from django.core.management.base import SystemCheckError
+from django.test import SimpleTestCase, override_settings
+
+from saloon.cache import bump_version, get_version, version_key
+from saloon.checks import check_shared_cache
+
+LOCMEM = {'default': {'BACKEND': 'django.core.cache.backends.locmem.LocMemCache'}}
+DATABASE = {'default': {'BACKEND': 'django.core.cache.backends.db.DatabaseCache', 'LOCATION': 'saloon_cache'}}
+
+
+@override_settings(CACHES=LOCMEM)
+class VersionTests(SimpleTestCase):
+    def test_bump_moves_the_version(self):
+        version = get_version(1)
+        bump_version(1)
+        self.assertNotEqual(get_version(1), version)
+
+    def test_lost_version_does_not_restart_at_a_used_value(self):
+        seen = {get_version(1)}
+        for _ in range(3):
+            bump_version(1)
+            seen.add(get_version(1))
+        cache.delete(version_key(1))
+        self.assertNotIn(get_version(1), seen)
+        # Nor after a bump of a lost version
+        cache.delete(version_key(1))
+        bump_version(1)
+        self.assertNotIn(get_version(1), seen)
+
+
+class SharedCacheCheckTests(SimpleTestCase):
+    @override_settings(CACHES=LOCMEM)
+    def test_per_process_cache_is_an_error(self):
+        self.assertEqual([error.id for error in check_shared_cache(None)], ['saloon.E001'])
+
+    @override_settings(CACHES=DATABASE)
+    def test_shared_cache_passes(self):
+        self.assertEqual(check_shared_cache(None), [])
+
+    # The test runner turns DEBUG off before checking: the default dev settings (DEBUG, LocMemCache) must still boot
+    @override_settings(DEBUG=False, CACHES=LOCMEM)
+    def test_dev_settings_boot_the_test_runner(self):
+        call_command('check', tags=['caches'], stdout=StringIO())
+        with self.assertRaisesMessage(SystemCheckError, 'saloon.E001'):
+            call_command('check', '--deploy', tags=['caches'], stdout=StringIO())
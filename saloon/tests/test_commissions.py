@@ -0,0 +1,92 @@
+from datetime import timedelta
+from decimal import Decimal
+
+from django.contrib.auth import get_user_model
+from django.test import TestCase
+from django.utils import timezone
+
+from saloon.management.commands._seed import create_salon_fixture, build_shave
+from saloon.models import Barber, CommissionAccrual, Commission, Payment, PaymentType, Shave
+from saloon.services import BarberService
+
+
+class AccrualConsistencyTests(TestCase):
+    def setUp(self):
+        self.fixture = create_salon_fixture('accruals')
+        barber_user = get_user_model().objects.create_user(email='accruals-second@example.com', password='x')
+        self.other_barber = Barber.objects.create(
+            user=barber_user, salon=self.fixture.salon, barber_type=self.fixture.barber.barber_type, start_date=timezone.localdate(),
+        )
+
+    def commission(self, percentage, days_ago, barber=None):
+        return Commission.objects.create(
+            barber=barber or self.fixture.barber, percentage=Decimal(percentage), fixed_amount=Decimal('1.00'),
+            effective_date=timezone.now() - timedelta(days=days_ago),
+        )
+
+    def shave(self, amount, days_ago, status=Shave.Status.COMPLETED):
+        shave = build_shave(self.fixture, date_shave=timezone.now() - timedelta(days=days_ago), amount=Decimal(amount), status=status)
+        shave.save()
+        return shave
+
+    def accruals(self):
+        return sorted(CommissionAccrual.objects.filter(salon=self.fixture.salon).values_list('shave', 'barber', 'commission', 'amount'))
+
+    def assertAccrualsMatchRebuild(self):
+        accruals = self.accruals()
+        BarberService.accrue_shaves(Shave.objects.filter(salon=self.fixture.salon))
+        self.assertEqual(accruals, self.accruals())
+
+    def test_signal_accruals_match_a_rebuild(self):
+        first_rate = self.commission('10.00', days_ago=30)
+        self.commission('20.00', days_ago=30, barber=self.other_barber)
+        old = self.shave('50.00', days_ago=20)
+        recent = self.shave('40.00', days_ago=2)
+        scheduled = self.shave('30.00', days_ago=1, status=Shave.Status.SCHEDULED)
+        # Before the first rate, and after the rate added below
+        self.shave('20.00', days_ago=35)
+        self.shave('25.00', days_ago=3)
+
+        def edit(instance, **values):
+            for field, value in values.items():
+                setattr(instance, field, value)
+            instance.save()
+
+        steps = [
+            ('shave amount changed', lambda: edit(recent, amount=Decimal('45.00'), amount_in_default_currency=Decimal('45.00'))),
+            ('shave completed', lambda: edit(scheduled, status=Shave.Status.COMPLETED)),
+            ('shave cancelled', lambda: edit(old, status=Shave.Status.CANCELLED)),
+            ('shave given to another barber', lambda: edit(recent, barber=self.other_barber)),
+            ('shave back-dated', lambda: edit(scheduled, date_shave=timezone.now() - timedelta(days=25))),
+            ('rate added mid-period', lambda: self.commission('15.00', days_ago=10)),
+            ('rate moved back', lambda: edit(first_rate, effective_date=timezone.now() - timedelta(days=40))),
+            ('rate moved to another barber', lambda: edit(first_rate, barber=self.other_barber)),
+            ('rate deleted', lambda: first_rate.delete()),
+            ('shave deleted', lambda: scheduled.delete()),
+        ]
+        for step, write in steps:
+            write()
+            with self.subTest(step=step):
+                self.assertAccrualsMatchRebuild()
+
+    def test_page_balances_match_the_single_barber_balance(self):
+        self.commission('10.00', days_ago=30)
+        self.commission('20.00', days_ago=30, barber=self.other_barber)
+        shave = self.shave('50.00', days_ago=5)
+        self.shave('30.00', days_ago=1)
+        shave.barber = self.other_barber
+        shave.save()
+        Payment.objects.create(
+            barber=self.other_barber, amount=Decimal('4.00'), currency=self.fixture.currency, amount_in_default_currency=Decimal('4.00'),
+            start_date=timezone.localdate(), end_date=timezone.localdate(), payment_type=PaymentType.objects.create(name='Cash', salon=self.fixture.salon),
+            cashregister=self.fixture.cash_register, salon=self.fixture.salon,
+        )
+
+        barbers = [self.fixture.barber, self.other_barber]
+        start_date = timezone.now() - timedelta(days=3)
+        for dates in ((None, None), (start_date, None)):
+            with self.subTest(dates=dates):
+                self.assertEqual(
+                    BarberService.calculate_balances(barbers, *dates),
+                    {barber.pk: BarberService.calculate_balance(barber, *dates) for barber in barbers},
+                )
@@ -0,0 +1,26 @@
+import csv
+
+from django.test import override_settings
+from django.urls import reverse
+
+from saloon.tests.test_balances import LedgerTestCase
+
+
+# Without DEBUG the settings redirect plain http to https, before the views answer
+@override_settings(SECURE_SSL_REDIRECT=False)
+class CsvExportTests(LedgerTestCase):
+    def test_formula_cells_are_exported_as_text(self):
+        names = ['=HYPERLINK("http://example.com")', '+1', '-2+3', '@SUM(A1)', 'Tip - cash', '-']
+        for name in names:
+            transaction = self.transaction('-5.00')
+            transaction.trans_name = name
+            transaction.save()
+        self.client.force_login(self.fixture.owner)
+
+        response = self.client.get(reverse('saloon:transaction_export', kwargs={'salon_id': self.fixture.salon.pk}))
+        rows = list(csv.DictReader(b''.join(response.streaming_content).decode().splitlines()))
+        self.assertEqual(sorted(row['name'] for row in rows), sorted([
+            '\'=HYPERLINK("http://example.com")', "'+1", "'-2+3", "'@SUM(A1)", 'Tip - cash', "'-",
+        ]))
+        # Numbers are not text, and keep their sign
+        self.assertEqual({row['amount'] for row in rows}, {'-5.00'})
@@ -0,0 +1,43 @@
+from datetime import timedelta
+from decimal import Decimal
+from importlib import import_module
+from io import StringIO
+from unittest import mock
+
+from django.apps import apps
+from django.utils import timezone
+
+from saloon.models import CommissionAccrual, Commission, ItemLotConsumption, ItemPurchase, SalonDailyStats
+from saloon.tests.test_balances import LedgerTestCase
+
+backfill_migration = import_module('saloon.migrations.0016_backfill_derived_data')
+
+
+class BackfillTests(LedgerTestCase):
+    def derived_data(self):
+        return (
+            sorted(CommissionAccrual.objects.values_list('shave', 'amount')),
+            sorted(SalonDailyStats.objects.values_list('day', 'cashregister', 'barber', 'revenue', 'purchases', 'items_cost')),
+            sorted(ItemPurchase.objects.values_list('pk', 'remaining_quantity')),
+            sorted(ItemLotConsumption.objects.values_list('item_used', 'purchase', 'quantity')),
+        )
+
+    def test_history_from_before_the_derived_tables_is_backfilled(self):
+        Commission.objects.create(
+            barber=self.fixture.barber, percentage=Decimal('10.00'), fixed_amount=Decimal('0.00'),
+            effective_date=timezone.now() - timedelta(days=30),
+        )
+        self.shave('30.00', days_ago=2)
+        self.purchase(4, '2.50', days_ago=3)
+        self.use(3)
+        expected = self.derived_data()
+
+        # As the tables were right after their migrations
+        CommissionAccrual.objects.all().delete()
+        SalonDailyStats.objects.all().delete()
+        ItemLotConsumption.objects.all().delete()
+        ItemPurchase.objects.update(remaining_quantity=0)
+
+        with mock.patch('sys.stdout', new_callable=StringIO):
+            backfill_migration.backfill(apps, None)
+        self.assertEqual(self.derived_data(), expected)
@@ -0,0 +1,87 @@
+from datetime import date, datetime
+from decimal import Decimal
+from zoneinfo import ZoneInfo
+
+from django.core.exceptions import ValidationError
+from django.test import TestCase
+
+from saloon.management.commands._seed import create_salon_fixture, build_shave
+from saloon.models import Commission, Payment, PaymentType, PayrollRun
+from saloon.services import PayrollService
+
+TOKYO = ZoneInfo('Asia/Tokyo')
+
+
+class PayrollTestCase(TestCase):
+    def setUp(self):
+        self.fixture = create_salon_fixture('payroll')
+        self.fixture.salon.timezone = 'Asia/Tokyo'
+        self.fixture.salon.save()
+        Commission.objects.create(
+            barber=self.fixture.barber, percentage=Decimal('10.00'), fixed_amount=Decimal('0.00'),
+            effective_date=datetime(2026, 1, 1, tzinfo=TOKYO),
+        )
+
+    def shave(self, local_time, amount):
+        build_shave(self.fixture, date_shave=local_time.replace(tzinfo=TOKYO), amount=Decimal(amount)).save()
+
+
+class PayrollPreviewTests(PayrollTestCase):
+    def test_period_follows_the_salon_days(self):
+        # In UTC, the first shave falls on February 28 and the last one on March 31
+        self.shave(datetime(2026, 3, 1, 0, 30), '100.00')
+        self.shave(datetime(2026, 3, 31, 23, 30), '50.00')
+        self.shave(datetime(2026, 4, 1, 0, 30), '1000.00')
+        self.shave(datetime(2026, 2, 28, 23, 30), '1000.00')
+
+        rows = PayrollService.preview(self.fixture.salon, date(2026, 3, 1), date(2026, 3, 31))
+        self.assertEqual([(row['barber'], row['commission']) for row in rows], [(self.fixture.barber, Decimal('15.00'))])
+
+    def test_consecutive_periods_split_the_commission(self):
+        for day in range(1, 4):
+            self.shave(datetime(2026, 3, day, 0, 15), '10.00')
+            self.shave(datetime(2026, 3, day, 23, 45), '10.00')
+        first = PayrollService.preview(self.fixture.salon, date(2026, 3, 1), date(2026, 3, 2))
+        second = PayrollService.preview(self.fixture.salon, date(2026, 3, 3), date(2026, 3, 9))
+        self.assertEqual(first[0]['commission'], Decimal('4.00'))
+        self.assertEqual(second[0]['commission'], Decimal('2.00'))
+
+
+class PayrollOverlapTests(PayrollTestCase):
+    def setUp(self):
+        super().setUp()
+        self.payment_type = PaymentType.objects.create(name='Cash', salon=self.fixture.salon)
+        for day in (1, 20):
+            for month in (2, 3, 4):
+                self.shave(datetime(2026, month, day, 12, 0), '100.00')
+
+    def payroll_run(self, start_date, end_date):
+        payroll_run = PayrollRun(
+            salon=self.fixture.salon, cashregister=self.fixture.cash_register, payment_type=self.payment_type,
+            start_date=start_date, end_date=end_date, date_payment=end_date,
+        )
+        payroll_run.full_clean()
+        return PayrollService.run(payroll_run)
+
+    def test_overlapping_runs_pay_each_day_once(self):
+        payments = self.payroll_run(date(2026, 3, 1), date(2026, 3, 31))
+        self.assertEqual([payment.amount for payment in payments], [Decimal('20.00')])
+
+        # Mar 20 was paid by the first run: the overlapping run is refused, and its preview has nobody left to pay
+        self.assertEqual(PayrollService.preview(self.fixture.salon, date(2026, 3, 15), date(2026, 4, 15)), [])
+        with self.assertRaises(ValidationError):
+            self.payroll_run(date(2026, 3, 15), date(2026, 4, 15))
+        self.assertEqual(Payment.objects.filter(barber=self.fixture.barber).count(), 1)
+
+        payments = self.payroll_run(date(2026, 4, 1), date(2026, 4, 30))
+        self.assertEqual([payment.amount for payment in payments], [Decimal('20.00')])
+
+    def test_payments_overlapping_the_period_are_deducted_by_shared_days(self):
+        # Feb 25 to Mar 6: 10 days, 6 of them in March
+        Payment.objects.create(
+            barber=self.fixture.barber, amount=Decimal('5.00'), currency=self.fixture.currency, amount_in_default_currency=Decimal('5.00'),
+            start_date=date(2026, 2, 25), end_date=date(2026, 3, 6), date_payment=date(2026, 3, 6),
+            payment_type=self.payment_type, cashregister=self.fixture.cash_register, salon=self.fixture.salon,
+        )
+        rows = PayrollService.preview(self.fixture.salon, date(2026, 3, 1), date(2026, 3, 31))
+        self.assertEqual([(row['paid'], row['amount']) for row in rows], [(Decimal('3.00'), Decimal('17.00'))])
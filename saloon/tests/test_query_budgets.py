@@ -0,0 +1,46 @@
+from django.db import connection
+from django.test import RequestFactory, TestCase, override_settings
+from django.test.utils import CaptureQueriesContext
+
+from saloon.management.commands._seed import create_salon_fixture
+from saloon.management.commands.check_query_budgets import LIST_VIEWS, add_rows
+from saloon.views import QueryBudgetExceeded, ShaveListView
+
+
+@override_settings(SALOON_ENFORCE_QUERY_BUDGETS=True)
+class QueryBudgetTests(TestCase):
+    """
+    Every salon list stays within its max_queries (QueryBudgetMixin raises QueryBudgetExceeded otherwise)
+    and runs as many queries with 30 more rows, each with its own barber, hairstyle and item, as with one.
+    """
+    rows = 30
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.fixture = create_salon_fixture('budget')
+        add_rows(cls.fixture, 1)
+
+    def render(self, view_class):
+        request = RequestFactory().get('/')
+        request.user = self.fixture.owner
+        response = view_class.as_view()(request, salon_id=self.fixture.salon.pk)
+        self.assertEqual(response.status_code, 200)
+        return response
+
+    def count_queries(self, view_class):
+        with CaptureQueriesContext(connection) as queries:
+            self.render(view_class)
+        return len(queries)
+
+    def test_lists_run_constant_queries(self):
+        few = {view_class: self.count_queries(view_class) for view_class in LIST_VIEWS}
+        add_rows(self.fixture, self.rows)
+        for view_class in LIST_VIEWS:
+            with self.subTest(view_class.__name__), self.assertNumQueries(few[view_class]):
+                self.render(view_class)
+
+    def test_budgets_catch_an_n_plus_one(self):
+        view_class = type('ShaveListWithoutJoins', (ShaveListView,), {'select_related': ()})
+        add_rows(self.fixture, 5)
+        with self.assertRaises(QueryBudgetExceeded):
+            self.render(view_class)
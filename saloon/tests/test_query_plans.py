@@ -0,0 +1,29 @@
+from decimal import Decimal
+
+from django.test import TestCase
+
+from saloon.management.commands.check_query_plans import hot_queries, scanned_tables, seed
+from saloon.models import Shave
+
+
+class QueryPlanTests(TestCase):
+    """
+    The hot service queries must reach the large tables through an index. A smaller history than the
+    check_query_plans command seeds, still large enough for the planner to prefer the indexes after ANALYZE.
+    """
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.fixtures = seed(salons=4, shaves=500)
+
+    def test_hot_queries_use_indexes(self):
+        for name, check in hot_queries(self.fixtures):
+            with self.subTest(name):
+                plans, scanned = scanned_tables(check)
+                self.assertTrue(plans, "no SELECT recorded")
+                self.assertEqual(scanned, [], "\n\n".join(f"{sql}\n{plan}" for sql, plan in plans))
+
+    def test_full_scan_is_detected(self):
+        # amount has no index: the check must see the scan, or the test above proves nothing
+        plans, scanned = scanned_tables(lambda: list(Shave.objects.filter(amount=Decimal('11.00'))))
+        self.assertEqual(scanned, ['saloon_shave'])
@@ -0,0 +1,81 @@
+from datetime import date, datetime, timezone as dt_timezone
+from decimal import Decimal
+from io import StringIO
+from unittest import mock
+from zoneinfo import ZoneInfo
+
+from django.core.exceptions import ValidationError
+from django.core.management import call_command
+from django.test import TestCase
+
+from saloon.management.commands._seed import create_salon_fixture, build_shave
+from saloon.models import RegisterClose
+from saloon.services import CashRegisterService
+
+TOKYO = ZoneInfo('Asia/Tokyo')
+# March 11, 01:00 in Tokyo while it is still March 10 in UTC
+NOW = datetime(2026, 3, 10, 16, 0, tzinfo=dt_timezone.utc)
+
+
+@mock.patch('django.utils.timezone.now', return_value=NOW)
+class RegisterCloseTests(TestCase):
+    def setUp(self):
+        self.fixture = create_salon_fixture('close')
+        self.fixture.salon.timezone = 'Asia/Tokyo'
+        self.fixture.salon.save()
+        self.cash_register = self.fixture.cash_register
+
+    def shave(self, local_time, amount):
+        build_shave(self.fixture, date_shave=local_time.replace(tzinfo=TOKYO), amount=Decimal(amount)).save()
+
+    def closed_days(self):
+        return list(self.cash_register.closes.order_by('date').values_list('date', 'income'))
+
+    def test_the_current_salon_day_cannot_be_closed(self, now):
+        self.assertEqual(CashRegisterService.get_last_closable_day(self.cash_register), date(2026, 3, 10))
+        with self.assertRaises(ValidationError):
+            CashRegisterService.close_days(self.cash_register, date(2026, 3, 11))
+        self.assertFalse(RegisterClose.objects.exists())
+
+    def test_days_are_closed_in_the_salon_time_zone(self, now):
+        # March 9 at 23:00 in UTC, March 11 at 00:30 in Tokyo
+        self.shave(datetime(2026, 3, 10, 8, 0), '10.00')
+        self.shave(datetime(2026, 3, 11, 0, 30), '100.00')
+        CashRegisterService.close_days(self.cash_register, date(2026, 3, 10))
+        self.assertEqual(self.closed_days(), [(date(2026, 3, 10), Decimal('10.00'))])
+
+    def test_back_dated_entries_drop_the_later_closes(self, now):
+        self.shave(datetime(2026, 3, 8, 12, 0), '10.00')
+        self.shave(datetime(2026, 3, 10, 12, 0), '20.00')
+        CashRegisterService.close_days(self.cash_register, date(2026, 3, 10))
+        self.assertEqual([day for day, income in self.closed_days()], [date(2026, 3, 8), date(2026, 3, 9), date(2026, 3, 10)])
+
+        # Late on March 9 in Tokyo, still March 9 in UTC
+        self.shave(datetime(2026, 3, 9, 23, 30), '5.00')
+        self.assertEqual(self.closed_days(), [(date(2026, 3, 8), Decimal('10.00'))])
+
+        CashRegisterService.close_days(self.cash_register, date(2026, 3, 10))
+        self.assertEqual(self.closed_days(), [
+            (date(2026, 3, 8), Decimal('10.00')), (date(2026, 3, 9), Decimal('5.00')), (date(2026, 3, 10), Decimal('20.00')),
+        ])
+        self.cash_register.refresh_from_db()
+        last_close = self.cash_register.closes.get(date=date(2026, 3, 10))
+        self.assertEqual(last_close.balance_cash, self.cash_register.balance_cash)
+        self.assertEqual(CashRegisterService.get_balance_as_of(self.cash_register, date(2026, 3, 9))['cash_balance'], Decimal('15.00'))
+
+    def test_time_zone_change_drops_the_closes(self, now):
+        self.shave(datetime(2026, 3, 10, 12, 0), '10.00')
+        CashRegisterService.close_days(self.cash_register, date(2026, 3, 10))
+        self.fixture.salon.timezone = 'UTC'
+        self.fixture.salon.save()
+        self.assertFalse(RegisterClose.objects.exists())
+
+    def test_command_closes_up_to_the_salon_yesterday(self, now):
+        self.shave(datetime(2026, 3, 10, 12, 0), '10.00')
+        stderr = StringIO()
+        call_command('close_registers', '--date', '2026-03-11', stdout=StringIO(), stderr=stderr)
+        self.assertIn('is not over yet', stderr.getvalue())
+        self.assertFalse(RegisterClose.objects.exists())
+
+        call_command('close_registers', stdout=StringIO(), stderr=StringIO())
+        self.assertEqual(self.closed_days(), [(date(2026, 3, 10), Decimal('10.00'))])
@@ -0,0 +1,88 @@
+from unittest import mock
+
+from django.contrib.sessions.models import Session
+from django.core.cache import cache
+from django.core.cache.backends.db import DatabaseCache
+from django.core.management import call_command
+from django.http import HttpResponse
+from django.template.response import TemplateResponse
+from django.test import RequestFactory, SimpleTestCase, TestCase, override_settings
+from django.urls import reverse
+
+from saloon.models import Shave
+from saloon.middleware import PRIMARY_PIN_COOKIE, ReplicaRoutingMiddleware
+from saloon.routers import REPLICA, ReplicaRouter, has_written, read_from_replica, replica_reads_enabled
+
+DATABASE_CACHE = {'default': {'BACKEND': 'django.core.cache.backends.db.DatabaseCache', 'LOCATION': 'saloon_cache'}}
+
+
+@mock.patch('saloon.routers.replica_configured', return_value=True)
+class ReplicaRouterTests(SimpleTestCase):
+    router = ReplicaRouter()
+
+    def test_saloon_reads_go_to_the_replica(self, configured):
+        with read_from_replica():
+            self.assertEqual(self.router.db_for_read(Shave), REPLICA)
+        self.assertIsNone(self.router.db_for_read(Shave))
+
+    def test_other_apps_are_not_routed(self, configured):
+        cache_model = DatabaseCache('saloon_cache', {}).cache_model_class
+        with read_from_replica():
+            for model in (Session, cache_model):
+                self.assertIsNone(self.router.db_for_read(model))
+                self.assertIsNone(self.router.db_for_write(model))
+            self.assertFalse(has_written())
+
+    def test_saloon_write_is_flagged(self, configured):
+        with read_from_replica():
+            self.assertEqual(self.router.db_for_write(Shave), 'default')
+            self.assertTrue(has_written())
+            self.assertIsNone(self.router.db_for_read(Shave))
+
+
+@override_settings(CACHES=DATABASE_CACHE)
+@mock.patch('saloon.routers.replica_configured', return_value=True)
+class DatabaseCacheRoutingTests(TestCase):
+    def setUp(self):
+        # The test database only has the table of the configured cache, a LocMemCache under DEBUG
+        call_command('createcachetable', verbosity=0)
+
+    def test_cache_write_does_not_pin_the_primary(self, configured):
+        with read_from_replica():
+            cache.set('saloon:test', 1)
+            self.assertEqual(cache.get('saloon:test'), 1)
+            self.assertFalse(has_written())
+
+
+@mock.patch('saloon.middleware.replica_configured', return_value=True)
+@mock.patch('saloon.routers.replica_configured', return_value=True)
+class ReplicaRoutingMiddlewareTests(SimpleTestCase):
+    def handle(self, request):
+        # Stands for the handler: the rest of the middleware chain, the view and the template response
+        self.reads_from_replica = replica_reads_enabled()
+        return TemplateResponse(request, 'base.html')
+
+    def call(self, request):
+        return ReplicaRoutingMiddleware(self.handle)(request)
+
+    def test_replica_views_read_from_the_replica_through_the_handler(self, *configured):
+        response = self.call(RequestFactory().get(reverse('saloon:shave_list', kwargs={'salon_id': 1})))
+        self.assertTrue(self.reads_from_replica)
+        # Left for the handler to render, after the process_template_response of the other middleware
+        self.assertFalse(response.is_rendered)
+
+    def test_other_requests_read_from_the_primary(self, *configured):
+        url = reverse('saloon:shave_list', kwargs={'salon_id': 1})
+        pinned = RequestFactory().get(url)
+        pinned.COOKIES[PRIMARY_PIN_COOKIE] = '1'
+        for request in (RequestFactory().post(url), pinned, RequestFactory().get('/not-a-page/')):
+            self.call(request)
+            self.assertFalse(self.reads_from_replica, request)
+
+    def test_write_pins_the_primary(self, *configured):
+        def handle(request):
+            ReplicaRouter().db_for_write(Shave)
+            return HttpResponse()
+
+        response = ReplicaRoutingMiddleware(handle)(RequestFactory().post(reverse('saloon:shave_list', kwargs={'salon_id': 1})))
+        self.assertIn(PRIMARY_PIN_COOKIE, response.cookies)
@@ -82,6 +82,7 @@ urlpatterns = [
     path('<int:salon_id>/payments/create/', views.PaymentCreateView.as_view(), name='payment_create'),
     path('<int:salon_id>/payments/<int:pk>/update/', views.PaymentUpdateView.as_view(), name='payment_update'),
     path('<int:salon_id>/payments/<int:pk>/delete/', views.PaymentDeleteView.as_view(), name='payment_delete'),
+    path('<int:salon_id>/payroll/', views.PayrollRunCreateView.as_view(), name='payroll_run_create'),
 
     # Transaction URLs
     path('<int:salon_id>/transactions/', views.TransactionListView.as_view(), name='transaction_list'),
@@ -95,5 +96,18 @@ urlpatterns = [
     path('<int:salon_id>/hairstyle_tariff_histories/<int:pk>/update/', views.HairstyleTariffHistoryUpdateView.as_view(), name='hairstyle_tariff_history_update'),
     path('<int:salon_id>/hairstyle_tariff_histories/<int:pk>/delete/', views.HairstyleTariffHistoryDeleteView.as_view(), name='hairstyle_tariff_history_delete'),
 
+    # Export URLs
+    path('<int:salon_id>/shaves/export/', views.ShaveExportView.as_view(), name='shave_export'),
+    path('<int:salon_id>/transactions/export/', views.TransactionExportView.as_view(), name='transaction_export'),
+    path('<int:salon_id>/payments/export/', views.PaymentExportView.as_view(), name='payment_export'),
+    path('<int:salon_id>/purchases/export/', views.ItemPurchaseExportView.as_view(), name='item_purchase_export'),
+    path('<int:salon_id>/used/export/', views.ItemUsedExportView.as_view(), name='item_used_export'),
+
+    # Import URLs
+    path('<int:salon_id>/import/', views.CsvImportView.as_view(), name='csv_import'),
+
+    # Report URLs
+    path('<int:salon_id>/reports/timeseries/', views.TimeseriesReportView.as_view(), name='report_timeseries'),
+
 # Ajoutez des URLs similaires pour CashRegister, PaymentType, Payment, Transaction, HairstyleTariffHistory, et ItemUsed
 ]
\ No newline at end of file
@@ -1,44 +1,161 @@
+import csv
+import io
+import json
+from contextlib import ExitStack
 from decimal import Decimal
-from django.views.generic import ListView, DetailView, CreateView, UpdateView, DeleteView
+from datetime import date, datetime, timedelta
+from django.conf import settings
+from django.db import connections
+from django.views import View
+from django.views.generic import ListView, DetailView, CreateView, UpdateView, DeleteView, FormView
+from django.http import Http404, JsonResponse, HttpResponseBadRequest, StreamingHttpResponse
 from django.contrib.auth.mixins import LoginRequiredMixin
 from django.urls import reverse_lazy
-from django.shortcuts import get_object_or_404, redirect
+from django.shortcuts import redirect
 from django.contrib import messages
-from django.db.models import Sum, Subquery, F, OuterRef, DecimalField
+from django.utils import timezone
+from django.utils.http import urlsafe_base64_encode, urlsafe_base64_decode
+from django.core.exceptions import ValidationError
+from django.db.models import Prefetch, Q, DecimalField, DateTimeField, Value
 from django.db.models.expressions import ExpressionWrapper
-from django.db.models.functions import Coalesce
-from .models import Salon, Barber, Client, Hairstyle, Shave, Item, ItemPurchase, Commission, Currency, CashRegister, PaymentType, Payment, Transaction, HairstyleTariffHistory, ItemUsed
+from django.db.models.functions import Concat, Trim
+from .models import Salon, Barber, Client, Hairstyle, Shave, Item, ItemPurchase, Commission, Currency, CashRegister, PaymentType, Payment, PayrollRun, Transaction, HairstyleTariffHistory, ItemUsed
+from .services import InventoryService, BarberService, PayrollService, ReportService, ImportService, day_start
+from .middleware import get_salon_context
 from .forms import (
     SalonForm, BarberForm, ClientForm, HairstyleForm, ShaveForm,
-    ItemForm, ItemPurchaseForm, CommissionForm, CurrencyForm, CashRegisterForm, PaymentTypeForm, PaymentForm, TransactionForm, HairstyleTariffHistoryForm, ItemUsedForm
+    ItemForm, ItemPurchaseForm, CommissionForm, CurrencyForm, CashRegisterForm, PaymentTypeForm, PaymentForm, PayrollRunForm, CsvImportForm, TransactionForm, HairstyleTariffHistoryForm, ItemUsedForm
 )
 
 class OwnerRequiredMixin:
+    salon_field = 'salon'
+
     def get_queryset(self):
-        return super().get_queryset().filter(salon__owner=self.request.user)
+        return super().get_queryset().filter(**{f'{self.salon_field}__owner': self.request.user})
+
+class ReplicaReadMixin:
+    # GET requests of these views read from the replica when one is configured (see ReplicaRoutingMiddleware)
+    use_replica = True
+
+class KeysetPaginationMixin:
+    # Cursor pages ordered on (keyset_field, id): every page is an index seek from the edge of the previous one,
+    # so page 500 costs what page 1 does
+    keyset_field = None
+    keyset_descending = True
+    page_size = 50
+
+    def encode_cursor(self, obj):
+        value = getattr(obj, self.keyset_field)
+        return urlsafe_base64_encode(json.dumps([value.isoformat() if hasattr(value, 'isoformat') else value, obj.pk]).encode())
+
+    def decode_cursor(self, cursor):
+        try:
+            value, pk = json.loads(urlsafe_base64_decode(cursor))
+            return self.model._meta.get_field(self.keyset_field).to_python(value), int(pk)
+        except (ValueError, TypeError, ValidationError):
+            raise Http404("Invalid page cursor.")
+
+    def paginate_keyset(self, queryset):
+        # ?after= walks towards the end of the list, ?before= back towards its start
+        field = self.keyset_field
+        after, before = self.request.GET.get('after'), self.request.GET.get('before')
+        forward = not before
+        cursor = self.decode_cursor(before or after) if (before or after) else None
+        descending = self.keyset_descending == forward
+        lookup = 'lt' if descending else 'gt'
+        if cursor:
+            value, pk = cursor
+            queryset = queryset.filter(
+                Q(**{f'{field}__{lookup}e': value}) & (Q(**{f'{field}__{lookup}': value}) | Q(**{f'pk__{lookup}': pk}))
+            )
+        order = '-' if descending else ''
+        rows = list(queryset.order_by(f'{order}{field}', f'{order}pk')[:self.page_size + 1])
+        has_more = len(rows) > self.page_size
+        rows = rows[:self.page_size]
+        if not forward:
+            rows.reverse()
+        has_next = has_more if forward else True
+        has_previous = has_more if not forward else cursor is not None
+        return rows, {
+            'next_cursor': self.encode_cursor(rows[-1]) if rows and has_next else None,
+            'previous_cursor': self.encode_cursor(rows[0]) if rows and has_previous else None,
+        }
+
+    def get_context_data(self, **kwargs):
+        rows, cursors = self.paginate_keyset(self.object_list)
+        return super().get_context_data(object_list=rows, **cursors, **kwargs)
 
 class SalonOwnerRequiredMixin:
     def dispatch(self, request, *args, **kwargs):
-        if not Salon.objects.filter(owner=request.user).exists():
+        if not get_salon_context(request).salon_ids:
             messages.error(request, "Vous devez d'abord créer un salon.")
             return redirect('salon_create')
         return super().dispatch(request, *args, **kwargs)
 
+class QueryBudgetExceeded(Exception):
+    pass
+
+class QueryBudgetMixin:
+    # Most queries a GET may run, template included, however many rows it shows. Checked when
+    # SALOON_ENFORCE_QUERY_BUDGETS is on (DEBUG by default) so that an N+1 fails instead of slowing down
+    max_queries = None
+
+    def get(self, request, *args, **kwargs):
+        if self.max_queries is None or not getattr(settings, 'SALOON_ENFORCE_QUERY_BUDGETS', settings.DEBUG):
+            return super().get(request, *args, **kwargs)
+        queries = []
+
+        def record(execute, sql, params, many, context):
+            queries.append(sql)
+            return execute(sql, params, many, context)
+
+        with ExitStack() as stack:
+            for connection in connections.all():
+                stack.enter_context(connection.execute_wrapper(record))
+            response = super().get(request, *args, **kwargs)
+            response.render()
+        if len(queries) > self.max_queries:
+            raise QueryBudgetExceeded(
+                f"{type(self).__name__} ran {len(queries)} queries for a budget of {self.max_queries}:\n" + "\n".join(queries)
+            )
+        return response
+
+class SalonScopedListView(LoginRequiredMixin, SalonOwnerRequiredMixin, ReplicaReadMixin, QueryBudgetMixin, ListView):
+    # Rows of one salon of the user. select_related/prefetch_related list every relation the template follows,
+    # so that they are loaded with the page rather than once per row
+    salon_field = 'salon'
+    select_related = ()
+    prefetch_related = ()
+    # The page and the salon menu of the base template
+    max_queries = 2
+
+    def get_queryset(self):
+        queryset = self.model._default_manager.filter(**{
+            f'{self.salon_field}__id': self.kwargs.get('salon_id'),
+            f'{self.salon_field}__owner': self.request.user,
+        })
+        if self.select_related:
+            queryset = queryset.select_related(*self.select_related)
+        if self.prefetch_related:
+            queryset = queryset.prefetch_related(*self.prefetch_related)
+        return queryset
+
 # Salon views
-class SalonListView(LoginRequiredMixin, ListView):
+class SalonListView(LoginRequiredMixin, ReplicaReadMixin, QueryBudgetMixin, ListView):
     model = Salon
     template_name = 'saloon/salon_list.html'
     context_object_name = 'salons'
+    max_queries = 2
 
     def get_queryset(self):
-        return Salon.objects.filter(owner=self.request.user)
+        return get_salon_context(self.request).salons.select_related('owner')
 
 class SalonDetailView(LoginRequiredMixin, DetailView):
     model = Salon
     template_name = 'saloon/salon_detail.html'
 
     def get_queryset(self):
-        return Salon.objects.filter(owner=self.request.user)
+        return get_salon_context(self.request).salons
 
 class SalonCreateView(LoginRequiredMixin, CreateView):
     model = Salon
@@ -67,7 +184,7 @@ class SalonUpdateView(LoginRequiredMixin, UpdateView):
         return context
 
     def get_queryset(self):
-        return Salon.objects.filter(owner=self.request.user)
+        return get_salon_context(self.request).salons
 
 class SalonDeleteView(LoginRequiredMixin, DeleteView):
     model = Salon
@@ -75,17 +192,25 @@ class SalonDeleteView(LoginRequiredMixin, DeleteView):
     success_url = reverse_lazy('saloon:salon_list')
 
     def get_queryset(self):
-        return Salon.objects.filter(owner=self.request.user)
+        return get_salon_context(self.request).salons
 
 # Barber views
-class BarberListView(LoginRequiredMixin, SalonOwnerRequiredMixin, OwnerRequiredMixin, ListView):
+class BarberListView(SalonScopedListView):
     model = Barber
     template_name = 'saloon/barber_list.html'
     context_object_name = 'barbers'
+    select_related = ('user',)
+    # Barbers, then the accrued and paid totals of calculate_balances
+    max_queries = 4
 
     def get_queryset(self):
-        salon_id = self.kwargs.get('salon_id')
-        return Barber.objects.filter(salon__id=salon_id, salon__owner=self.request.user)
+        barbers = super().get_queryset()
+
+        balances = BarberService.calculate_balances(barbers)
+        for barber in barbers:
+            barber.commission_balance = balances[barber.pk]
+
+        return barbers
 
 class BarberCreateView(LoginRequiredMixin, SalonOwnerRequiredMixin, CreateView):
     model = Barber
@@ -98,7 +223,7 @@ class BarberCreateView(LoginRequiredMixin, SalonOwnerRequiredMixin, CreateView):
         return context
 
     def form_valid(self, form):
-        salon = get_object_or_404(Salon, id=self.kwargs.get('salon_id'), owner=self.request.user)
+        salon = get_salon_context(self.request).get_salon(self.kwargs.get('salon_id'))
         form.instance.salon = salon
         return super().form_valid(form)
 
@@ -126,14 +251,13 @@ class BarberDeleteView(LoginRequiredMixin, SalonOwnerRequiredMixin, OwnerRequire
         return reverse_lazy('saloon:barber_list', kwargs={'salon_id': self.object.salon.id})
 
 # Client views
-class ClientListView(LoginRequiredMixin, SalonOwnerRequiredMixin, OwnerRequiredMixin, ListView):
+class ClientListView(KeysetPaginationMixin, SalonScopedListView):
     model = Client
     template_name = 'saloon/client_list.html'
     context_object_name = 'clients'
-
-    def get_queryset(self):
-        salon_id = self.kwargs.get('salon_id')
-        return Client.objects.filter(salon__id=salon_id, salon__owner=self.request.user)
+    keyset_field = 'name'
+    keyset_descending = False
+    select_related = ('user',)
 
 class ClientCreateView(LoginRequiredMixin, SalonOwnerRequiredMixin, CreateView):
     model = Client
@@ -146,7 +270,7 @@ class ClientCreateView(LoginRequiredMixin, SalonOwnerRequiredMixin, CreateView):
         return context
 
     def form_valid(self, form):
-        salon = get_object_or_404(Salon, id=self.kwargs.get('salon_id'), owner=self.request.user)
+        salon = get_salon_context(self.request).get_salon(self.kwargs.get('salon_id'))
         form.instance.salon = salon
         return super().form_valid(form)
 
@@ -174,14 +298,11 @@ class ClientDeleteView(LoginRequiredMixin, SalonOwnerRequiredMixin, OwnerRequire
         return reverse_lazy('saloon:client_list', kwargs={'salon_id': self.object.salon.id})
 
 # Hairstyle views
-class HairstyleListView(LoginRequiredMixin, SalonOwnerRequiredMixin, OwnerRequiredMixin, ListView):
+class HairstyleListView(SalonScopedListView):
     model = Hairstyle
     template_name = 'saloon/hairstyle_list.html'
     context_object_name = 'hairstyles'
-
-    def get_queryset(self):
-        salon_id = self.kwargs.get('salon_id')
-        return Hairstyle.objects.filter(salon__id=salon_id, salon__owner=self.request.user)
+    select_related = ('currency',)
 
 class HairstyleCreateView(LoginRequiredMixin, SalonOwnerRequiredMixin, CreateView):
     model = Hairstyle
@@ -194,7 +315,7 @@ class HairstyleCreateView(LoginRequiredMixin, SalonOwnerRequiredMixin, CreateVie
         return context
 
     def form_valid(self, form):
-        salon = get_object_or_404(Salon, id=self.kwargs.get('salon_id'), owner=self.request.user)
+        salon = get_salon_context(self.request).get_salon(self.kwargs.get('salon_id'))
         form.instance.salon = salon
         return super().form_valid(form)
 
@@ -222,14 +343,12 @@ class HairstyleDeleteView(LoginRequiredMixin, SalonOwnerRequiredMixin, OwnerRequ
         return reverse_lazy('saloon:hairstyle_list', kwargs={'salon_id': self.object.salon.id})
 
 # Shave views
-class ShaveListView(LoginRequiredMixin, SalonOwnerRequiredMixin, OwnerRequiredMixin, ListView):
+class ShaveListView(KeysetPaginationMixin, SalonScopedListView):
     model = Shave
     template_name = 'saloon/shave_list.html'
     context_object_name = 'shaves'
-
-    def get_queryset(self):
-        salon_id = self.kwargs.get('salon_id')
-        return Shave.objects.filter(salon__id=salon_id, salon__owner=self.request.user)
+    keyset_field = 'date_shave'
+    select_related = ('barber__user', 'hairstyle', 'currency')
 
 class ShaveCreateView(LoginRequiredMixin, SalonOwnerRequiredMixin, CreateView):
     model = Shave
@@ -242,7 +361,7 @@ class ShaveCreateView(LoginRequiredMixin, SalonOwnerRequiredMixin, CreateView):
         return context
 
     def form_valid(self, form):
-        salon = get_object_or_404(Salon, id=self.kwargs.get('salon_id'), owner=self.request.user)
+        salon = get_salon_context(self.request).get_salon(self.kwargs.get('salon_id'))
         form.instance.salon = salon
         return super().form_valid(form)
 
@@ -270,31 +389,17 @@ class ShaveDeleteView(LoginRequiredMixin, SalonOwnerRequiredMixin, OwnerRequired
         return reverse_lazy('saloon:shave_list', kwargs={'salon_id': self.object.salon.id})
 
 # Item views
-class ItemListView(LoginRequiredMixin, SalonOwnerRequiredMixin, OwnerRequiredMixin, ListView):
+class ItemListView(SalonScopedListView):
     model = Item
     template_name = 'saloon/item_list.html'
     context_object_name = 'items'
+    select_related = ('salon', 'currency')
+    prefetch_related = (Prefetch('item_purpose', queryset=Hairstyle.objects.select_related('salon')),)
+    # Items, their hairstyles and the salon of the menu
+    max_queries = 3
 
     def get_queryset(self):
-        salon_id = self.kwargs.get('salon_id')
-        
-        items = Item.objects.filter(salon__id=salon_id, salon__owner=self.request.user).annotate(
-            total_used=Coalesce(Sum('uses__quantity'), 0),
-            total_purchased=Coalesce(Sum('purchases__quantity'), 0),
-            total_purchase_amount=Coalesce(Sum('purchases__purchase_price_in_default_currency'), Decimal('0')),
-            remaining_quantity=ExpressionWrapper(
-                F('total_purchased') - F('total_used'),
-                output_field=DecimalField(max_digits=10, decimal_places=2)
-            )
-        ).select_related('salon', 'currency')
-
-        for item in items:
-            item_used_queryset = ItemUsed.objects.filter(item=item)
-            item.total_used_amount = sum(use.get_amount_in_default_currency() for use in item_used_queryset)
-            item.remaining_amount = item.total_purchase_amount - Decimal(str(item.total_used_amount))
-            item.avg_remaining_price = item.remaining_amount / item.remaining_quantity if item.remaining_quantity else None
-
-        return items
+        return InventoryService.annotate_valuation(super().get_queryset())
 
 class ItemCreateView(LoginRequiredMixin, SalonOwnerRequiredMixin, CreateView):
     model = Item
@@ -307,7 +412,7 @@ class ItemCreateView(LoginRequiredMixin, SalonOwnerRequiredMixin, CreateView):
         return context
 
     def form_valid(self, form):
-        salon = get_object_or_404(Salon, id=self.kwargs.get('salon_id'), owner=self.request.user)
+        salon = get_salon_context(self.request).get_salon(self.kwargs.get('salon_id'))
         form.instance.salon = salon
         return super().form_valid(form)
 
@@ -335,14 +440,12 @@ class ItemDeleteView(LoginRequiredMixin, SalonOwnerRequiredMixin, OwnerRequiredM
         return reverse_lazy('saloon:item_list', kwargs={'salon_id': self.object.salon.id})
 
 # ItemPurchase views
-class ItemPurchaseListView(LoginRequiredMixin, SalonOwnerRequiredMixin, OwnerRequiredMixin, ListView):
+class ItemPurchaseListView(KeysetPaginationMixin, SalonScopedListView):
     model = ItemPurchase
     template_name = 'saloon/item_purchase_list.html'
     context_object_name = 'purchases'
-
-    def get_queryset(self):
-        salon_id = self.kwargs.get('salon_id')
-        return ItemPurchase.objects.filter(salon__id=salon_id, salon__owner=self.request.user)
+    keyset_field = 'purchase_date'
+    select_related = ('item', 'currency')
 
 class ItemPurchaseCreateView(LoginRequiredMixin, SalonOwnerRequiredMixin, CreateView):
     model = ItemPurchase
@@ -355,7 +458,7 @@ class ItemPurchaseCreateView(LoginRequiredMixin, SalonOwnerRequiredMixin, Create
         return context
 
     def form_valid(self, form):
-        salon = get_object_or_404(Salon, id=self.kwargs.get('salon_id'), owner=self.request.user)
+        salon = get_salon_context(self.request).get_salon(self.kwargs.get('salon_id'))
         form.instance.salon = salon
         return super().form_valid(form)
 
@@ -383,14 +486,12 @@ class ItemPurchaseDeleteView(LoginRequiredMixin, SalonOwnerRequiredMixin, OwnerR
         return reverse_lazy('saloon:item_purchase_list', kwargs={'salon_id': self.object.salon.id})
 
 # ItemUsed views
-class ItemUsedListView(LoginRequiredMixin, SalonOwnerRequiredMixin, OwnerRequiredMixin, ListView):
+class ItemUsedListView(KeysetPaginationMixin, SalonScopedListView):
     model = ItemUsed
     template_name = 'saloon/item_used_list.html'
     context_object_name = 'uses'
-
-    def get_queryset(self):
-        salon_id = self.kwargs.get('salon_id')
-        return ItemUsed.objects.filter(salon__id=salon_id, salon__owner=self.request.user)
+    keyset_field = 'used_date'
+    select_related = ('item', 'barber__user', 'shave__hairstyle')
 
 class ItemUsedCreateView(LoginRequiredMixin, SalonOwnerRequiredMixin, CreateView):
     model = ItemUsed
@@ -403,7 +504,7 @@ class ItemUsedCreateView(LoginRequiredMixin, SalonOwnerRequiredMixin, CreateView
         return context
 
     def form_valid(self, form):
-        salon = get_object_or_404(Salon, id=self.kwargs.get('salon_id'), owner=self.request.user)
+        salon = get_salon_context(self.request).get_salon(self.kwargs.get('salon_id'))
         form.instance.salon = salon
         return super().form_valid(form)
 
@@ -431,14 +532,12 @@ class ItemUsedDeleteView(LoginRequiredMixin, SalonOwnerRequiredMixin, OwnerRequi
         return reverse_lazy('saloon:item_used_list', kwargs={'salon_id': self.object.salon.id})
 
 # Commission views
-class CommissionListView(LoginRequiredMixin, SalonOwnerRequiredMixin, OwnerRequiredMixin, ListView):
+class CommissionListView(SalonScopedListView):
     model = Commission
     template_name = 'saloon/commission_list.html'
     context_object_name = 'commissions'
-
-    def get_queryset(self):
-        salon_id = self.kwargs.get('salon_id')
-        return Commission.objects.filter(barber__salon__id=salon_id, barber__salon__owner=self.request.user)
+    salon_field = 'barber__salon'
+    select_related = ('barber__user',)
 
 class CommissionCreateView(LoginRequiredMixin, SalonOwnerRequiredMixin, CreateView):
     model = Commission
@@ -451,7 +550,7 @@ class CommissionCreateView(LoginRequiredMixin, SalonOwnerRequiredMixin, CreateVi
         return context
 
     def form_valid(self, form):
-        salon = get_object_or_404(Salon, id=self.kwargs.get('salon_id'), owner=self.request.user)
+        salon = get_salon_context(self.request).get_salon(self.kwargs.get('salon_id'))
         form.instance.barber.salon = salon
         return super().form_valid(form)
 
@@ -462,6 +561,7 @@ class CommissionUpdateView(LoginRequiredMixin, SalonOwnerRequiredMixin, OwnerReq
     model = Commission
     form_class = CommissionForm
     template_name = 'saloon/generic_form.html'
+    salon_field = 'barber__salon'
 
     def get_context_data(self, **kwargs):
         context = super().get_context_data(**kwargs)
@@ -474,20 +574,17 @@ class CommissionUpdateView(LoginRequiredMixin, SalonOwnerRequiredMixin, OwnerReq
 class CommissionDeleteView(LoginRequiredMixin, SalonOwnerRequiredMixin, OwnerRequiredMixin, DeleteView):
     model = Commission
     template_name = 'saloon/generic_confirm_delete.html'
+    salon_field = 'barber__salon'
 
     def get_success_url(self):
         return reverse_lazy('saloon:commission_list', kwargs={'salon_id': self.kwargs.get('salon_id')})
 
 # Currency views
-class CurrencyListView(LoginRequiredMixin, SalonOwnerRequiredMixin, OwnerRequiredMixin, ListView):
+class CurrencyListView(SalonScopedListView):
     model = Currency
     template_name = 'saloon/currency_list.html'
     context_object_name = 'currencies'
 
-    def get_queryset(self):
-        salon_id = self.kwargs.get('salon_id')
-        return Currency.objects.filter(salon__id=salon_id, salon__owner=self.request.user)
-
 class CurrencyCreateView(LoginRequiredMixin, SalonOwnerRequiredMixin, CreateView):
     model = Currency
     form_class = CurrencyForm
@@ -499,7 +596,7 @@ class CurrencyCreateView(LoginRequiredMixin, SalonOwnerRequiredMixin, CreateView
         return context
 
     def form_valid(self, form):
-        salon = get_object_or_404(Salon, id=self.kwargs.get('salon_id'), owner=self.request.user)
+        salon = get_salon_context(self.request).get_salon(self.kwargs.get('salon_id'))
         form.instance.salon = salon
         return super().form_valid(form)
 
@@ -529,15 +626,11 @@ class CurrencyDeleteView(LoginRequiredMixin, SalonOwnerRequiredMixin, OwnerRequi
 # Ajoutez des vues similaires pour CashRegister, PaymentType, Payment, Transaction, HairstyleTariffHistory, et ItemUsed
 
 # ChashRegister views
-class CashRegisterListView(LoginRequiredMixin, SalonOwnerRequiredMixin, OwnerRequiredMixin, ListView):
+class CashRegisterListView(SalonScopedListView):
     model = CashRegister
     template_name = 'saloon/cash_register_list.html'
     context_object_name = 'cash_registers'
 
-    def get_queryset(self):
-        salon_id = self.kwargs.get('salon_id')
-        return CashRegister.objects.filter(salon__id=salon_id, salon__owner=self.request.user)
-
 class CashRegisterCreateView(LoginRequiredMixin, SalonOwnerRequiredMixin, CreateView):
     model = CashRegister
     form_class = CashRegisterForm
@@ -549,7 +642,7 @@ class CashRegisterCreateView(LoginRequiredMixin, SalonOwnerRequiredMixin, Create
         return context
 
     def form_valid(self, form):
-        salon = get_object_or_404(Salon, id=self.kwargs.get('salon_id'), owner=self.request.user)
+        salon = get_salon_context(self.request).get_salon(self.kwargs.get('salon_id'))
         form.instance.salon = salon
         return super().form_valid(form)
 
@@ -577,15 +670,11 @@ class CashRegisterDeleteView(LoginRequiredMixin, SalonOwnerRequiredMixin, OwnerR
         return reverse_lazy('saloon:cash_register_list', kwargs={'salon_id': self.kwargs.get('salon_id')})
 
 # PaymentType views
-class PaymentTypeListView(LoginRequiredMixin, SalonOwnerRequiredMixin, OwnerRequiredMixin, ListView):
+class PaymentTypeListView(SalonScopedListView):
     model = PaymentType
     template_name = 'saloon/payment_type_list.html'
     context_object_name = 'payment_types'
 
-    def get_queryset(self):
-        salon_id = self.kwargs.get('salon_id')
-        return PaymentType.objects.filter(salon__id=salon_id, salon__owner=self.request.user)
-
 class PaymentTypeCreateView(LoginRequiredMixin, SalonOwnerRequiredMixin, CreateView):
     model = PaymentType
     form_class = PaymentTypeForm
@@ -597,7 +686,7 @@ class PaymentTypeCreateView(LoginRequiredMixin, SalonOwnerRequiredMixin, CreateV
         return context
 
     def form_valid(self, form):
-        salon = get_object_or_404(Salon, id=self.kwargs.get('salon_id'), owner=self.request.user)
+        salon = get_salon_context(self.request).get_salon(self.kwargs.get('salon_id'))
         form.instance.salon = salon
         return super().form_valid(form)
 
@@ -625,14 +714,12 @@ class PaymentTypeDeleteView(LoginRequiredMixin, SalonOwnerRequiredMixin, OwnerRe
         return reverse_lazy('saloon:payment_type_list', kwargs={'salon_id': self.kwargs.get('salon_id')})
 
 # Payment views
-class PaymentListView(LoginRequiredMixin, SalonOwnerRequiredMixin, OwnerRequiredMixin, ListView):
+class PaymentListView(KeysetPaginationMixin, SalonScopedListView):
     model = Payment
     template_name = 'saloon/payment_list.html'
     context_object_name = 'payments'
-
-    def get_queryset(self):
-        salon_id = self.kwargs.get('salon_id')
-        return Payment.objects.filter(salon__id=salon_id, salon__owner=self.request.user)
+    keyset_field = 'date_payment'
+    select_related = ('barber__user', 'currency', 'payment_type', 'cashregister')
 
 class PaymentCreateView(LoginRequiredMixin, SalonOwnerRequiredMixin, CreateView):
     model = Payment
@@ -645,7 +732,7 @@ class PaymentCreateView(LoginRequiredMixin, SalonOwnerRequiredMixin, CreateView)
         return context
 
     def form_valid(self, form):
-        salon = get_object_or_404(Salon, id=self.kwargs.get('salon_id'), owner=self.request.user)
+        salon = get_salon_context(self.request).get_salon(self.kwargs.get('salon_id'))
         form.instance.salon = salon
         return super().form_valid(form)
 
@@ -672,15 +759,43 @@ class PaymentDeleteView(LoginRequiredMixin, SalonOwnerRequiredMixin, OwnerRequir
     def get_success_url(self):
         return reverse_lazy('saloon:payment_list', kwargs={'salon_id': self.kwargs.get('salon_id')})
 
+class PayrollRunCreateView(LoginRequiredMixin, SalonOwnerRequiredMixin, CreateView):
+    # First POST previews the amounts, the confirmed POST pays them
+    model = PayrollRun
+    form_class = PayrollRunForm
+    template_name = 'saloon/payroll_run_form.html'
+
+    def get_salon(self):
+        return get_salon_context(self.request).get_salon(self.kwargs.get('salon_id'))
+
+    def get_form_kwargs(self):
+        kwargs = super().get_form_kwargs()
+        salon = self.get_salon()
+        kwargs['salon'] = salon
+        kwargs['instance'] = PayrollRun(salon=salon, created_by=self.request.user)
+        return kwargs
+
+    def form_valid(self, form):
+        if 'confirm' not in self.request.POST:
+            rows = PayrollService.preview(form.instance.salon, form.instance.start_date, form.instance.end_date)
+            return self.render_to_response(self.get_context_data(
+                form=form, rows=rows, total=sum((row['amount'] for row in rows if row['amount'] > 0), Decimal('0.00'))
+            ))
+        self.object = form.instance
+        payments = PayrollService.run(self.object)
+        messages.success(self.request, f"{len(payments)} barbers were paid.")
+        return redirect(self.get_success_url())
+
+    def get_success_url(self):
+        return reverse_lazy('saloon:payment_list', kwargs={'salon_id': self.kwargs.get('salon_id')})
+
 # Transaction views
-class TransactionListView(LoginRequiredMixin, SalonOwnerRequiredMixin, OwnerRequiredMixin, ListView):
-    model = Transaction 
+class TransactionListView(KeysetPaginationMixin, SalonScopedListView):
+    model = Transaction
     template_name = 'saloon/transaction_list.html'
     context_object_name = 'transactions'
-
-    def get_queryset(self):
-        salon_id = self.kwargs.get('salon_id')
-        return Transaction.objects.filter(salon__id=salon_id, salon__owner=self.request.user)
+    keyset_field = 'date_trans'
+    select_related = ('currency', 'cashregister')
 
 class TransactionCreateView(LoginRequiredMixin, SalonOwnerRequiredMixin, CreateView):
     model = Transaction
@@ -693,7 +808,7 @@ class TransactionCreateView(LoginRequiredMixin, SalonOwnerRequiredMixin, CreateV
         return context
 
     def form_valid(self, form):
-        salon = get_object_or_404(Salon, id=self.kwargs.get('salon_id'), owner=self.request.user)
+        salon = get_salon_context(self.request).get_salon(self.kwargs.get('salon_id'))
         form.instance.salon = salon
         return super().form_valid(form)
 
@@ -721,14 +836,12 @@ class TransactionDeleteView(LoginRequiredMixin, SalonOwnerRequiredMixin, OwnerRe
         return reverse_lazy('saloon:transaction_list', kwargs={'salon_id': self.kwargs.get('salon_id')})
 
 # HairstyleTariffHistory views
-class HairstyleTariffHistoryListView(LoginRequiredMixin, SalonOwnerRequiredMixin, OwnerRequiredMixin, ListView):
+class HairstyleTariffHistoryListView(SalonScopedListView):
     model = HairstyleTariffHistory
     template_name = 'saloon/hairstyle_tariff_history_list.html'
     context_object_name = 'tariff_history'
-
-    def get_queryset(self):
-        salon_id = self.kwargs.get('salon_id')
-        return HairstyleTariffHistory.objects.filter(hairstyle__salon__id=salon_id, hairstyle__salon__owner=self.request.user)
+    salon_field = 'hairstyle__salon'
+    select_related = ('hairstyle__currency',)
 
 class HairstyleTariffHistoryCreateView(LoginRequiredMixin, SalonOwnerRequiredMixin, CreateView):
     model = HairstyleTariffHistory
@@ -741,7 +854,7 @@ class HairstyleTariffHistoryCreateView(LoginRequiredMixin, SalonOwnerRequiredMix
         return context
 
     def form_valid(self, form):
-        salon = get_object_or_404(Salon, id=self.kwargs.get('salon_id'), owner=self.request.user)
+        salon = get_salon_context(self.request).get_salon(self.kwargs.get('salon_id'))
         form.instance.hairstyle.salon = salon
         return super().form_valid(form)
 
@@ -752,6 +865,7 @@ class HairstyleTariffHistoryUpdateView(LoginRequiredMixin, SalonOwnerRequiredMix
     model = HairstyleTariffHistory
     form_class = HairstyleTariffHistoryForm
     template_name = 'saloon/generic_form.html'
+    salon_field = 'hairstyle__salon'
 
     def get_context_data(self, **kwargs):
         context = super().get_context_data(**kwargs)
@@ -764,7 +878,200 @@ class HairstyleTariffHistoryUpdateView(LoginRequiredMixin, SalonOwnerRequiredMix
 class HairstyleTariffHistoryDeleteView(LoginRequiredMixin, SalonOwnerRequiredMixin, OwnerRequiredMixin, DeleteView):
     model = HairstyleTariffHistory
     template_name = 'saloon/generic_confirm_delete.html'
+    salon_field = 'hairstyle__salon'
 
     def get_success_url(self):
         return reverse_lazy('saloon:hairstyle_tariff_history_list', kwargs={'salon_id': self.kwargs.get('salon_id')})
 
+# Report views
+class TimeseriesReportView(LoginRequiredMixin, ReplicaReadMixin, View):
+    MAX_DAYS = 366 * 5
+
+    def get(self, request, salon_id):
+        salon = get_salon_context(request).get_salon(salon_id)
+        metric = request.GET.get('metric', 'revenue')
+        bucket = request.GET.get('bucket', 'day')
+        try:
+            end_date = date.fromisoformat(request.GET['end']) if request.GET.get('end') else timezone.localtime(timezone=salon.tzinfo).date()
+            start_date = date.fromisoformat(request.GET['start']) if request.GET.get('start') else end_date - timedelta(days=29)
+            if (end_date - start_date).days > self.MAX_DAYS:
+                raise ValueError(f"The range cannot exceed {self.MAX_DAYS} days")
+            series = ReportService.timeseries(salon, metric, start_date, end_date, bucket)
+        except ValueError as e:
+            return JsonResponse({'error': str(e)}, status=400)
+
+        return JsonResponse({
+            'salon': salon.id,
+            'metric': metric,
+            'bucket': bucket,
+            'timezone': salon.timezone,
+            'start': start_date,
+            'end': end_date,
+            'series': series,
+        })
+
+# Export views
+# Spreadsheets run a cell starting with one of these as a formula: client and item names are typed by users
+CSV_FORMULA_PREFIXES = ('=', '+', '-', '@', '\t', '\r')
+
+def csv_cell(value, tzinfo):
+    if isinstance(value, datetime):
+        return timezone.localtime(value, tzinfo).strftime('%Y-%m-%d %H:%M:%S')
+    if isinstance(value, str) and value.startswith(CSV_FORMULA_PREFIXES):
+        return f"'{value}"
+    return value
+
+class Echo:
+    # csv.writer target that hands each line back instead of buffering it
+    def write(self, value):
+        return value
+
+def barber_name(prefix='barber'):
+    return Trim(Concat(f'{prefix}__user__first_name', Value(' '), f'{prefix}__user__last_name'))
+
+class CsvExportView(LoginRequiredMixin, ReplicaReadMixin, View):
+    # Streams the rows of a salon as CSV: values_list over the joined columns, read in chunks
+    model = None
+    date_field = None
+    columns = ()
+    chunk_size = 2000
+
+    def get_queryset(self, salon, start_date, end_date):
+        queryset = self.model.objects.filter(salon=salon)
+        is_datetime = isinstance(self.model._meta.get_field(self.date_field), DateTimeField)
+        # Datetimes are filtered on the business days of the salon
+        if start_date:
+            queryset = queryset.filter(**{f'{self.date_field}__gte': day_start(start_date, salon.tzinfo) if is_datetime else start_date})
+        if end_date and is_datetime:
+            queryset = queryset.filter(**{f'{self.date_field}__lt': day_start(end_date + timedelta(days=1), salon.tzinfo)})
+        elif end_date:
+            queryset = queryset.filter(**{f'{self.date_field}__lte': end_date})
+        annotations = {f'column_{i}': value for i, (header, value) in enumerate(self.columns) if not isinstance(value, str)}
+        fields = [value if isinstance(value, str) else f'column_{i}' for i, (header, value) in enumerate(self.columns)]
+        return queryset.annotate(**annotations).order_by(self.date_field, 'pk').values_list(*fields)
+
+    def get_rows(self, queryset, tzinfo):
+        writer = csv.writer(Echo())
+        yield writer.writerow([header for header, value in self.columns])
+        for row in queryset.iterator(chunk_size=self.chunk_size):
+            yield writer.writerow([csv_cell(value, tzinfo) for value in row])
+
+    def get(self, request, salon_id):
+        salon = get_salon_context(request).get_salon(salon_id)
+        try:
+            start_date = date.fromisoformat(request.GET['start']) if request.GET.get('start') else None
+            end_date = date.fromisoformat(request.GET['end']) if request.GET.get('end') else None
+        except ValueError as e:
+            return HttpResponseBadRequest(str(e))
+
+        response = StreamingHttpResponse(
+            self.get_rows(self.get_queryset(salon, start_date, end_date), salon.tzinfo), content_type='text/csv'
+        )
+        period = '_'.join(str(day) for day in (start_date, end_date) if day)
+        filename = '_'.join(part for part in (self.model._meta.model_name, str(salon.id), period) if part)
+        response['Content-Disposition'] = f'attachment; filename="{filename}.csv"'
+        return response
+
+class ShaveExportView(CsvExportView):
+    model = Shave
+    date_field = 'date_shave'
+    columns = (
+        ('id', 'pk'),
+        ('date', 'date_shave'),
+        ('barber', barber_name()),
+        ('client', 'client__name'),
+        ('hairstyle', 'hairstyle__name'),
+        ('status', 'status'),
+        ('amount', 'amount'),
+        ('currency', 'currency__code'),
+        ('exchange_rate', 'exchange_rate'),
+        ('amount_in_default_currency', 'amount_in_default_currency'),
+        ('cash_register', 'cashregister__name'),
+    )
+
+class TransactionExportView(CsvExportView):
+    model = Transaction
+    date_field = 'date_trans'
+    columns = (
+        ('id', 'pk'),
+        ('date', 'date_trans'),
+        ('name', 'trans_name'),
+        ('type', 'trans_type'),
+        ('amount', 'amount'),
+        ('currency', 'currency__code'),
+        ('exchange_rate', 'exchange_rate'),
+        ('amount_in_default_currency', 'amount_in_default_currency'),
+        ('cash_register', 'cashregister__name'),
+    )
+
+class PaymentExportView(CsvExportView):
+    model = Payment
+    date_field = 'date_payment'
+    columns = (
+        ('id', 'pk'),
+        ('date', 'date_payment'),
+        ('barber', barber_name()),
+        ('start_date', 'start_date'),
+        ('end_date', 'end_date'),
+        ('payment_type', 'payment_type__name'),
+        ('amount', 'amount'),
+        ('currency', 'currency__code'),
+        ('exchange_rate', 'exchange_rate'),
+        ('amount_in_default_currency', 'amount_in_default_currency'),
+        ('cash_register', 'cashregister__name'),
+        ('payroll_run', 'payroll_run_id'),
+    )
+
+class ItemPurchaseExportView(CsvExportView):
+    model = ItemPurchase
+    date_field = 'purchase_date'
+    columns = (
+        ('id', 'pk'),
+        ('date', 'purchase_date'),
+        ('item', 'item__name'),
+        ('supplier', 'supplier'),
+        ('quantity', 'quantity'),
+        ('purchase_price', 'purchase_price'),
+        ('currency', 'currency__code'),
+        ('exchange_rate', 'exchange_rate'),
+        ('total_purchase_price', 'total_purchase_price'),
+        ('purchase_price_in_default_currency', 'purchase_price_in_default_currency'),
+        ('remaining_quantity', 'remaining_quantity'),
+        ('cash_register', 'cashregister__name'),
+    )
+
+class ItemUsedExportView(CsvExportView):
+    model = ItemUsed
+    date_field = 'used_date'
+    columns = (
+        ('id', 'pk'),
+        ('date', 'used_date'),
+        ('item', 'item__name'),
+        ('barber', barber_name()),
+        ('shave', 'shave_id'),
+        ('quantity', 'quantity'),
+        ('unit_cost', 'unit_cost'),
+        ('cost_in_default_currency', 'cost_in_default_currency'),
+        ('note', 'note'),
+    )
+
+# Import views
+class CsvImportView(LoginRequiredMixin, SalonOwnerRequiredMixin, FormView):
+    form_class = CsvImportForm
+    template_name = 'saloon/import_form.html'
+    max_errors = 200
+
+    def form_valid(self, form):
+        salon = get_salon_context(self.request).get_salon(self.kwargs.get('salon_id'))
+        rows = csv.DictReader(io.TextIOWrapper(form.cleaned_data['file'], encoding='utf-8-sig', newline=''))
+        try:
+            result = ImportService.import_rows(salon, form.cleaned_data['kind'], rows, dry_run=form.cleaned_data['dry_run'])
+        except (ValidationError, UnicodeDecodeError, csv.Error) as e:
+            form.add_error('file', ' '.join(e.messages) if isinstance(e, ValidationError) else str(e))
+            return self.form_invalid(form)
+
+        if result['created']:
+            messages.success(self.request, f"{result['created']} rows imported ({result['rows_per_second']:.0f} rows/s).")
+        return self.render_to_response(self.get_context_data(
+            form=form, result=result, errors=result['errors'][:self.max_errors]
+        ))